@@ -0,0 +1,76 @@
+"""Measure import time and resident memory of an ASGI worker.
+
+Every run imports ``core.asgi`` in a fresh interpreter and reports how long the import took, the worker's
+RSS afterwards and which provider SDKs were loaded. Use ``--providers`` to also import providers the way a
+worker does on their first request.
+
+    python benchmarks/asgi_cold_start.py --runs 5
+    python benchmarks/asgi_cold_start.py --providers openai anthropic gemini
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SDK_MODULES = ['openai', 'anthropic', 'google.genai']
+
+WORKER_SCRIPT = """
+import json, os, sys, time
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+started_at = time.perf_counter()
+import core.asgi  # noqa
+imported_at = time.perf_counter()
+from chat_completion.providers import preload_providers
+preload_providers({providers!r})
+loaded_at = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported_at - started_at) * 1000,
+    'providers_ms': (loaded_at - imported_at) * 1000,
+    'rss_mb': rss_kb() / 1024,
+    'sdks': [name for name in {sdk_modules!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_worker(providers, settings_module):
+    """Import the ASGI app in a new interpreter and return its measurements."""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT_DIR), env.get('PYTHONPATH')]))
+    script = WORKER_SCRIPT.format(providers=providers, sdk_modules=SDK_MODULES)
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--providers', nargs='*', default=[], help='Providers to load after the import.')
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'))
+    args = parser.parse_args()
+
+    results = [run_worker(args.providers, args.settings) for _ in range(args.runs)]
+    columns = [('import_ms', 'ASGI import (ms)'), ('providers_ms', 'Provider load (ms)'), ('rss_mb', 'RSS (MB)')]
+    for key, label in columns:
+        values = [result[key] for result in results]
+        print(f'{label:<20} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}')
+    print(f'{"SDKs loaded":<20} {", ".join(results[-1]["sdks"]) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
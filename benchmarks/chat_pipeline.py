@@ -0,0 +1,204 @@
+"""Measure each stage of a chat completion request separately.
+
+Stages are timed for synthetic histories of every length in ``--lengths``:
+
+- ``decode``: validating the JSON request body, the way FastAPI validates a ``ChatRequest`` body (json module
+  and pydantic) and with the orjson path the endpoint uses.
+- ``resolve``: attaching uploaded files to messages with a ``fileId``, one query per reference.
+- ``translate``: converting the history to each provider's messages with an empty message cache, with and
+  without attachments.
+- ``relay``: pumping a stream of as many chunks as the history has messages through the stream buffer and
+  reading it live, the way ``stream_response`` relays a provider stream.
+
+Runs offline, no provider is called. The ``resolve`` stage creates upload records in the configured database
+and deletes them afterwards, so point ``--settings`` at a development database.
+
+    python benchmarks/chat_pipeline.py
+    python benchmarks/chat_pipeline.py --stages decode translate --providers openai --lengths 10 100 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+STAGES = ['decode', 'resolve', 'translate', 'relay']
+
+
+def build_body(length, file_ids):
+    """Build the JSON body of a chat request, messages reference ``file_ids`` in turn."""
+    messages = []
+    for index in range(length):
+        message = {'text': f'Message {index}: ' + 'lorem ipsum dolor sit amet ' * 20, 'isUser': index % 2 == 0,
+                   'model': 'bench'}
+        if file_ids:
+            message['fileId'] = file_ids[index % len(file_ids)]
+        messages.append(message)
+    return json.dumps({'model': 'bench', 'messages': messages}).encode()
+
+
+def measure(func, runs):
+    """Median milliseconds of ``func()``."""
+    timings = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+async def measure_async(func, runs):
+    """Median milliseconds of ``await func()``."""
+    timings = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+def create_uploads(count, attachment_bytes):
+    """Create image uploads and return them."""
+    from django.core.files.base import ContentFile
+
+    from chat_completion.models import FileUpload
+
+    return [
+        FileUpload.objects.create(
+            file=ContentFile(os.urandom(attachment_bytes), name=f'bench-{index}.png'),
+            original_name=f'bench-{index}.png', content_type='image/png',
+        )
+        for index in range(count)
+    ]
+
+
+def delete_uploads(uploads):
+    """Delete uploads and their files."""
+    for upload in uploads:
+        upload.file.delete(save=False)
+        upload.delete()
+
+
+def bench_decode(length, runs, fast):
+    """Validate a request body."""
+    from chat_completion.api.fastapi.decoding import decode_chat_request
+    from chat_completion.api.fastapi.schemas import ChatRequest
+
+    body = build_body(length, [])
+    if fast:
+        return measure(lambda: decode_chat_request(body), runs)
+    return measure(lambda: ChatRequest.model_validate(json.loads(body), from_attributes=True), runs)
+
+
+def bench_resolve(length, runs, uploads, attachment_every):
+    """Attach uploads to every ``attachment_every``-th message."""
+    from chat_completion.api.fastapi.schemas import ChatRequest
+    from chat_completion.api.fastapi.views import resolve_files
+
+    data = ChatRequest.model_validate_json(build_body(length, []))
+    for index, msg in enumerate(data.messages):
+        if attachment_every and index % attachment_every == 0:
+            msg.fileId = str(uploads[index // attachment_every % len(uploads)].uuid)
+
+    async def resolve():
+        for msg in data.messages:
+            msg.file = None
+        await resolve_files(data.messages)
+
+    return asyncio.run(measure_async(resolve, runs))
+
+
+def bench_translate(provider, length, runs, uploads, attachment_every):
+    """Convert a history to provider messages without the message cache."""
+    from chat_completion.api.fastapi.schemas import ChatRequest
+    from chat_completion.providers.message_cache import message_cache
+
+    messages = ChatRequest.model_validate_json(build_body(length, [])).messages
+    if attachment_every:
+        for index in range(0, length, attachment_every):
+            messages[index].file = uploads[index // attachment_every % len(uploads)]
+
+    def translate():
+        message_cache.clear()
+        for msg in messages:
+            if msg.file is not None:
+                msg.file.file.seek(0)
+        provider.build_messages(messages)
+
+    return measure(translate, runs)
+
+
+def bench_relay(chunk_count, runs):
+    """Pump chunks through the stream buffer and read them from the live reader."""
+    from chat_completion.stream_buffers import start_buffered_stream
+
+    async def chunks():
+        for index in range(chunk_count):
+            yield f'chunk {index} lorem ipsum '
+
+    async def relay():
+        _, task, live_reader = await start_buffered_stream(chunks(), 'bench')
+        async for _ in live_reader.read():
+            pass
+        await task
+
+    return asyncio.run(measure_async(relay, runs))
+
+
+def report(stage, variant, length, ms):
+    """Print a result row."""
+    print(f'{stage:<10} {variant:<22} {length:>8} {ms:>10.3f} {ms * 1000 / length:>10.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='*', choices=STAGES, default=STAGES)
+    parser.add_argument('--providers', nargs='*', default=['openai', 'anthropic', 'gemini', 'deepseek'])
+    parser.add_argument('--lengths', nargs='*', type=int, default=[10, 100, 1000])
+    parser.add_argument('--attachment-every', type=int, default=10)
+    parser.add_argument('--attachment-kb', type=int, default=64)
+    parser.add_argument('--uploads', type=int, default=10, help='Distinct uploads referenced by messages.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'))
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+
+    django.setup()
+    from chat_completion.providers import get_provider_class
+
+    uploads = []
+    if {'resolve', 'translate'} & set(args.stages):
+        uploads = create_uploads(args.uploads, args.attachment_kb * 1024)
+    try:
+        print(f'{"Stage":<10} {"Variant":<22} {"Messages":>8} {"Median ms":>10} {"us/msg":>10}')
+        for length in args.lengths:
+            if 'decode' in args.stages:
+                report('decode', 'pydantic ChatRequest', length, bench_decode(length, args.runs, False))
+                report('decode', 'orjson + slots', length, bench_decode(length, args.runs, True))
+            if 'resolve' in args.stages:
+                ms = bench_resolve(length, args.runs, uploads, args.attachment_every)
+                report('resolve', f'fileId every {args.attachment_every}', length, ms)
+            if 'translate' in args.stages:
+                for provider_name in args.providers:
+                    provider = get_provider_class(provider_name)('bench')
+                    report('translate', f'{provider_name}', length, bench_translate(provider, length, args.runs, [], 0))
+                    ms = bench_translate(provider, length, args.runs, uploads, args.attachment_every)
+                    report('translate', f'{provider_name} + files', length, ms)
+            if 'relay' in args.stages:
+                report('relay', 'stream buffer', length, bench_relay(length, args.runs))
+    finally:
+        delete_uploads(uploads)
+
+
+if __name__ == '__main__':
+    main()
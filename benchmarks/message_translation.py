@@ -0,0 +1,96 @@
+"""Measure the cost of converting a chat history to provider messages on every turn.
+
+Each turn sends the whole history again. With an empty message cache every message is converted again,
+including base64 encoding its attachment. With the cache from the previous turn only the new message is
+converted, so the time per turn stays about the same as the history grows. Runs offline, no provider is
+called.
+
+    python benchmarks/message_translation.py
+    python benchmarks/message_translation.py --providers anthropic --lengths 10 100 1000 --attachment-kb 256
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+def build_history(length, attachment_every, attachment_bytes):
+    """Build a conversation of ``length`` messages with an image on every ``attachment_every``-th message."""
+    from django.core.files.base import ContentFile
+
+    from chat_completion.api.fastapi.schemas import Message
+    from chat_completion.models import FileUpload
+
+    messages = []
+    for index in range(length):
+        msg = Message(
+            text=f'Message {index}: ' + 'lorem ipsum dolor sit amet ' * 20, isUser=index % 2 == 0, model='bench'
+        )
+        if attachment_every and index % attachment_every == 0:
+            msg.file = FileUpload(
+                uuid=uuid.uuid4(), original_name=f'image-{index}.png', content_type='image/png',
+                file=ContentFile(os.urandom(attachment_bytes), name=f'image-{index}.png'),
+            )
+        messages.append(msg)
+    return messages
+
+
+def rewind_files(messages):
+    """Let attachments be read again."""
+    for msg in messages:
+        if msg.file is not None:
+            msg.file.file.seek(0)
+
+
+def time_turn(provider, messages, warm, runs):
+    """Median milliseconds to convert the history for its last turn."""
+    from chat_completion.providers.message_cache import message_cache
+
+    timings = []
+    for _ in range(runs):
+        message_cache.clear()
+        if warm:
+            provider.build_messages(messages[:-1])
+        rewind_files(messages)
+        started_at = time.perf_counter()
+        provider.build_messages(messages)
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--providers', nargs='*', default=['openai', 'anthropic', 'gemini', 'deepseek'])
+    parser.add_argument('--lengths', nargs='*', type=int, default=[10, 100, 1000])
+    parser.add_argument('--attachment-every', type=int, default=10, help='0 for no attachments.')
+    parser.add_argument('--attachment-kb', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'))
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+
+    django.setup()
+    from chat_completion.providers import get_provider_class
+
+    print(f'{"Provider":<10} {"Messages":>8} {"Uncached (ms)":>14} {"Cached (ms)":>12}')
+    for provider_name in args.providers:
+        provider = get_provider_class(provider_name)('bench')
+        for length in args.lengths:
+            messages = build_history(length, args.attachment_every, args.attachment_kb * 1024)
+            cold = time_turn(provider, messages, False, args.runs)
+            warm = time_turn(provider, messages, True, args.runs)
+            print(f'{provider_name:<10} {length:>8} {cold:>14.2f} {warm:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Replay captured chat requests against a running instance.
+
+Plays a capture written by ``TrafficCaptureMiddleware`` (see ``CHAT_TRAFFIC_CAPTURE``) with the original time
+between requests divided by ``--speed``, or as fast as ``--concurrency`` allows with ``--speed 0``. Captured
+attachments are uploaded first as random files of the same content type and size. Requests are sent to the
+``stub`` model unless ``--keep-models`` is given, so start the instance with ``CHAT_STUB_MODEL_ENABLED``.
+Prints status counts and time to first byte and total time percentiles.
+
+    python benchmarks/replay_traffic.py traffic.jsonl --token <jwt>
+    python benchmarks/replay_traffic.py traffic.jsonl --token <jwt> --speed 10 --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+API_PATH = '/api/fastapi'
+
+
+def load_captures(path, limit):
+    """Read captures in the order they were made."""
+    with open(path) as capture_file:
+        captures = [json.loads(line) for line in capture_file if line.strip()]
+    captures.sort(key=lambda capture: capture['timestamp'])
+    return captures[:limit] if limit else captures
+
+
+async def upload_attachments(client, captures):
+    """Upload a file for every distinct attachment and set the ``fileId`` of the messages referencing it."""
+    uploads = {}
+    for capture in captures:
+        for msg in capture['request']['messages']:
+            attachment = msg.pop('attachment', None)
+            if attachment is None:
+                continue
+            key = (attachment['content_type'], attachment['size'])
+            if key not in uploads:
+                content_type = attachment['content_type'] or 'application/octet-stream'
+                extension = mimetypes.guess_extension(content_type) or '.bin'
+                response = await client.post(f'{API_PATH}/upload-file/', files={
+                    'file': (f'replay{extension}', os.urandom(attachment['size'] or 0), content_type),
+                })
+                response.raise_for_status()
+                uploads[key] = response.json()['uuid']
+            msg['fileId'] = uploads[key]
+    return len(uploads)
+
+
+def use_stub_model(request):
+    """Send a request to the stub model."""
+    if 'models' in request:
+        request['models'] = ['stub'] * len(request['models'])
+    if 'model' in request:
+        request['model'] = 'stub'
+    for msg in request['messages']:
+        msg['model'] = 'stub'
+
+
+async def send(client, capture, results):
+    """Send a captured request and read the whole response."""
+    started_at = time.monotonic()
+    ttfb = None
+    try:
+        async with client.stream('POST', f'{API_PATH}{capture["path"]}', json=capture['request']) as response:
+            async for _ in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.monotonic() - started_at
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    total = time.monotonic() - started_at
+    results.append((status, capture.get('status'), ttfb, total))
+
+
+async def replay(args):
+    """Replay captures with the original or scaled timing."""
+    captures = load_captures(args.capture, args.limit)
+    if not captures:
+        print('No captures.')
+        return
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=args.timeout, limits=limits) as client:
+        uploaded = await upload_attachments(client, captures)
+        if not args.keep_models:
+            for capture in captures:
+                use_stub_model(capture['request'])
+
+        results = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def send_limited(capture):
+            async with semaphore:
+                await send(client, capture, results)
+
+        tasks = []
+        first_timestamp = captures[0]['timestamp']
+        started_at = time.monotonic()
+        for capture in captures:
+            if args.speed:
+                delay = (capture['timestamp'] - first_timestamp) / args.speed - (time.monotonic() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_limited(capture)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started_at
+
+    print(f'Replayed {len(results)} requests in {elapsed:.1f} s, {uploaded} attachments uploaded.')
+    print('Status (replayed, captured):', dict(Counter((status, captured) for status, captured, _, _ in results)))
+    for name, values in (('TTFB', [ttfb for _, _, ttfb, _ in results if ttfb is not None]),
+                         ('Total', [total for _, _, _, total in results])):
+        if len(values) > 1:
+            quantiles = statistics.quantiles(values, n=100, method='inclusive')
+            print(f'{name:<6} p50 {quantiles[49] * 1000:8.1f} ms  p95 {quantiles[94] * 1000:8.1f} ms  '
+                  f'p99 {quantiles[98] * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--token', default=os.environ.get('CHAT_TOKEN'), help='JWT of the user to send as.')
+    parser.add_argument('--speed', type=float, default=1, help='Timing scale, 2 is twice as fast, 0 no waiting.')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=0, help='Replay only the first captures.')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--keep-models', action='store_true', help="Don't replace models with the stub model.")
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
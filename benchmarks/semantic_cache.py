@@ -0,0 +1,97 @@
+"""Measure lookup latency and hit rate of the semantic response cache.
+
+Fills the cache with synthetic prompts, then looks up paraphrases of cached prompts (case, punctuation
+and word order changed) and unrelated prompts. Runs offline.
+
+    python benchmarks/semantic_cache.py
+    python benchmarks/semantic_cache.py --entries 100000 --dim 512 --threshold 0.85
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+TEMPLATES = [
+    'how do i {a} my {b} on {c}',
+    'what is the best way to {a} a {b} with {c}',
+    'can you explain why {b} needs {c} to {a}',
+    'write a short guide to {a} {b} using {c}',
+]
+
+
+def make_prompt(rng, vocabulary):
+    """Random prompt from a template."""
+    return rng.choice(TEMPLATES).format(**{key: ' '.join(rng.sample(vocabulary, 2)) for key in 'abc'})
+
+
+def paraphrase(rng, prompt):
+    """Change case and punctuation and swap two neighbouring words."""
+    words = prompt.split()
+    index = rng.randrange(len(words) - 1)
+    words[index], words[index + 1] = words[index + 1], words[index]
+    return ' '.join(words).capitalize() + '?'
+
+
+def percentile(values, percent):
+    """Percentile of values."""
+    return sorted(values)[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def time_lookups(cache, prompts):
+    """Lookup latencies in ms and number of hits."""
+    timings, hits = [], 0
+    for prompt in prompts:
+        started_at = time.perf_counter()
+        hits += cache.get(1, 'bench', prompt) is not None
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return timings, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from chat_completion.semantic_cache import SemanticCache
+
+    rng = random.Random(args.seed)
+    vocabulary = [f'word{index}' for index in range(5000)]
+    cache = SemanticCache(dim=args.dim, capacity=args.entries, threshold=args.threshold)
+    prompts = [make_prompt(rng, vocabulary) for _ in range(args.entries)]
+
+    started_at = time.perf_counter()
+    for index, prompt in enumerate(prompts):
+        cache.set(1, 'bench', prompt, f'answer {index}')
+    fill_seconds = time.perf_counter() - started_at
+
+    embed_timings = []
+    for prompt in prompts[:args.lookups]:
+        started_at = time.perf_counter()
+        cache.embedder.embed(prompt)
+        embed_timings.append((time.perf_counter() - started_at) * 1000)
+
+    paraphrases = [paraphrase(rng, prompt) for prompt in rng.sample(prompts, args.lookups)]
+    unrelated = [make_prompt(rng, vocabulary) for _ in range(args.lookups)]
+    print(f'{args.entries} entries, dim {args.dim}, index {cache.vectors.nbytes / 1024 / 1024:.0f} MB, '
+          f'insert {fill_seconds / args.entries * 1e6:.1f} us/entry, '
+          f'embed p50 {statistics.median(embed_timings):.3f} ms')
+    print(f'{"Lookups":<12} {"p50 (ms)":>9} {"p99 (ms)":>9} {"Hit rate":>9}')
+    for label, lookups in [('paraphrase', paraphrases), ('unrelated', unrelated)]:
+        timings, hits = time_lookups(cache, lookups)
+        print(f'{label:<12} {statistics.median(timings):>9.3f} {percentile(timings, 99):>9.3f} '
+              f'{hits / len(lookups):>9.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Fast decoding of chat completion requests.
+
+Bodies are parsed with orjson into slotted dataclasses. Bodies whose fields already have the exact JSON types
+are accepted without building pydantic models. Anything else is validated with ``ChatRequest``, so coercions
+and error responses are the same as with a pydantic body.
+"""
+
+import json
+from dataclasses import dataclass, fields
+from typing import Any, List, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from chat_completion.api.fastapi.schemas import ChatRequest
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    """Message of a decoded chat request, used like ``schemas.Message``."""
+
+    text: str
+    isUser: bool
+    model: str
+    fileId: Optional[str] = None
+    file: Any = None
+
+    def model_dump(self, exclude=()):
+        """Get the fields as a dict."""
+        return {field.name: getattr(self, field.name) for field in fields(self) if field.name not in exclude}
+
+
+@dataclass(slots=True)
+class ChatRequestData:
+    """Decoded chat request, used like ``schemas.ChatRequest``."""
+
+    messages: List[ChatMessage]
+    model: str
+
+
+def decode_message(value):
+    """Build a message from a dict with exact field types or return ``None``."""
+    if type(value) is not dict:
+        return None
+    text = value.get('text')
+    is_user = value.get('isUser')
+    model = value.get('model')
+    file_id = value.get('fileId')
+    if (
+        type(text) is not str or type(is_user) is not bool or type(model) is not str
+        or (file_id is not None and type(file_id) is not str) or value.get('file') is not None
+    ):
+        return None
+    return ChatMessage(text, is_user, model, file_id)
+
+
+def validate_chat_request(value):
+    """Validate a parsed body with ``ChatRequest`` and convert it."""
+    try:
+        data = ChatRequest.model_validate(value, from_attributes=True)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)], body=value
+        )
+    messages = [ChatMessage(msg.text, msg.isUser, msg.model, msg.fileId, msg.file) for msg in data.messages]
+    return ChatRequestData(messages, data.model)
+
+
+def load_json(body):
+    """Parse JSON with the json module, like FastAPI does, and report errors the same way."""
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{
+            'type': 'json_invalid', 'loc': ('body', e.pos), 'msg': 'JSON decode error', 'input': {},
+            'ctx': {'error': e.msg},
+        }], body=e.doc)
+
+
+def decode_chat_request(body):
+    """Decode and validate the JSON body of a chat request."""
+    if not body:
+        raise RequestValidationError([{'type': 'missing', 'loc': ('body',), 'msg': 'Field required', 'input': None}])
+    try:
+        value = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # Invalid JSON, or JSON only the json module accepts like NaN.
+        value = load_json(body)
+
+    if type(value) is dict and type(value.get('messages')) is list and type(value.get('model')) is str:
+        messages = [decode_message(msg) for msg in value['messages']]
+        if None not in messages:
+            return ChatRequestData(messages, value['model'])
+    return validate_chat_request(value)
+
+
+async def get_chat_request(request: Request):
+    """Dependency decoding the body of a chat request."""
+    return decode_chat_request(await request.body())
+
+
+def get_chat_request_openapi():
+    """OpenAPI of the body of routes using ``get_chat_request``.
+
+    ``Message`` refers to the component registered by the other routes taking messages.
+    """
+    schema = ChatRequest.model_json_schema(ref_template='#/components/schemas/{model}')
+    schema.pop('$defs', None)
+    return {'requestBody': {'required': True, 'content': {'application/json': {'schema': schema}}}}
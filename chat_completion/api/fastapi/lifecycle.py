@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRegistry:
+    """Chat streams running in this worker and whether the worker is draining before shutdown."""
+
+    def __init__(self):
+        """Initialize registry."""
+        self.tasks = set()
+        self.draining = False
+
+    @property
+    def active(self):
+        """Number of streams still running."""
+        return len(self.tasks)
+
+    def track(self, task):
+        """Track a stream task until it is done."""
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def drain(self, timeout):
+        """Stop accepting streams and wait up to ``timeout`` seconds for running ones. Return streams left."""
+        self.draining = True
+        logger.info(f"Draining {self.active} active streams.")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.tasks and (remaining := deadline - loop.time()) > 0:
+            await asyncio.wait(set(self.tasks), timeout=remaining)
+        return self.active
+
+
+stream_registry = StreamRegistry()
@@ -0,0 +1,173 @@
+"""ASGI middleware for the chat API."""
+
+import logging
+import random
+import re
+import time
+import uuid
+
+from django.conf import settings
+
+from chat_completion.log import request_id
+from chat_completion.loop_monitor import loop_monitor
+from chat_completion.tracing import request_trace, RequestTrace
+from chat_completion.traffic import get_traffic_recorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestIdMiddleware:
+    """Give every request an id for its log records.
+
+    The id comes from the ``X-Request-Id`` header when it is a reasonable one, else a new one is generated. It is
+    returned in the ``X-Request-Id`` header of HTTP responses.
+    """
+
+    header = b'x-request-id'
+    valid_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+    def __init__(self, app):
+        """Initialize middleware."""
+        self.app = app
+
+    def get_request_id(self, scope):
+        """Get the client's request id or generate one."""
+        for name, value in scope.get('headers', []):
+            if name == self.header:
+                value = value.decode('latin-1')
+                if self.valid_id.match(value):
+                    return value
+        return uuid.uuid4().hex
+
+    async def __call__(self, scope, receive, send):
+        """Set the request id while the request is handled."""
+        if scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+
+        current_id = self.get_request_id(scope)
+        token = request_id.set(current_id)
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (self.header, current_id.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+
+class LoopLagMiddleware:
+    """Report requests during which the event loop lagged, when the loop monitor is enabled."""
+
+    def __init__(self, app):
+        """Initialize middleware."""
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """Measure loop lag while the request is handled."""
+        if scope['type'] not in ('http', 'websocket') or not loop_monitor.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        loop_monitor.ensure_started()
+        started_at = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lag_ms = loop_monitor.max_lag_since(started_at)
+            if lag_ms >= loop_monitor.threshold * 1000:
+                logger.warning(
+                    f"Event loop lagged {lag_ms} ms during {scope['path']}.", extra={'loop_lag_ms': lag_ms}
+                )
+
+
+class TrafficCaptureMiddleware:
+    """Capture a sample of chat requests, anonymized, when ``CHAT_TRAFFIC_CAPTURE`` is enabled.
+
+    A capture has the time of the request, the anonymized body, the response status and timings.
+    """
+
+    def __init__(self, app):
+        """Initialize middleware."""
+        self.app = app
+
+    def should_capture(self, scope):
+        """Sample requests to the captured paths."""
+        config = settings.CHAT_TRAFFIC_CAPTURE
+        if scope['type'] != 'http' or scope['method'] != 'POST' or not config['enabled']:
+            return False
+        path = scope['path'].removeprefix(scope.get('root_path', ''))
+        return path in config['paths'] and random.random() < config['sample_rate']
+
+    async def __call__(self, scope, receive, send):
+        """Record the request body and the response of sampled requests."""
+        if not self.should_capture(scope):
+            await self.app(scope, receive, send)
+            return
+
+        max_body_bytes = settings.CHAT_TRAFFIC_CAPTURE['max_body_bytes']
+        body = bytearray()
+        capture = {'timestamp': time.time(), 'path': scope['path'].removeprefix(scope.get('root_path', ''))}
+        started_at = time.monotonic()
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] == 'http.request' and len(body) <= max_body_bytes:
+                body.extend(message.get('body', b''))
+            return message
+
+        async def send_response(message):
+            if message['type'] == 'http.response.start':
+                capture['status'] = message['status']
+            elif message['type'] == 'http.response.body' and 'ttfb_ms' not in capture:
+                capture['ttfb_ms'] = round((time.monotonic() - started_at) * 1000, 1)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_response)
+        finally:
+            capture['duration_ms'] = round((time.monotonic() - started_at) * 1000, 1)
+            capture['body_bytes'] = len(body)
+            if len(body) <= max_body_bytes:
+                get_traffic_recorder().record(capture, bytes(body))
+
+
+class TraceMiddleware:
+    """Log the stages of requests until their first response byte, when ``CHAT_TTFB_TRACE`` is enabled.
+
+    Only requests whose handlers record stages are logged.
+    """
+
+    def __init__(self, app):
+        """Initialize middleware."""
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """Trace the request."""
+        if scope['type'] != 'http' or not settings.CHAT_TTFB_TRACE['enabled']:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = request_trace.set(trace)
+
+        async def send_traced(message):
+            if message['type'] == 'http.response.start':
+                trace.mark('headers_sent')
+            elif message['type'] == 'http.response.body' and message.get('body') and 'first_byte' not in trace.stages:
+                trace.mark('first_byte')
+                if len(trace.stages) > 2:
+                    logger.info(
+                        f"First byte of {scope['path']} after {trace.stages['first_byte']['start_ms']} ms.",
+                        extra={'stages': dict(sorted(trace.stages.items(), key=lambda item: item[1]['start_ms']))},
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            request_trace.reset(token)
@@ -0,0 +1,31 @@
+from typing import List, Optional
+
+from fastapi import UploadFile
+from pydantic import BaseModel, Field
+
+
+class Message(BaseModel):
+    text: str
+    isUser: bool
+    model: str
+    fileId: Optional[str] = None
+    file: Optional[UploadFile] = None
+
+
+class ChatRequest(BaseModel):
+    messages: List[Message]
+    model: str
+
+
+class CompareRequest(BaseModel):
+    messages: List[Message]
+    models: List[str] = Field(min_length=1)
+
+
+class DeleteFile(BaseModel):
+    id: str
+
+
+class BatchJobRequest(BaseModel):
+    model: str
+    conversations: List[List[Message]] = Field(min_length=1)
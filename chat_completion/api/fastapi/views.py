@@ -1,20 +1,41 @@
-import base64
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Optional
-from anthropic import AsyncAnthropic
+import math
+import uuid
+from contextlib import aclosing
+from typing import Optional
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db.models import F
 from django.utils import timezone
-from fastapi import APIRouter, Body, Depends, HTTPException, status, UploadFile
+from fastapi import (
+    APIRouter, Body, Depends, Header, HTTPException, Query, Request, status, UploadFile, WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.security import OAuth2PasswordBearer
 import jwt
-from openai import AsyncOpenAI
-from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
-from chat_completion.api.v1.serializers import FileUploadSerializer
-from chat_completion.models import FileUpload
+from pydantic import ValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from chat_completion.api.fastapi.decoding import ChatRequestData, get_chat_request, get_chat_request_openapi
+from chat_completion.api.fastapi.lifecycle import stream_registry
+from chat_completion.api.fastapi.schemas import BatchJobRequest, ChatRequest, CompareRequest, DeleteFile
+from chat_completion.api.v1.serializers import BatchJobResultSerializer, BatchJobSerializer, FileUploadSerializer
+from chat_completion.attachments import get_attachment_executor, get_memory_budget, MemoryReservation
+from chat_completion.idempotency import get_idempotency_store
+from chat_completion.models import BatchJob, FileUpload
+from chat_completion.providers import get_provider
+from chat_completion.rate_limits import get_plan_limits, get_rate_limiter
+from chat_completion.retrieval import add_excerpts, is_indexable
+from chat_completion.routing import AUTO_MODEL, model_router
+from chat_completion.semantic_cache import cache_stream, get_semantic_cache, is_cacheable, replay
+from chat_completion.stream_buffers import get_stream_buffer, start_buffered_stream, StreamNotFound
+from chat_completion.summaries import apply_summary
+from chat_completion.tasks import index_file_upload, process_batch_job
+from chat_completion.tracing import mark_stage, trace_stage, traced
 from payments.models import UserSubscription
-from google import genai
 
 from users.models import UserProfile
 
@@ -26,220 +47,605 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 logger = logging.getLogger(__name__)
 
 
-async def decode_token(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def get_token_user_id(token):
+    """Get the user id of a JWT or ``None`` when the token is invalid."""
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            raise credentials_exception
-        is_subscribed = await UserSubscription.objects.filter(user_id=user_id, is_active=True).aexists()
-        if not is_subscribed:
-            profile = await UserProfile.objects.aget(user_id=user_id)
-            if profile.free_requests <= 0:
-                raise HTTPException(status_code=403, detail="No subscripton")
-            else:
-                profile.free_requests -= 1
-                profile.last_free_request_at = timezone.now()
-                await profile.asave()
     except jwt.InvalidTokenError:
-        raise credentials_exception
+        return None
+    return payload.get("user_id")
+
+
+async def get_user_id(token: str = Depends(oauth2_scheme)):
+    user_id: str = get_token_user_id(token)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
+
+async def get_user_plan(user_id: str = Depends(get_user_id)):
+    """Get the package name of the user's active subscription or ``None``."""
+    return await UserSubscription.objects.filter(
+        user_id=user_id, is_active=True
+    ).values_list('package__name', flat=True).afirst()
+
+
+async def check_rate_limit(scope, user_id, plan, cost=1):
+    """Take ``cost`` requests from the user's token bucket for ``scope``."""
+    allowed, retry_after = await get_rate_limiter().acquire(
+        f'{scope}:{user_id}', cost=cost, **get_plan_limits(plan, scope)
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def rate_limit(scope):
+    """Create a dependency limiting requests of a user with the token bucket of their plan for ``scope``."""
+    async def check_scope_rate_limit(
+        user_id: str = Depends(get_user_id), plan: Optional[str] = Depends(get_user_plan)
+    ):
+        await check_rate_limit(scope, user_id, plan)
+        return user_id
+
+    return check_scope_rate_limit
+
+
+async def use_free_request(user_id, count=1):
+    """Spend ``count`` of the free requests of a user without a subscription.
+
+    A single conditional update, so concurrent requests can't spend the same free request.
+    """
+    updated = await UserProfile.objects.filter(user_id=user_id, free_requests__gte=count).aupdate(
+        free_requests=F('free_requests') - count, last_free_request_at=timezone.now()
+    )
+    if not updated:
+        raise HTTPException(status_code=403, detail="No subscripton")
+
+
+async def require_subscription(user_id: str = Depends(get_user_id), plan: Optional[str] = Depends(get_user_plan)):
+    if plan is None:
+        raise HTTPException(status_code=403, detail="No subscripton")
+    return user_id
+
+
+async def reject_when_draining():
+    """Reject new chat streams while the worker shuts down."""
+    if stream_registry.draining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is restarting, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def stream_response(chunks, user_id, headers=None):
+    """Buffer a provider stream so it can be resumed and stream it to the client."""
+    stream_id, task, live_reader = await start_buffered_stream(chunks, user_id)
+    stream_registry.track(task)
+    return StreamingResponse(
+        live_reader.read(), headers={**(headers or {}), 'X-Stream-Id': stream_id},
+        media_type='text/plain',
+    )
+
+
+async def resolve_files(messages):
+    """Attach uploaded files to messages that reference them, with a single query."""
+    file_ids = {msg.fileId for msg in messages if msg.fileId and msg.file is None}
+    if not file_ids:
+        return
+    files = {file.uuid: file async for file in FileUpload.objects.filter(uuid__in=file_ids)}
+    for msg in messages:
+        if msg.fileId and msg.file is None and (file := files.get(uuid.UUID(msg.fileId))):
+            msg.file = file
+
+
+async def resolve_attachments(messages):
+    """Attach uploaded files to messages and set the excerpts sent instead of large text files."""
+    with trace_stage('files'):
+        await resolve_files(messages)
+    with trace_stage('retrieval'):
+        await add_excerpts(messages)
+
+
+async def reserve_memory(providers, messages):
+    """Reserve the memory converting the files of messages for the providers takes, return a reservation per provider.
+
+    Waits while the worker's memory budget is used by other requests. Files that don't fit in the whole budget are
+    rejected, retrying doesn't help them.
+    """
+    budget = get_memory_budget()
+    sizes = [await asyncio.to_thread(provider.estimate_attachment_bytes, messages) for provider in providers]
+    if sum(sizes) > budget.budget_bytes:
+        raise HTTPException(status_code=413, detail="Attachments are too large")
+    if not await budget.acquire(sum(sizes)):
+        raise HTTPException(status_code=503, detail="Server is busy, please retry", headers={'Retry-After': '1'})
+    return [MemoryReservation(budget, size) for size in sizes]
 
 
-class Message(BaseModel):
-    text: str
-    isUser: bool
-    model: str
-    fileId: Optional[str] = None
-    file: Optional[UploadFile] = None
+async def release_memory(reservations):
+    """Release reservations, e.g. of a response the client left before it started."""
+    for reservation in reservations:
+        reservation.release()
 
 
-class ChatRequest(BaseModel):
-    messages: List[Message]
-    model: str
+async def hold_memory(chunks, reservation):
+    """Stream ``chunks``, holding the reserved memory until the first chunk or the end of the stream.
 
+    The provider request with the converted files is in memory until its response starts.
+    """
+    try:
+        async with aclosing(chunks):
+            async for text in chunks:
+                if text:
+                    reservation.release()
+                yield text
+    finally:
+        reservation.release()
+
+
+async def prepare_messages(provider, user_id, model, messages):
+    """Convert the chat history of a request with resolved files to the provider's message format.
+
+    The summary is looked up and the provider's client is created concurrently.
+    """
+    messages, _ = await asyncio.gather(
+        traced('summary', apply_summary(user_id, model, messages)),
+        traced('client', asyncio.to_thread(lambda: provider.client)),
+    )
+    with trace_stage('attachments'):
+        await provider.prepare_attachments(messages)
+    with trace_stage('build_messages'):
+        return provider.build_messages(messages)
 
-MODEL_MAP = {
-    'gpt-4': 'gpt-4',
-    'gpt-4o': 'gpt-4o',
-    'gpt-4o-mini': 'gpt-4o-mini',
-    'gpt-o3-mini': 'o3-mini',
-    'gpt-o3-mini-high': 'o3-mini-high',
-    'deepseek': 'deepseek-chat',
-}
+
+async def stream_prepared(provider, preparing, reservation):
+    """Stream the provider's response once the messages are prepared, holding the reserved memory until it starts."""
+    try:
+        try:
+            provider_messages = await preparing
+        except Exception as e:
+            provider.error = e
+            logger.error(f"Couldn't prepare messages for {provider.display_name}: {e}", exc_info=True)
+            yield provider.error_message
+            return
+        async for text in hold_memory(provider.stream(provider_messages), reservation):
+            if text:
+                mark_stage('first_token')
+            yield text
+    finally:
+        reservation.release()
+
+
+async def claim_idempotency_key(scope, user_id, key, fingerprint):
+    """Claim an idempotency key for a request. Return the result of the earlier request with the key, if any.
+
+    A key can't be reused for a different request or while the earlier request is still starting.
+    """
+    record = await get_idempotency_store().claim(f'{scope}:{user_id}:{key}', {'fingerprint': fingerprint})
+    if record is None:
+        return None
+    if record['fingerprint'] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency key was used for a different request")
+    if 'result' not in record:
+        raise HTTPException(status_code=409, detail="A request with this idempotency key is in progress")
+    return record['result']
+
+
+async def complete_idempotency_key(scope, user_id, key, fingerprint, result):
+    """Save the result of a request for its retries, or free the key when the request failed."""
+    store = get_idempotency_store()
+    if result is None:
+        await store.release(f'{scope}:{user_id}:{key}')
+    else:
+        await store.set(f'{scope}:{user_id}:{key}', {'fingerprint': fingerprint, 'result': result})
+
+
+async def replay_chat(result):
+    """Stream the response of an earlier chat request again from the stream buffer."""
+    buffer = get_stream_buffer()
+    try:
+        _, start = await buffer.get_state(result['stream_id'])
+    except StreamNotFound:
+        start = None
+    if start != 0:
+        raise HTTPException(status_code=410, detail="The original response is no longer available")
+    return StreamingResponse(
+        buffer.read(result['stream_id']), headers={'X-Stream-Id': result['stream_id'], 'X-Model': result['model']},
+        media_type='text/plain',
+    )
 
 
-@chat_router.post("/chat-completion/", dependencies=[Depends(decode_token)])
-async def read_root(data: ChatRequest):
+@chat_router.post(
+    "/chat-completion/", dependencies=[Depends(reject_when_draining), Depends(rate_limit('chat'))],
+    openapi_extra=get_chat_request_openapi(),
+)
+async def read_root(
+    request: Request, data: ChatRequestData = Depends(get_chat_request), user_id: str = Depends(get_user_id),
+    plan: Optional[str] = Depends(get_user_plan),
+    idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key', max_length=255),
+):
+    """Stream a chat completion.
+
+    Retries with the same ``Idempotency-Key`` replay the original response without calling the provider or
+    using another free request.
+    """
+    if not idempotency_key:
+        return await stream_chat(data, user_id, plan)
+
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    result = await claim_idempotency_key('chat', user_id, idempotency_key, fingerprint)
+    if result is not None:
+        return await replay_chat(result)
+
+    response = None
+    try:
+        response = await stream_chat(data, user_id, plan)
+    finally:
+        result = None
+        if response is not None and 'x-stream-id' in response.headers:
+            result = {'stream_id': response.headers['x-stream-id'], 'model': response.headers['x-model']}
+        await complete_idempotency_key('chat', user_id, idempotency_key, fingerprint, result)
+    return response
+
+
+async def stream_chat(data, user_id, plan):
+    """Start streaming the response to a chat request.
+
+    Users without a subscription spend a free request. The messages are prepared for the provider while it is
+    spent and streamed after the response headers were sent.
+    """
+    mark_stage('handler')
     model = data.model
     messages = data.messages
 
     if not messages:
         return StreamingResponse("No messages provided.", status_code=400)
 
-    for msg in messages:
-        if msg.fileId:
-            file = await FileUpload.objects.filter(uuid=msg.fileId).afirst()
-            if file:
-                msg.file = file
-
-    if model == 'gemini':
-        # 🔹 Gemini 1.5 Pro
-        client = genai.Client(api_key=settings.GEMINI_API_KEY).aio
-        gemini_messages = [
-            {
-                "role": 'user' if msg.isUser else 'assistant',
-                "parts": [
-                    {"text": msg.text or ' '},
-                    *([
-                        {"text": f'user uploaded a file named: {msg.file.original_name}'}]
-                        if msg.file
-                        else []),
-                    *([
-                        {"inline_data": {
-                            "data": base64.b64encode(msg.file.file.read()).decode("utf-8"),
-                            "mime_type": msg.file.content_type,
-                        }}] if msg.file else [])
-                ]
-            }
-            for msg in messages
-        ]
-
-        async def gemini_event_stream():
-            try:
-                response = await client.models.generate_content_stream(
-                    model='gemini-2.0-flash', contents=gemini_messages
-                    )
-                async for chunk in response:
-                    yield chunk.text
-            except GeneratorExit:
-                logger.info("Client disconnected, stopping Gemini stream.")
-            except Exception as e:
-                logger.error(f"Gemini streaming error: {e}")
-                logger.error(f"Messages: {gemini_messages}")
-                yield "Couldn't get a response. If this persists, please contact support."
-
-        return StreamingResponse(gemini_event_stream())
-
-    if 'gpt' in model or model == 'deepseek':
-        if model == 'deepseek':
-            client = AsyncOpenAI(api_key=settings.DEEPSEEK_API_KEY, base_url='https://api.deepseek.com')
-            # For DeepSeek, flatten the content to a simple string
-            openai_messages = []
-            for msg in messages:
-                content_parts = [msg.text]
-                if (file := msg.file):
-                    if 'image' in file.content_type:
-                        content_parts.append(f"[User uploaded an image: {file.file.url}]")
-                    else:
-                        try:
-                            file_content = base64.b64encode(msg.file.file.read()).decode("utf-8")
-                            content_parts.append(f"[File content: {file_content}, mime_type: {file.content_type}]")
-                        except Exception as e:
-                
-                            content_parts.append(f"[Could not read file: {str(e)}]")
-                
-                openai_messages.append({
-                    "role": 'user' if msg.isUser else 'assistant',
-                    "content": "\n".join(content_parts)  # Combine text + file info
-                })
-        else:
-            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            openai_messages = [
-                {
-                    "role": 'user' if msg.isUser else 'assistant',
-                    "content": [
-                        {"type": "text", "text": msg.text},
-                        *([{"type": "image_url", "image_url": {'url': f'{settings.BASE_URL}{file.file.url}'}}]
-                            if ((file := msg.file) and 'image' in file.content_type) else []),
-                        *([{'type': 'text', 'text': f'user uploaded a file file content in bytes: {str(file.file.read())}'}]
-                            if (file := msg.file) and 'image' not in file.content_type else [])
-                    ]
-                }
-                for msg in messages
-            ]
-
-        async def openai_event_stream():
-            try:
-                response = await client.chat.completions.create(
-                    model=MODEL_MAP[model],
-                    messages=openai_messages,
-                    stream=True
-                )
-                async for chunk in response:
-                    yield chunk.choices[0].delta.content or ""
-            except GeneratorExit:
-                logger.info("Client disconnected, stopping OpenAI stream.")
-                response.close()
-            except Exception as e:
-                logger.error(f"OpenAI streaming error: {e}")
-                logger.error(f"Messages: {openai_messages}")
-                yield "Couldn't get a response. If this persists, please contact support."
-
-        return StreamingResponse(openai_event_stream())
-
-    if model == 'claude':
-        anthropic_messages = [
-            {
-                "role": 'user' if msg.isUser else 'assistant',
-                "content": [
-                        {"type": "text", "text": msg.text or '<no text>'},
-                        *([{
-                            "type": "image",
-                            "source": {
-                                'type': 'base64',
-                                'media_type': file.content_type,
-                                'data': base64.b64encode(file.file.read()).decode("utf-8")
-                            }}]
-                            if ((file := msg.file) and 'image' in file.content_type) else []),
-                        *([{
-                            "type": "text",
-                            "text": f'user uploaded a file named: {file.original_name}, file content in bytes: {str(file.file.read())}'}]
-                            if ((file := msg.file) and 'image' not in file.content_type) else [])
-                ]
-            }
-            for msg in messages
-        ]
-
-        client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
-
-        async def claude_event_stream():
-            try:
-                async with client.messages.stream(
-                    max_tokens=1024,
-                    messages=anthropic_messages,
-                    model="claude-3-7-sonnet-latest",
-                ) as stream:
-                    async for text in stream.text_stream:
-                        yield text
-            except GeneratorExit:
-                logger.info("Client disconnected, stopping Claude stream.")
-                stream.close()
-            except Exception as e:
-                logger.error(f"Claude streaming error: {e}")
-                logger.error(f"Messages: {anthropic_messages}")
-                yield "Couldn't get a response. If this persists, please contact support."
+    if model == AUTO_MODEL:
+        model = model_router.choose(plan, messages)
+    provider = get_provider(model, user_id=user_id)
+    if provider is None:
+        return StreamingResponse("Invalid model", status_code=400)
+
+    semantic_cache = get_semantic_cache() if is_cacheable(messages) else None
+    if semantic_cache is not None:
+        response = await asyncio.to_thread(semantic_cache.get, user_id, model, messages[0].text)
+        if response is not None:
+            if plan is None:
+                await use_free_request(user_id)
+            return await stream_response(replay(response), user_id, headers={'X-Model': model, 'X-Cache': 'hit'})
+
+    await resolve_attachments(messages)
+    [reservation] = await traced('memory', reserve_memory([provider], messages))
+    preparing = asyncio.create_task(traced('prepare_messages', prepare_messages(provider, user_id, model, messages)))
+    try:
+        if plan is None:
+            await traced('free_request', use_free_request(user_id))
+        chunks = stream_prepared(provider, preparing, reservation)
+        if semantic_cache is not None:
+            chunks = cache_stream(semantic_cache, provider, user_id, model, messages[0].text, chunks)
+        return await stream_response(chunks, user_id, headers={'X-Model': model})
+    except BaseException:
+        preparing.cancel()
+        reservation.release()
+        raise
+
+
+async def multiplex_streams(streams):
+    """Merge provider streams into one stream of NDJSON frames tagged with their model.
+
+    Every model sends ``chunk`` frames with ``text`` and a final ``done`` frame. All provider streams are cancelled
+    together when the client disconnects.
+    """
+    queue = asyncio.Queue(settings.CHAT_COMPARE['queue_size'])
+
+    async def pump(model, chunks):
+        try:
+            async with aclosing(chunks):
+                async for text in chunks:
+                    if text:
+                        await queue.put({"model": model, "type": "chunk", "text": text})
+        except Exception as e:
+            logger.error(f"Compare stream for {model} failed: {e}")
+        await queue.put({"model": model, "type": "done"})
+
+    tasks = [asyncio.create_task(pump(model, chunks)) for model, chunks in streams.items()]
+    for task in tasks:
+        stream_registry.track(task)
+    try:
+        remaining = len(tasks)
+        while remaining:
+            frame = await queue.get()
+            if frame["type"] == "done":
+                remaining -= 1
+            yield json.dumps(frame) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@chat_router.post("/chat-completion/compare/", dependencies=[Depends(reject_when_draining)])
+async def compare_models(
+    data: CompareRequest, user_id: str = Depends(get_user_id), plan: Optional[str] = Depends(get_user_plan)
+):
+    """Stream answers of several models to the same conversation at once. Counts as one request per model.
+
+    ``auto`` is routed like in a chat request. The summary of the conversation is applied per model, as when the
+    conversation continues with that model.
+    """
+    if not data.messages:
+        raise HTTPException(status_code=400, detail="No messages provided.")
+    models = list(dict.fromkeys(
+        (model_router.choose(plan, data.messages) or model) if model == AUTO_MODEL else model
+        for model in dict.fromkeys(data.models)
+    ))
+    if len(models) > settings.CHAT_COMPARE['max_models']:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.CHAT_COMPARE['max_models']} models can be compared"
+        )
+    providers = {model: get_provider(model, user_id=user_id) for model in models}
+    invalid = [model for model, provider in providers.items() if provider is None]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid models: {', '.join(invalid)}")
+
+    await check_rate_limit('chat', user_id, plan, cost=len(models))
+    await resolve_attachments(data.messages)
+    conversations = dict(zip(models, await asyncio.gather(*[
+        apply_summary(user_id, model, data.messages) for model in models
+    ])))
+    reservations = await reserve_memory(providers.values(), data.messages)
+    try:
+        if plan is None:
+            await use_free_request(user_id, count=len(models))
+        streams = {}
+        for (model, provider), reservation in zip(providers.items(), reservations):
+            await provider.prepare_attachments(conversations[model])
+            streams[model] = hold_memory(provider.stream(provider.build_messages(conversations[model])), reservation)
+    except BaseException:
+        await release_memory(reservations)
+        raise
+    return StreamingResponse(
+        multiplex_streams(streams), media_type='application/x-ndjson',
+        background=BackgroundTask(release_memory, reservations),
+    )
 
-        return StreamingResponse(claude_event_stream())
 
-    return StreamingResponse("Invalid model", status_code=400)
+class ChatSession:
+    """Chat over a WebSocket connection that is authenticated once and carries many turns.
+
+    Client frames are JSON objects with a ``type``:
+
+    - ``chat``: ``{"type": "chat", "id": ..., "model": ..., "messages": [...]}`` starts a turn, same body as the
+      chat completion endpoint. Only one turn streams at a time.
+    - ``cancel``: ``{"type": "cancel", "id": ...}`` stops the streaming turn and its provider request.
+    - ``ping`` / ``pong``: heartbeats.
+
+    The server answers a turn with ``start``, ``chunk`` frames with ``text``, then ``done``, ``cancelled`` or
+    ``error`` with ``status`` and ``detail``. It sends ``ping`` every ``heartbeat_interval`` seconds and closes
+    connections that sent nothing for ``idle_timeout`` seconds. Outgoing frames go through a queue of
+    ``send_queue_size`` frames, so a slow client slows down reading from the provider instead of piling up
+    frames in memory.
+    """
+
+    def __init__(self, websocket, user_id, plan):
+        """Initialize session state."""
+        self.websocket = websocket
+        self.user_id = user_id
+        self.plan = plan
+        self.config = settings.CHAT_WEBSOCKET
+        self.queue = asyncio.Queue(self.config['send_queue_size'])
+        self.providers = {}
+        self.turn = None
+        self.turn_id = None
+
+    async def send(self, frame):
+        """Queue a frame, waiting while the queue is full."""
+        await self.queue.put(frame)
+
+    async def send_frames(self):
+        """Write queued frames to the socket."""
+        while True:
+            frame = await self.queue.get()
+            await self.websocket.send_json(frame)
+
+    async def heartbeat(self):
+        """Ping the client periodically."""
+        while True:
+            await asyncio.sleep(self.config['heartbeat_interval'])
+            await self.send({"type": "ping"})
+
+    def get_provider(self, model):
+        """Get a provider for the model, reusing its client across turns."""
+        provider = self.providers.get(model)
+        if provider is None:
+            provider = self.providers[model] = get_provider(model, user_id=self.user_id)
+        else:
+            provider.reset()
+        return provider
+
+    async def run_turn(self, turn_id, data):
+        """Stream the response to a chat frame."""
+        try:
+            await reject_when_draining()
+            await check_rate_limit('chat', self.user_id, self.plan)
+            if not data.messages:
+                raise HTTPException(status_code=400, detail="No messages provided.")
+            model = model_router.choose(self.plan, data.messages) if data.model == AUTO_MODEL else data.model
+            provider = self.get_provider(model)
+            if provider is None:
+                raise HTTPException(status_code=400, detail="Invalid model")
+            await resolve_attachments(data.messages)
+            [reservation] = await reserve_memory([provider], data.messages)
+            try:
+                if self.plan is None:
+                    await use_free_request(self.user_id)
+                provider_messages = await prepare_messages(provider, self.user_id, model, data.messages)
+                await self.send({"type": "start", "id": turn_id, "model": model})
+                async with aclosing(hold_memory(provider.stream(provider_messages), reservation)) as chunks:
+                    async for text in chunks:
+                        if text:
+                            await self.send({"type": "chunk", "id": turn_id, "text": text})
+            finally:
+                reservation.release()
+            await self.send({"type": "done", "id": turn_id})
+        except HTTPException as e:
+            await self.send({"type": "error", "id": turn_id, "status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"WebSocket chat turn failed: {e}")
+            await self.send({"type": "error", "id": turn_id, "status": 500, "detail": "Internal server error"})
+
+    async def start_turn(self, frame):
+        """Validate a chat frame and start streaming its response."""
+        turn_id = frame.get("id")
+        if self.turn is not None and not self.turn.done():
+            await self.send({"type": "error", "id": turn_id, "status": 409, "detail": "A response is streaming"})
+            return
+        try:
+            data = ChatRequest.model_validate(frame)
+        except ValidationError as e:
+            await self.send({"type": "error", "id": turn_id, "status": 422, "detail": e.errors(include_url=False)})
+            return
+        self.turn_id = turn_id
+        self.turn = asyncio.create_task(self.run_turn(turn_id, data))
+        stream_registry.track(self.turn)
+
+    async def cancel_turn(self):
+        """Stop the streaming turn."""
+        if self.turn is None or self.turn.done():
+            return False
+        self.turn.cancel()
+        try:
+            await self.turn
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def handle(self, frame):
+        """Handle a client frame."""
+        frame_type = frame.get("type") if isinstance(frame, dict) else None
+        if frame_type == "chat":
+            await self.start_turn(frame)
+        elif frame_type == "cancel":
+            if await self.cancel_turn():
+                await self.send({"type": "cancelled", "id": self.turn_id})
+        elif frame_type == "ping":
+            await self.send({"type": "pong"})
+        elif frame_type != "pong":
+            await self.send({"type": "error", "id": None, "status": 400, "detail": "Unknown frame type"})
+
+    async def run(self):
+        """Serve the connection until the client disconnects or goes idle."""
+        tasks = [asyncio.create_task(self.send_frames()), asyncio.create_task(self.heartbeat())]
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(self.websocket.receive_json(), self.config['idle_timeout'])
+                except asyncio.TimeoutError:
+                    await self.websocket.close(code=status.WS_1001_GOING_AWAY)
+                    return
+                except ValueError:
+                    await self.send({"type": "error", "id": None, "status": 400, "detail": "Invalid JSON"})
+                    continue
+                except KeyError:
+                    await self.send({"type": "error", "id": None, "status": 400, "detail": "Frames must be text"})
+                    continue
+                await self.handle(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self.cancel_turn()
+            for task in tasks:
+                task.cancel()
+
+
+@chat_router.websocket("/chat-ws/")
+async def chat_websocket(websocket: WebSocket, token: str = Query('')):
+    """Chat session over a WebSocket. Browsers can't set headers on WebSockets, the JWT is a query parameter."""
+    user_id = get_token_user_id(token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    plan = await get_user_plan(user_id)
+    await websocket.accept()
+    await ChatSession(websocket, user_id, plan).run()
+
+
+@chat_router.get("/ready/")
+async def readiness():
+    """Report whether this worker accepts new chat streams."""
+    if stream_registry.draining:
+        return JSONResponse(
+            {"status": "draining", "active_streams": stream_registry.active},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return {"status": "ready", "active_streams": stream_registry.active}
+
+
+@chat_router.get("/metrics/")
+async def metrics():
+    """Report the load of this worker."""
+    return {
+        "active_streams": stream_registry.active,
+        "attachments": get_attachment_executor().get_stats(),
+        "memory": get_memory_budget().get_stats(),
+    }
+
+
+@chat_router.get("/chat-completion/{stream_id}/resume/")
+async def resume_stream(stream_id: str, offset: int = 0, user_id: str = Depends(get_user_id)):
+    """Resume a chat stream from a byte offset without calling the provider again."""
+    buffer = get_stream_buffer()
+    try:
+        owner, start = await buffer.get_state(stream_id)
+    except StreamNotFound:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if str(owner) != str(user_id):
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if offset < start:
+        raise HTTPException(status_code=410, detail="Stream data before this offset is no longer available")
+    return StreamingResponse(
+        buffer.read(stream_id, offset), headers={'X-Stream-Id': stream_id}, media_type='text/plain'
+    )
 
 
-@chat_router.post("/upload-file/")
-async def upload_file(file: UploadFile):
+@chat_router.post("/upload-file/", dependencies=[Depends(rate_limit('upload'))])
+async def upload_file(
+    file: UploadFile, user_id: str = Depends(get_user_id),
+    idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key', max_length=255),
+):
     file_content = await file.read()
-    django_file = ContentFile(file_content, name=file.filename)
-    file = await FileUpload.objects.acreate(file=django_file, original_name=file.filename, content_type=file.content_type)
-    ser = FileUploadSerializer(file)
-    return ser.data
-    
+    if idempotency_key:
+        fingerprint = hashlib.sha256(file_content).hexdigest()
+        result = await claim_idempotency_key('upload', user_id, idempotency_key, fingerprint)
+        if result is not None:
+            return result
+
+    result = None
+    try:
+        django_file = ContentFile(file_content, name=file.filename)
+        file = await FileUpload.objects.acreate(
+            file=django_file, original_name=file.filename, content_type=file.content_type, size=len(file_content)
+        )
+        result = dict(FileUploadSerializer(file).data)
+        if is_indexable(file.content_type, len(file_content)):
+            try:
+                await asyncio.to_thread(index_file_upload.delay, file.id)
+            except Exception as e:
+                # Files without an index are sent whole.
+                logger.error(f"Couldn't queue indexing upload {file.id}: {e}")
+    finally:
+        if idempotency_key:
+            await complete_idempotency_key('upload', user_id, idempotency_key, fingerprint, result)
+    return result
 
-class DeleteFile(BaseModel):
-    id: str
 
 @chat_router.delete("/delete-file/")
 async def delete_file(request: DeleteFile = Body(...)):
@@ -248,3 +654,53 @@ async def delete_file(request: DeleteFile = Body(...)):
         await file.adelete()
         return "File deleted"
     return "File not found"
+
+
+@chat_router.post("/batch-jobs/")
+async def create_batch_job(data: BatchJobRequest, user_id: str = Depends(require_subscription)):
+    """Submit conversations for offline completion."""
+    if get_provider(data.model) is None:
+        raise HTTPException(status_code=400, detail="Invalid model")
+    if len(data.conversations) > settings.CHAT_BATCH['max_conversations']:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.CHAT_BATCH['max_conversations']} conversations are allowed"
+        )
+    if not all(data.conversations):
+        raise HTTPException(status_code=400, detail="No messages provided.")
+
+    job = await BatchJob.objects.acreate(
+        user_id=user_id,
+        model=data.model,
+        conversations=[
+            [msg.model_dump(exclude={'file'}) for msg in conversation] for conversation in data.conversations
+        ],
+        total=len(data.conversations),
+    )
+    await asyncio.to_thread(process_batch_job.delay, job.id)
+    return BatchJobSerializer(job).data
+
+
+async def get_batch_job(job_id, user_id):
+    job = await BatchJob.objects.filter(uuid=job_id, user_id=user_id).afirst()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+
+@chat_router.get("/batch-jobs/{job_id}/")
+async def batch_job_status(job_id: uuid.UUID, user_id: str = Depends(get_user_id)):
+    job = await get_batch_job(job_id, user_id)
+    return BatchJobSerializer(job).data
+
+
+@chat_router.get("/batch-jobs/{job_id}/results/")
+async def batch_job_results(
+    job_id: uuid.UUID, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500),
+    user_id: str = Depends(get_user_id),
+):
+    job = await get_batch_job(job_id, user_id)
+    results = [result async for result in job.results.all()[offset:offset + limit]]
+    return {
+        'job': BatchJobSerializer(job).data,
+        'results': BatchJobResultSerializer(results, many=True).data,
+    }
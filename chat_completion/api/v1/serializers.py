@@ -1,7 +1,7 @@
 from django.conf import settings
 from rest_framework import serializers
 
-from chat_completion.models import FileUpload
+from chat_completion.models import BatchJob, BatchJobResult, FileUpload
 
 
 class FileUploadSerializer(serializers.ModelSerializer):
@@ -13,3 +13,18 @@ class FileUploadSerializer(serializers.ModelSerializer):
 
     def get_url(self, obj):
         return settings.BASE_URL + obj.file.url
+
+
+class BatchJobSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display')
+
+    class Meta:
+        model = BatchJob
+        fields = ['uuid', 'model', 'status', 'total', 'completed', 'failed', 'error', 'created_at', 'updated_at']
+
+
+class BatchJobResultSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = BatchJobResult
+        fields = ['index', 'output', 'error']
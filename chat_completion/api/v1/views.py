@@ -159,7 +159,9 @@ class FileUploadView(APIView):
         if not file:
             return Response("No file provided.", status=400)
 
-        file = FileUpload.objects.create(file=file, original_name=file.name, content_type=file.content_type)
+        file = FileUpload.objects.create(
+            file=file, original_name=file.name, content_type=file.content_type, size=file.size
+        )
         ser = self.serializer_class(file)
         return JsonResponse(ser.data)
 
@@ -0,0 +1,287 @@
+"""Transforms of uploaded files into the content of provider messages.
+
+Base64 encoding a file of several MB or building the ``str`` of its bytes holds the GIL for tens of
+milliseconds, which would stall every stream on the worker's event loop. Large files are transformed in a
+process pool instead, with a limit on how many transforms run or wait at once.
+
+While a file is converted its bytes, the transformed text and the provider request copying it are in memory
+together, so requests reserve their estimated footprint from a per-worker memory budget first.
+"""
+
+import asyncio
+import base64
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+
+
+def encode_base64(data):
+    """Base64 encode file content."""
+    return base64.b64encode(data).decode('utf-8')
+
+
+def bytes_repr(data):
+    """File content as the ``str`` of its bytes, the way text attachments are sent."""
+    return str(data)
+
+
+TRANSFORMS = {
+    'base64': encode_base64,
+    'bytes_repr': bytes_repr,
+}
+
+# Upper bound of the size of transformed content per byte of a file.
+TRANSFORM_EXPANSION = {
+    'base64': 4 / 3,
+    'bytes_repr': 4,
+}
+
+
+def estimate_footprint(size, transform):
+    """Bytes held while a file is transformed and sent.
+
+    That's the file, the transformed text and its copy in the provider request.
+    """
+    if transform is None:
+        return 0
+    return size + 2 * math.ceil(size * TRANSFORM_EXPANSION[transform])
+
+
+def read_file(file):
+    """Content of an uploaded file, or of its excerpts when only those are sent.
+
+    Files are read from the start, they may be sent in more than one format.
+    """
+    if (excerpts := file.__dict__.get('excerpts')) is not None:
+        return excerpts.encode('utf-8')
+    file.file.seek(0)
+    return file.file.read()
+
+
+def get_content_size(file):
+    """Size of the content ``read_file`` returns, without reading it.
+
+    Files uploaded before their size was stored are looked up in the storage.
+    """
+    if (excerpts := file.__dict__.get('excerpts')) is not None:
+        return len(excerpts.encode('utf-8'))
+    return file.size if file.size is not None else file.file.size
+
+
+def transform_attachment(file, transform):
+    """Transformed content of an uploaded file.
+
+    Uses the result of ``AttachmentExecutor.prepare`` when there is one, else the file is read and transformed
+    inline.
+    """
+    results = file.__dict__.setdefault('transformed_content', {})
+    if transform not in results:
+        results[transform] = TRANSFORMS[transform](read_file(file))
+    return results[transform]
+
+
+class AttachmentExecutor:
+    """Run attachment transforms of files over ``inline_max_bytes`` in a pool of ``max_workers``.
+
+    ``executor`` is ``'process'`` or ``'thread'``, threads only help for transforms that release the GIL. At
+    most ``max_in_flight`` transforms run per event loop, more wait for a slot and are counted as queued.
+    """
+
+    def __init__(self, executor='process', max_workers=2, inline_max_bytes=256 * 1024, max_in_flight=8):
+        """Initialize limits, the pool is started on first use."""
+        self.executor = executor
+        self.max_workers = max_workers
+        self.inline_max_bytes = inline_max_bytes
+        self.max_in_flight = max_in_flight
+        self.pool = None
+        self.semaphores = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.max_queued = 0
+        self.inline = 0
+        self.offloaded = 0
+        self.wait_ms = 0.0
+
+    def get_pool(self):
+        """Start the pool."""
+        with self.lock:
+            if self.pool is None:
+                if self.executor == 'process':
+                    self.pool = ProcessPoolExecutor(self.max_workers, mp_context=get_context('spawn'))
+                else:
+                    self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='attachments')
+            return self.pool
+
+    def get_semaphore(self):
+        """Slots of the running loop."""
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    async def run(self, transform, data):
+        """Transform file content, in the pool when it is large."""
+        if len(data) <= self.inline_max_bytes:
+            self.inline += 1
+            return TRANSFORMS[transform](data)
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        queued_at = time.monotonic()
+        waiting = True
+        try:
+            async with self.get_semaphore():
+                waiting = False
+                self.queued -= 1
+                self.wait_ms += (time.monotonic() - queued_at) * 1000
+                self.in_flight += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self.get_pool(), TRANSFORMS[transform], data)
+                finally:
+                    self.in_flight -= 1
+                    self.offloaded += 1
+        finally:
+            if waiting:
+                self.queued -= 1
+
+    async def prepare(self, file, transform):
+        """Read and transform a file, so ``transform_attachment`` doesn't block the loop with it."""
+        results = file.__dict__.setdefault('transformed_content', {})
+        if transform not in results:
+            data = await asyncio.to_thread(read_file, file)
+            results[transform] = await self.run(transform, data)
+
+    def get_stats(self):
+        """Queue depth and counts of transforms."""
+        return {
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'max_queued': self.max_queued,
+            'max_in_flight': self.max_in_flight,
+            'inline': self.inline,
+            'offloaded': self.offloaded,
+            'wait_ms': round(self.wait_ms, 1),
+        }
+
+
+class MemoryBudget:
+    """Byte-weighted semaphore limiting the attachment memory of the requests a worker converts at once.
+
+    Requests that don't fit in ``budget_bytes`` wait in order of arrival for up to ``queue_timeout`` seconds,
+    requests larger than the whole budget are rejected at once.
+    """
+
+    def __init__(self, budget_bytes=512 * 1024 * 1024, queue_timeout=10):
+        """Initialize budget."""
+        self.budget_bytes = budget_bytes
+        self.queue_timeout = queue_timeout
+        self.used_bytes = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self, size):
+        """Reserve ``size`` bytes, return whether they were reserved."""
+        if size <= 0:
+            return True
+        if size > self.budget_bytes:
+            self.rejected += 1
+            return False
+        if not self.waiters and self.used_bytes + size <= self.budget_bytes:
+            self.used_bytes += size
+            self.admitted += 1
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (size, future)
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self.release(size)
+            else:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                self._admit_waiters()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                return False
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self, size):
+        """Return ``size`` reserved bytes."""
+        if size > 0:
+            self.used_bytes -= size
+            self._admit_waiters()
+
+    def _admit_waiters(self):
+        """Reserve memory for the waiting requests that fit, in order."""
+        while self.waiters:
+            size, future = self.waiters[0]
+            if future.done():
+                self.waiters.popleft()
+                continue
+            if self.used_bytes + size > self.budget_bytes:
+                break
+            self.waiters.popleft()
+            self.used_bytes += size
+            future.set_result(None)
+
+    def get_stats(self):
+        """Budget, reserved bytes and counts of requests."""
+        return {
+            'budget_bytes': self.budget_bytes,
+            'used_bytes': self.used_bytes,
+            'queued': len(self.waiters),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
+
+
+class MemoryReservation:
+    """Bytes reserved in a memory budget, returned once however often ``release`` is called."""
+
+    def __init__(self, budget, size):
+        """Initialize reservation."""
+        self.budget = budget
+        self.size = size
+
+    def release(self):
+        """Return the reserved bytes to the budget."""
+        size, self.size = self.size, 0
+        self.budget.release(size)
+
+
+_attachment_executor = None
+_memory_budget = None
+
+
+def get_attachment_executor():
+    """Get the executor configured in ``CHAT_ATTACHMENT_OFFLOAD``.
+
+    Created on first use, so pool processes can import the transforms without settings.
+    """
+    global _attachment_executor
+    if _attachment_executor is None:
+        _attachment_executor = AttachmentExecutor(**settings.CHAT_ATTACHMENT_OFFLOAD)
+    return _attachment_executor
+
+
+def get_memory_budget():
+    """Get the budget configured in ``CHAT_MEMORY_BUDGET``."""
+    global _memory_budget
+    if _memory_budget is None:
+        _memory_budget = MemoryBudget(**settings.CHAT_MEMORY_BUDGET)
+    return _memory_budget
@@ -0,0 +1,385 @@
+"""Backends for running batch completion jobs outside the interactive chat API."""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from chat_completion.api.fastapi.schemas import Message
+from chat_completion.models import BatchJob, BatchJobResult, FileUpload
+from chat_completion.providers import get_provider
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseBatchBackend(ABC):
+    """Base class for batch backends.
+
+    ``run`` starts processing a job. Backends that hand the job over to a provider's batch API set the job to
+    ``SUBMITTED`` and are polled with ``poll`` until it returns ``True``.
+    """
+
+    def __init__(self, job, provider, *args, **kwargs):
+        """Initialize attributes."""
+        super(BaseBatchBackend, self).__init__(*args, **kwargs)
+        self.job = job
+        self.provider = provider
+        self.config = settings.CHAT_BATCH
+
+    def run(self):
+        """Start processing the job."""
+        raise NotImplementedError
+
+    def poll(self):
+        """Check a submitted job and save its results once the provider is done."""
+        return True
+
+    def get_pending_conversations(self):
+        """Get ``(index, messages)`` for conversations of the job without a result yet."""
+        done = set(self.job.results.values_list('index', flat=True))
+        pending = [
+            (index, [Message(**message) for message in conversation])
+            for index, conversation in enumerate(self.job.conversations)
+            if index not in done
+        ]
+        file_ids = {msg.fileId for _, messages in pending for msg in messages if msg.fileId}
+        if file_ids:
+            files = {str(key): file for key, file in FileUpload.objects.in_bulk(file_ids, field_name='uuid').items()}
+            for _, messages in pending:
+                for msg in messages:
+                    msg.file = files.get(msg.fileId)
+        return pending
+
+    def save_results(self, results):
+        """Save ``(index, output, error)`` results in bulk and update job counters."""
+        BatchJobResult.objects.bulk_create(
+            [BatchJobResult(job=self.job, index=index, output=output, error=error) for index, output, error in results],
+            ignore_conflicts=True,
+        )
+        self.job.completed = self.job.results.filter(error='').count()
+        self.job.failed = self.job.results.exclude(error='').count()
+        self.job.save(update_fields=['completed', 'failed', 'updated_at'])
+
+    def set_status(self, status, error=''):
+        """Update job status."""
+        set_job_status(self.job, status, error)
+
+
+class BaseConcurrencyLimiter(ABC):
+    """Base class for limits of the concurrent provider requests of batch jobs.
+
+    Jobs run in event loops of their own, so limiters keep no loop state and waiting requests check for a free
+    slot every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, poll_interval=0.1, **kwargs):
+        """Initialize limiter."""
+        self.poll_interval = poll_interval
+
+    @abstractmethod
+    async def try_acquire(self, key, limit):
+        """Take a slot of ``key`` if fewer than ``limit`` are taken. Return a token for ``release`` or ``None``."""
+
+    @abstractmethod
+    async def release(self, key, token):
+        """Give back a slot."""
+
+    @asynccontextmanager
+    async def slot(self, key, limit):
+        """Hold a slot of ``key`` while the block runs."""
+        while (token := await self.try_acquire(key, limit)) is None:
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            await self.release(key, token)
+
+
+class InMemoryConcurrencyLimiter(BaseConcurrencyLimiter):
+    """Limiter counting the requests of the worker process. Jobs of other Celery worker processes don't count."""
+
+    def __init__(self, **kwargs):
+        """Initialize counts."""
+        super().__init__(**kwargs)
+        self.taken = defaultdict(int)
+        self.lock = threading.Lock()
+
+    async def try_acquire(self, key, limit):
+        """Take a slot."""
+        with self.lock:
+            if self.taken[key] >= limit:
+                return None
+            self.taken[key] += 1
+            return True
+
+    async def release(self, key, token):
+        """Give back a slot."""
+        with self.lock:
+            self.taken[key] -= 1
+
+
+class RedisConcurrencyLimiter(BaseConcurrencyLimiter):
+    """Limiter counting the requests of all workers in Redis.
+
+    Slots are leases that expire after ``lease_timeout`` seconds, so the slots of a worker that died are freed.
+    """
+
+    key_prefix = 'batch-concurrency'
+
+    # KEYS: slots sorted set. ARGV: limit, token, lease timeout.
+    acquire_script = """
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tostring(now))
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], tostring(now + tonumber(ARGV[3])), ARGV[2])
+        redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+        return 1
+    """
+
+    def __init__(self, url='redis://localhost:6379', lease_timeout=600, **kwargs):
+        """Initialize Redis connection and script.
+
+        The client is synchronous, an asyncio client can't be shared by the event loops of several jobs.
+        """
+        import redis
+
+        super().__init__(**kwargs)
+        self.lease_timeout = lease_timeout
+        self.redis = redis.Redis.from_url(url)
+        self._acquire = self.redis.register_script(self.acquire_script)
+
+    async def try_acquire(self, key, limit):
+        """Take a slot."""
+        token = uuid.uuid4().hex
+        acquired = await asyncio.to_thread(
+            self._acquire, keys=[f'{self.key_prefix}:{key}'], args=[limit, token, self.lease_timeout]
+        )
+        return token if acquired else None
+
+    async def release(self, key, token):
+        """Give back a slot."""
+        await asyncio.to_thread(self.redis.zrem, f'{self.key_prefix}:{key}', token)
+
+
+_concurrency_limiter = None
+
+
+def get_concurrency_limiter():
+    """Get the limiter configured in ``CHAT_BATCH['concurrency_limiter']``."""
+    global _concurrency_limiter
+    if _concurrency_limiter is None:
+        config = dict(settings.CHAT_BATCH['concurrency_limiter'])
+        backend = import_string(config.pop('backend'))
+        _concurrency_limiter = backend(**config)
+    return _concurrency_limiter
+
+
+class ConcurrentBatchBackend(BaseBatchBackend):
+    """Run the job in chunks through the provider's regular API.
+
+    At most ``CHAT_BATCH['concurrency']`` requests per provider run at once, across the jobs of all workers that
+    share the concurrency limiter.
+    """
+
+    def get_concurrency(self):
+        """Max concurrent requests for the provider."""
+        concurrency = self.config['concurrency']
+        return concurrency.get(self.provider.provider_name, concurrency['default'])
+
+    async def _complete(self, index, messages):
+        """Complete a single conversation."""
+        async with get_concurrency_limiter().slot(self.provider.provider_name, self.get_concurrency()):
+            try:
+                output = await self.provider.complete(self.provider.build_messages(messages))
+            except Exception as e:
+                logger.error(f"Batch job {self.job.uuid} failed for conversation {index}: {e}")
+                return index, '', str(e) or e.__class__.__name__
+        return index, output, ''
+
+    async def _run(self, pending):
+        """Process pending conversations chunk by chunk."""
+        chunk_size = self.config['chunk_size']
+        for start in range(0, len(pending), chunk_size):
+            results = await asyncio.gather(*[
+                self._complete(index, messages) for index, messages in pending[start:start + chunk_size]
+            ])
+            await asyncio.to_thread(self.save_results, results)
+
+    def run(self):
+        """Complete all pending conversations."""
+        asyncio.run(self._run(self.get_pending_conversations()))
+        self.set_status(BatchJob.COMPLETED)
+
+
+class OpenAIBatchBackend(BaseBatchBackend):
+    """Run the job through the OpenAI Batch API."""
+
+    endpoint = '/v1/chat/completions'
+    pending_statuses = ('validating', 'in_progress', 'finalizing')
+
+    def get_client(self):
+        """Create synchronous OpenAI client."""
+        import openai
+
+        return openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def run(self):
+        """Upload requests and create a provider batch."""
+        client = self.get_client()
+        lines = [
+            json.dumps({
+                'custom_id': str(index),
+                'method': 'POST',
+                'url': self.endpoint,
+                'body': {
+                    'model': self.provider.model,
+                    'messages': self.provider.build_messages(messages),
+                    **self.provider.get_request_params(),
+                },
+            })
+            for index, messages in self.get_pending_conversations()
+        ]
+        batch_file = client.files.create(file=('batch.jsonl', '\n'.join(lines).encode('utf-8')), purpose='batch')
+        batch = client.batches.create(
+            input_file_id=batch_file.id, endpoint=self.endpoint, completion_window='24h'
+        )
+        self.job.provider_batch_id = batch.id
+        self.job.save(update_fields=['provider_batch_id', 'updated_at'])
+        self.set_status(BatchJob.SUBMITTED)
+
+    def _parse_results(self, client, file_id):
+        """Read results from a batch output or error file."""
+        results = []
+        for line in client.files.content(file_id).text.splitlines():
+            if not line:
+                continue
+            data = json.loads(line)
+            response = data.get('response') or {}
+            if data.get('error') or response.get('status_code') != 200:
+                error = data.get('error') or response.get('body', {}).get('error') or 'Request failed'
+                results.append((int(data['custom_id']), '', json.dumps(error)))
+            else:
+                body = response['body']
+                if (usage := body.get('usage')):
+                    self.provider.record_usage(
+                        usage['prompt_tokens'], usage['completion_tokens'],
+                        cache_read_tokens=(usage.get('prompt_tokens_details') or {}).get('cached_tokens'),
+                    )
+                output = body['choices'][0]['message']['content'] or ''
+                results.append((int(data['custom_id']), output, ''))
+        return results
+
+    def poll(self):
+        """Save results once the provider batch has finished."""
+        client = self.get_client()
+        batch = client.batches.retrieve(self.job.provider_batch_id)
+        if batch.status in self.pending_statuses:
+            return False
+
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.extend(self._parse_results(client, file_id))
+        self.save_results(results)
+        if batch.status == 'completed':
+            self.set_status(BatchJob.COMPLETED)
+        else:
+            self.set_status(BatchJob.FAILED, f'Provider batch {batch.status}')
+        return True
+
+
+class AnthropicBatchBackend(BaseBatchBackend):
+    """Run the job through the Anthropic Message Batches API."""
+
+    def get_client(self):
+        """Create synchronous Anthropic client."""
+        import anthropic
+
+        return anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+
+    def run(self):
+        """Create a provider batch."""
+        batch = self.get_client().messages.batches.create(requests=[
+            {
+                'custom_id': str(index),
+                'params': {
+                    'model': self.provider.model,
+                    'max_tokens': self.provider.max_tokens,
+                    'messages': self.provider.build_messages(messages),
+                    **self.provider.params,
+                },
+            }
+            for index, messages in self.get_pending_conversations()
+        ])
+        self.job.provider_batch_id = batch.id
+        self.job.save(update_fields=['provider_batch_id', 'updated_at'])
+        self.set_status(BatchJob.SUBMITTED)
+
+    def poll(self):
+        """Save results once the provider batch has ended."""
+        client = self.get_client()
+        batch = client.messages.batches.retrieve(self.job.provider_batch_id)
+        if batch.processing_status != 'ended':
+            return False
+
+        results = []
+        for entry in client.messages.batches.results(self.job.provider_batch_id):
+            if entry.result.type == 'succeeded':
+                self.provider.record_anthropic_usage(entry.result.message.usage)
+                output = ''.join(block.text for block in entry.result.message.content if block.type == 'text')
+                results.append((int(entry.custom_id), output, ''))
+            else:
+                results.append((int(entry.custom_id), '', entry.result.type))
+        self.save_results(results)
+        self.set_status(BatchJob.COMPLETED)
+        return True
+
+
+class StubBatchBackend(BaseBatchBackend):
+    """Local imitation of a provider batch API for development and tests."""
+
+    def run(self):
+        """Pretend to submit the job to a provider."""
+        self.job.provider_batch_id = f'stub-{self.job.uuid}'
+        self.job.save(update_fields=['provider_batch_id', 'updated_at'])
+        self.set_status(BatchJob.SUBMITTED)
+
+    def poll(self):
+        """Answer all conversations with the stub provider."""
+        results = [
+            (index, asyncio.run(self.provider.complete(self.provider.build_messages(messages))), '')
+            for index, messages in self.get_pending_conversations()
+        ]
+        self.save_results(results)
+        self.set_status(BatchJob.COMPLETED)
+        return True
+
+
+def set_job_status(job, status, error=''):
+    """Update job status."""
+    job.status = status
+    job.error = error
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def get_batch_backend(job):
+    """Get the batch backend configured for the provider of the job's model.
+
+    Raises ``ValueError`` when the model was removed since the job was created.
+    """
+    provider = get_provider(job.model, user_id=job.user_id)
+    if provider is None:
+        raise ValueError(f"Model {job.model} is not available")
+    backend = settings.CHAT_BATCH['backends'].get(provider.provider_name, settings.CHAT_BATCH['default_backend'])
+    return import_string(backend)(job, provider)
@@ -0,0 +1,112 @@
+"""Stores of idempotency keys, so retried requests return the original result instead of running again."""
+
+import json
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseIdempotencyStore(ABC):
+    """Base class for idempotency key stores.
+
+    A key is claimed by the first request using it and holds a small JSON record of that request for ``ttl``
+    seconds.
+    """
+
+    def __init__(self, ttl=300, **kwargs):
+        """Initialize key expiry."""
+        self.ttl = ttl
+
+    @abstractmethod
+    async def claim(self, key, record):
+        """Store ``record`` if the key is free and return ``None``, else return the key's record."""
+
+    @abstractmethod
+    async def set(self, key, record):
+        """Replace the record of a claimed key."""
+
+    @abstractmethod
+    async def release(self, key):
+        """Free a key, so the request can be retried."""
+
+
+class InMemoryIdempotencyStore(BaseIdempotencyStore):
+    """Keys kept in the worker process. Retries are only recognized on the worker that served the request."""
+
+    purge_every = 1000
+
+    def __init__(self, **kwargs):
+        """Initialize keys."""
+        super().__init__(**kwargs)
+        self.keys = {}
+        self.calls = 0
+
+    def _purge_expired(self, now):
+        """Drop expired keys."""
+        self.keys = {key: entry for key, entry in self.keys.items() if entry[1] > now}
+
+    async def claim(self, key, record):
+        """Claim a key."""
+        now = time.monotonic()
+        self.calls += 1
+        if self.calls % self.purge_every == 0:
+            self._purge_expired(now)
+        entry = self.keys.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        self.keys[key] = (record, now + self.ttl)
+        return None
+
+    async def set(self, key, record):
+        """Replace the record of a key."""
+        self.keys[key] = (record, time.monotonic() + self.ttl)
+
+    async def release(self, key):
+        """Free a key."""
+        self.keys.pop(key, None)
+
+
+class RedisIdempotencyStore(BaseIdempotencyStore):
+    """Keys stored in Redis, claimed with ``SET NX`` so retries are recognized on any node."""
+
+    key_prefix = 'idempotency'
+
+    def __init__(self, url='redis://localhost:6379', **kwargs):
+        """Initialize Redis connection."""
+        from redis import asyncio as aioredis
+
+        super().__init__(**kwargs)
+        self.redis = aioredis.from_url(url)
+
+    async def claim(self, key, record):
+        """Claim a key."""
+        key = f'{self.key_prefix}:{key}'
+        while True:
+            if await self.redis.set(key, json.dumps(record), nx=True, ex=self.ttl):
+                return None
+            existing = await self.redis.get(key)
+            if existing is not None:
+                return json.loads(existing)
+
+    async def set(self, key, record):
+        """Replace the record of a key."""
+        await self.redis.set(f'{self.key_prefix}:{key}', json.dumps(record), ex=self.ttl)
+
+    async def release(self, key):
+        """Free a key."""
+        await self.redis.delete(f'{self.key_prefix}:{key}')
+
+
+_idempotency_store = None
+
+
+def get_idempotency_store():
+    """Get the store configured in ``CHAT_IDEMPOTENCY``."""
+    global _idempotency_store
+    if _idempotency_store is None:
+        config = dict(settings.CHAT_IDEMPOTENCY)
+        backend = import_string(config.pop('backend'))
+        _idempotency_store = backend(**config)
+    return _idempotency_store
@@ -0,0 +1,157 @@
+"""Structured logging for the chat API.
+
+Records are written as JSON lines from a background thread, so logging never blocks the event loop on I/O,
+and carry the id of the request they were logged in. Conversations attached to records are truncated and
+their attachments replaced with references.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+
+request_id = ContextVar('request_id', default='-')
+
+# Attributes every log record has, anything else was passed with ``extra``.
+RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'request_id'}
+
+# Keys of base64 encoded attachments in provider messages.
+ATTACHMENT_KEYS = {'data'}
+
+
+class RequestIdFilter(logging.Filter):
+    """Add the id of the current request to records."""
+
+    def filter(self, record):
+        """Set ``request_id`` of record."""
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single line JSON objects including their ``extra`` fields."""
+
+    def format(self, record):
+        """Format record."""
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class BlockingQueueListener(QueueListener):
+    """Queue listener that waits for room in a full queue to stop, so queued records are still written."""
+
+    def enqueue_sentinel(self):
+        """Queue the stop marker after the queued records."""
+        self.queue.put(self._sentinel)
+
+
+class QueueLogHandler(QueueHandler):
+    """Put records on a bounded queue that a background thread writes with a stream handler.
+
+    When the queue is full records are dropped and counted in ``dropped`` instead of waiting. Threads don't
+    survive a fork, so every process starts its own thread with its first record and forked processes get a
+    new queue. Closing the handler, which ``logging.shutdown`` does, writes the queued records.
+    """
+
+    def __init__(self, queue_size=10000):
+        """Initialize queue, the thread is started by the first record."""
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.target = logging.StreamHandler()
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        """Forget the parent's thread and queue, its records are written by the parent."""
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        """Start the thread writing records of this process."""
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.listener = BlockingQueueListener(self.queue, self.target)
+                self.listener.start()
+                self.pid = os.getpid()
+
+    def close(self):
+        """Write queued records and stop the thread."""
+        with self.start_lock:
+            listener, self.listener, self.pid = self.listener, None, None
+        if listener is not None:
+            listener.stop()
+        super().close()
+
+    def setFormatter(self, fmt):
+        """Records are formatted by the writing thread."""
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Keep records as they are, the queue doesn't leave the process."""
+        return record
+
+    def enqueue(self, record):
+        """Queue record without blocking."""
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def truncate_value(value, max_field_chars):
+    """Shorten long strings and replace attachment data with its size."""
+    if isinstance(value, dict):
+        return {
+            key: f'<attachment: {len(item)} chars>' if key in ATTACHMENT_KEYS and isinstance(item, str)
+            else truncate_value(item, max_field_chars)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [truncate_value(item, max_field_chars) for item in value]
+    if isinstance(value, str) and len(value) > max_field_chars:
+        return f'{value[:max_field_chars]}... <{len(value)} chars>'
+    return value
+
+
+def truncate_messages(messages, max_chars=None, max_field_chars=None):
+    """Prepare provider messages for a log record.
+
+    Every message is truncated and only the latest messages that fit in ``max_chars`` of JSON are kept.
+    """
+    config = settings.CHAT_LOG
+    max_chars = max_chars or config['max_payload_chars']
+    max_field_chars = max_field_chars or config['max_field_chars']
+
+    kept = []
+    size = 0
+    for message in reversed(messages):
+        message = truncate_value(message, max_field_chars)
+        size += len(json.dumps(message, default=str))
+        if kept and size > max_chars:
+            break
+        kept.append(message)
+    kept.reverse()
+    omitted = len(messages) - len(kept)
+    return [{'omitted_messages': omitted}, *kept] if omitted else kept
@@ -0,0 +1,99 @@
+"""Detection of code that blocks the event loop.
+
+A heartbeat task sleeps on the loop in short intervals and measures how late it wakes up. A watchdog thread
+notices when the heartbeat stops and records the stack of the loop's thread, which shows the blocking call.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+BlockingEvent = namedtuple('BlockingEvent', ['lag_ms', 'stack'])
+
+
+class LoopMonitor:
+    """Measure event loop lag and report blocks longer than ``threshold_ms`` with a stack trace.
+
+    Meant for development and tests, the monitor starts on the first request once ``enabled``.
+    """
+
+    def __init__(self, enabled=False, threshold_ms=100, interval_ms=20, max_events=100):
+        """Initialize monitor."""
+        self.enabled = enabled
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.events = deque(maxlen=max_events)
+        self.lags = deque(maxlen=1000)
+        self.loop = None
+        self.loop_thread_id = None
+        self.last_beat = None
+        self.blocked_stack = None
+        self.watchdog = None
+
+    def ensure_started(self):
+        """Start monitoring the running loop."""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        loop.create_task(self._heartbeat(loop))
+        if self.watchdog is None:
+            self.watchdog = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+            self.watchdog.start()
+
+    def clear(self):
+        """Forget recorded events and lags."""
+        self.events.clear()
+        self.lags.clear()
+
+    async def _heartbeat(self, loop):
+        """Measure how late the loop wakes up from short sleeps."""
+        while self.loop is loop:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0)
+            self.last_beat = now
+            self.lags.append((now, lag))
+            if lag >= self.threshold:
+                self._record_event(lag)
+
+    def _watch(self):
+        """Capture the loop thread's stack while the heartbeat is late."""
+        while True:
+            time.sleep(self.interval)
+            if not self.enabled or self.last_beat is None or self.blocked_stack is not None:
+                continue
+            if time.monotonic() - self.last_beat > self.threshold:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                self.blocked_stack = ''.join(traceback.format_stack(frame)) if frame else ''
+
+    def _record_event(self, lag):
+        """Record and log a block."""
+        stack, self.blocked_stack = self.blocked_stack, None
+        event = BlockingEvent(round(lag * 1000, 1), stack or 'Stack not captured.')
+        self.events.append(event)
+        logger.warning(f"Event loop blocked for {event.lag_ms} ms.", extra={'stack': event.stack})
+
+    def max_lag_since(self, started_at):
+        """Highest loop lag in ms measured since ``started_at``."""
+        lag = 0
+        for measured_at, value in reversed(self.lags):
+            if measured_at < started_at:
+                break
+            lag = max(lag, value)
+        return round(lag * 1000, 1)
+
+
+loop_monitor = LoopMonitor(**settings.CHAT_LOOP_MONITOR)
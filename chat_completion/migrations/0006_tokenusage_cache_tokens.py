@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_completion', '0005_tokenusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tokenusage',
+            name='cache_read_tokens',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tokenusage',
+            name='cache_write_tokens',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tokenusage',
+            name='ttft_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tokenusage',
+            name='ttft_ms_total',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
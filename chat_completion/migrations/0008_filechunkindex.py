@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-19 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_completion', '0007_conversationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileChunkIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunks', models.JSONField()),
+                ('index', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chunk_index', to='chat_completion.fileupload')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_completion', '0008_filechunkindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
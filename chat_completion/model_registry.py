@@ -0,0 +1,111 @@
+"""In-memory snapshot of the chat models configured in the database."""
+
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from payments.models import AIModel
+
+
+logger = logging.getLogger(__name__)
+
+ModelConfig = namedtuple(
+    'ModelConfig', ['name', 'provider', 'upstream_model', 'max_tokens', 'context_window', 'params']
+)
+
+
+class ModelRegistry:
+    """Keep active ``AIModel`` rows in memory so model lookups don't query the database.
+
+    The registry checks the table's version, its row count and last update time, at most once every
+    ``refresh_interval`` seconds and reloads the models when it changed. Until the table has any rows the
+    registry serves the ``default_models``.
+    """
+
+    def __init__(self, default_models, refresh_interval=30):
+        """Initialize snapshot with default models."""
+        self.default_models = default_models
+        self.refresh_interval = refresh_interval
+        self.models = default_models
+        self.version = None
+        self.checked_at = 0
+        self._refresh_task = None
+
+    def _build_snapshot(self, version, rows):
+        """Swap in the models loaded from the database."""
+        self.version = version
+        if not version['count']:
+            self.models = self.default_models
+            return
+        self.models = {
+            row.name: ModelConfig(
+                row.name, row.provider, row.upstream_model, row.max_tokens, row.context_window, row.stream_params
+            )
+            for row in rows
+        }
+        logger.info(f"Loaded {len(self.models)} chat models.")
+
+    def refresh_sync(self):
+        """Reload models if the table changed."""
+        self.checked_at = time.monotonic()
+        version = AIModel.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        if version != self.version:
+            self._build_snapshot(version, list(AIModel.objects.filter(is_active=True)))
+
+    async def refresh(self):
+        """Reload models if the table changed."""
+        self.checked_at = time.monotonic()
+        try:
+            version = await AIModel.objects.aaggregate(count=Count('id'), updated_at=Max('updated_at'))
+            if version != self.version:
+                self._build_snapshot(version, [row async for row in AIModel.objects.filter(is_active=True)])
+        except Exception as e:
+            logger.error(f"Could not refresh chat models: {e}")
+
+    def maybe_refresh(self):
+        """Start a refresh when the snapshot is older than ``refresh_interval``.
+
+        In async code the refresh runs in the background and the current snapshot is used meanwhile.
+        """
+        if time.monotonic() - self.checked_at < self.refresh_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.refresh_sync()
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self.checked_at = time.monotonic()
+            self._refresh_task = loop.create_task(self.refresh())
+
+    def get(self, name):
+        """Get model config by client model name."""
+        self.maybe_refresh()
+        return self.models.get(name)
+
+    def all(self):
+        """Get all model configs."""
+        self.maybe_refresh()
+        return self.models
+
+
+# Models served before any model is added in the database.
+DEFAULT_MODELS = {
+    config.name: config
+    for config in [
+        ModelConfig('gpt-4', 'openai', 'gpt-4', None, None, {}),
+        ModelConfig('gpt-4o', 'openai', 'gpt-4o', None, None, {}),
+        ModelConfig('gpt-4o-mini', 'openai', 'gpt-4o-mini', None, None, {}),
+        ModelConfig('gpt-o3-mini', 'openai', 'o3-mini', None, None, {}),
+        ModelConfig('gpt-o3-mini-high', 'openai', 'o3-mini-high', None, None, {}),
+        ModelConfig('deepseek', 'deepseek', 'deepseek-chat', None, None, {}),
+        ModelConfig('gemini', 'gemini', 'gemini-2.0-flash', None, None, {}),
+        ModelConfig('claude', 'anthropic', 'claude-3-7-sonnet-latest', 1024, None, {}),
+    ]
+}
+
+model_registry = ModelRegistry(DEFAULT_MODELS, settings.CHAT_MODEL_REGISTRY_REFRESH_INTERVAL)
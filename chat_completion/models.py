@@ -1,7 +1,11 @@
 import uuid
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import NullIf
+from django.utils.translation import gettext_lazy as _
 
 from chat_completion.utils import get_upload_path
+from core.models import TimeStampedModel
 
 
 class FileUpload(models.Model):
@@ -9,8 +13,132 @@ class FileUpload(models.Model):
     file = models.FileField(upload_to=get_upload_path)
     original_name = models.CharField(max_length=255)
     content_type = models.CharField(max_length=150)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     @property
     def extension(self):
         return self.original_name.split('.')[-1]
+
+
+class FileChunkIndex(models.Model):
+    """BM25 index over the chunks of a text upload, to send only the chunks relevant to a question."""
+
+    upload = models.OneToOneField(FileUpload, related_name='chunk_index', on_delete=models.CASCADE)
+    chunks = models.JSONField()
+    index = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """String representation of chunk index."""
+        return f'{self.upload_id} - {len(self.chunks)} chunks'
+
+
+class BatchJob(TimeStampedModel):
+    """Offline job running completions for many conversations."""
+
+    PENDING = 0
+    RUNNING = 1
+    SUBMITTED = 2
+    COMPLETED = 3
+    FAILED = 4
+
+    STATUSES = [
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (SUBMITTED, _('Submitted to provider')),
+        (COMPLETED, _('Completed')),
+        (FAILED, _('Failed')),
+    ]
+
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='batch_jobs', on_delete=models.CASCADE)
+    model = models.CharField(max_length=50)
+    conversations = models.JSONField()
+    status = models.PositiveSmallIntegerField(choices=STATUSES, default=PENDING)
+    total = models.PositiveIntegerField()
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    provider_batch_id = models.CharField(max_length=100, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        """String representation of batch job."""
+        return f'{self.uuid} - {self.model} - {self.get_status_display()}'
+
+
+class BatchJobResult(models.Model):
+    """Completion for a single conversation of a batch job."""
+
+    job = models.ForeignKey(BatchJob, related_name='results', on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    output = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        """Meta class for BatchJobResult."""
+
+        ordering = ['index']
+        unique_together = [('job', 'index')]
+
+
+class TokenUsage(models.Model):
+    """Tokens used by a user with a model on a day.
+
+    Usage is written in bulk, so there can be several rows for the same user, model and day.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='token_usage', on_delete=models.CASCADE)
+    model = models.CharField(max_length=100)
+    day = models.DateField()
+    requests = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    cache_read_tokens = models.PositiveBigIntegerField(default=0)
+    cache_write_tokens = models.PositiveBigIntegerField(default=0)
+    ttft_ms_total = models.PositiveBigIntegerField(default=0)
+    ttft_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Meta class for TokenUsage."""
+
+        indexes = [models.Index(fields=['user', 'day'])]
+
+    def __str__(self):
+        """String representation of token usage."""
+        return f'{self.user_id} - {self.model} - {self.day}'
+
+    @staticmethod
+    def get_daily_usage(**filters):
+        """Usage summed per user, model and day."""
+        return TokenUsage.objects.filter(**filters).values('user', 'model', 'day').annotate(
+            total_requests=models.Sum('requests'),
+            total_input_tokens=models.Sum('input_tokens'),
+            total_output_tokens=models.Sum('output_tokens'),
+            total_cache_read_tokens=models.Sum('cache_read_tokens'),
+            total_cache_write_tokens=models.Sum('cache_write_tokens'),
+            average_ttft_ms=models.Sum('ttft_ms_total') / NullIf(models.Sum('ttft_count'), 0),
+        ).order_by('day', 'user', 'model')
+
+
+class ConversationSummary(TimeStampedModel):
+    """Summary of the first ``watermark`` messages of a conversation.
+
+    Conversations aren't stored, so a summary is looked up by ``prefix_hash``, a hash chained over the messages
+    it summarizes.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='conversation_summaries', on_delete=models.CASCADE)
+    prefix_hash = models.CharField(max_length=64)
+    watermark = models.PositiveIntegerField()
+    summary = models.TextField()
+    model = models.CharField(max_length=100)
+
+    class Meta:
+        """Meta class for ConversationSummary."""
+
+        unique_together = [('user', 'prefix_hash')]
+
+    def __str__(self):
+        """String representation of conversation summary."""
+        return f'{self.user_id} - {self.prefix_hash[:12]} - {self.watermark}'
@@ -0,0 +1,43 @@
+"""Chat completion providers.
+
+Provider modules, and the SDKs they use, are imported the first time a provider is needed, so workers only
+load the SDKs of the providers they actually serve.
+"""
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from chat_completion.model_registry import model_registry
+
+
+STUB_MODEL = 'stub'
+
+_provider_classes = {}
+
+
+def get_provider_class(provider_name):
+    """Import provider class configured in ``CHAT_PROVIDERS``."""
+    if provider_name not in _provider_classes:
+        _provider_classes[provider_name] = import_string(settings.CHAT_PROVIDERS[provider_name])
+    return _provider_classes[provider_name]
+
+
+def preload_providers(provider_names=None):
+    """Import providers up front, by default the ones in ``CHAT_PROVIDER_PRELOAD``."""
+    for provider_name in settings.CHAT_PROVIDER_PRELOAD if provider_names is None else provider_names:
+        get_provider_class(provider_name)
+
+
+def get_provider(model, user_id=None):
+    """Get provider instance for a client model name or ``None`` if the model is unknown.
+
+    Token usage of the provider's completions is recorded for ``user_id``.
+    """
+    if model == STUB_MODEL and settings.CHAT_STUB_MODEL_ENABLED:
+        return get_provider_class('stub')(STUB_MODEL, user_id=user_id)
+    config = model_registry.get(model)
+    if config is None:
+        return None
+    return get_provider_class(config.provider)(
+        config.upstream_model, max_tokens=config.max_tokens, user_id=user_id, params=config.params
+    )
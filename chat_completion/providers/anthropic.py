@@ -0,0 +1,92 @@
+"""Anthropic chat completion provider."""
+
+from anthropic import AsyncAnthropic
+from django.conf import settings
+
+from chat_completion.providers.base_provider import BaseProvider
+
+
+class Anthropic(BaseProvider):
+    """Chat completions with Claude models."""
+
+    provider_name = 'anthropic'
+    display_name = 'Claude'
+    default_max_tokens = 1024
+
+    def get_client(self):
+        """Create Anthropic client."""
+        return AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
+
+    def add_cache_breakpoint(self, provider_messages):
+        """Mark the end of the conversation before the latest message as a prompt cache breakpoint.
+
+        The earlier turns are sent unchanged on every request, so the next turn reads them from the cache
+        instead of paying full input price and prefill time for them. The marked message is copied, converted
+        messages are shared through the message cache.
+        """
+        if len(provider_messages) < 2:
+            return provider_messages
+        prefix_end = provider_messages[-2]
+        content = [*prefix_end['content'][:-1], {**prefix_end['content'][-1], 'cache_control': {'type': 'ephemeral'}}]
+        return [*provider_messages[:-2], {**prefix_end, 'content': content}, provider_messages[-1]]
+
+    def record_anthropic_usage(self, usage):
+        """Record usage including prompt cache reads and writes."""
+        self.record_usage(
+            usage.input_tokens, usage.output_tokens,
+            cache_read_tokens=usage.cache_read_input_tokens, cache_write_tokens=usage.cache_creation_input_tokens,
+        )
+
+    def build_messages(self, messages):
+        """Convert messages to Anthropic format with a prompt cache breakpoint."""
+        return self.add_cache_breakpoint(super().build_messages(messages))
+
+    def get_attachment_transform(self, file):
+        """Images are sent base64 encoded, other files as their bytes."""
+        return 'base64' if 'image' in file.content_type else 'bytes_repr'
+
+    def translate_message(self, msg):
+        """Convert a message to Anthropic format."""
+        return {
+            "role": 'user' if msg.isUser else 'assistant',
+            "content": [
+                {"type": "text", "text": msg.text or '<no text>'},
+                *([{
+                    "type": "image",
+                    "source": {
+                        'type': 'base64',
+                        'media_type': file.content_type,
+                        'data': self.read_attachment(file)
+                    }}]
+                    if ((file := msg.file) and 'image' in file.content_type) else []),
+                *([{
+                    "type": "text",
+                    "text": f'user uploaded a file named: {file.original_name}, file content in bytes: '
+                            f'{self.read_attachment(file)}'}]
+                    if ((file := msg.file) and 'image' not in file.content_type) else [])
+            ]
+        }
+
+    async def stream_text(self, provider_messages):
+        """Stream response from Anthropic."""
+        async with self.client.messages.stream(
+            max_tokens=self.max_tokens,
+            messages=provider_messages,
+            model=self.model,
+            **self.params,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+            self.record_anthropic_usage(message.usage)
+
+    async def complete(self, provider_messages):
+        """Get full response from Anthropic."""
+        message = await self.client.messages.create(
+            max_tokens=self.max_tokens,
+            messages=provider_messages,
+            model=self.model,
+            **self.params,
+        )
+        self.record_anthropic_usage(message.usage)
+        return ''.join(block.text for block in message.content if block.type == 'text')
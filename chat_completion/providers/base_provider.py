@@ -0,0 +1,153 @@
+"""Base chat completion provider."""
+
+import logging
+import time
+from abc import ABC
+
+from chat_completion.attachments import (
+    estimate_footprint, get_attachment_executor, get_content_size, transform_attachment,
+)
+from chat_completion.log import truncate_messages
+from chat_completion.providers.message_cache import get_message_key, message_cache
+from chat_completion.routing import model_router
+from chat_completion.usage import usage_recorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseProvider(ABC):
+    """Base class for implementing chat completion providers."""
+
+    provider_name = ''
+    display_name = ''
+    error_message = "Couldn't get a response. If this persists, please contact support."
+    default_max_tokens = None
+
+    def __init__(self, model, max_tokens=None, user_id=None, params=None, *args, **kwargs):
+        """Initialize attributes.
+
+        ``max_tokens`` of ``None`` uses the provider's default and ``params`` are extra request parameters.
+        """
+        super(BaseProvider, self).__init__(*args, **kwargs)
+        self.model = model
+        self.max_tokens = max_tokens or self.default_max_tokens
+        self.params = params or {}
+        self.user_id = user_id
+        self.usage = None
+        self.ttft_ms = None
+        self.error = None
+        self.skip_cache = False
+        self._client = None
+
+    @property
+    def client(self):
+        """Create the SDK client on first use."""
+        if self._client is None:
+            self._client = self.get_client()
+        return self._client
+
+    def reset(self):
+        """Clear the state of the previous request so the provider and its client can serve another one."""
+        self.usage = None
+        self.ttft_ms = None
+        self.error = None
+
+    def record_usage(self, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
+        """Record the token usage reported by the provider for the user of this request.
+
+        Time to first token of streamed responses is recorded with it to compare against prompt cache hits.
+        """
+        self.usage = {
+            'input_tokens': input_tokens or 0,
+            'output_tokens': output_tokens or 0,
+            'cache_read_tokens': cache_read_tokens or 0,
+            'cache_write_tokens': cache_write_tokens or 0,
+        }
+        if self.ttft_ms is not None:
+            self.usage.update(ttft_ms_total=self.ttft_ms, ttft_count=1)
+        if self.user_id is not None:
+            usage_recorder.record(self.user_id, self.model, **self.usage)
+
+    def get_client(self):
+        """Create async SDK client for provider."""
+        raise NotImplementedError
+
+    def build_messages(self, messages):
+        """Convert chat messages to the provider's message format, reusing messages converted on earlier turns."""
+        return [self.get_provider_message(msg) for msg in messages]
+
+    def get_attachment_transform(self, file):
+        """Transform in ``attachments.TRANSFORMS`` the provider message of a file needs, or ``None``."""
+        return None
+
+    def read_attachment(self, file):
+        """Content of a file for the provider message."""
+        return transform_attachment(file, self.get_attachment_transform(file))
+
+    def estimate_attachment_bytes(self, messages):
+        """Memory converting and sending the files of messages takes, in bytes."""
+        files = {msg.file.id: msg.file for msg in messages if msg.file is not None}
+        return sum(
+            estimate_footprint(get_content_size(file), transform)
+            for file in files.values() if (transform := self.get_attachment_transform(file)) is not None
+        )
+
+    async def prepare_attachments(self, messages):
+        """Transform the files of messages that aren't converted yet, large ones outside the event loop."""
+        executor = get_attachment_executor()
+        for msg in messages:
+            if msg.file is None or (transform := self.get_attachment_transform(msg.file)) is None:
+                continue
+            if message_cache.get((self.provider_name, get_message_key(msg))) is None:
+                await executor.prepare(msg.file, transform)
+
+    def get_provider_message(self, msg):
+        """Get a converted message from the cache or convert and cache it."""
+        key = (self.provider_name, get_message_key(msg))
+        provider_message = message_cache.get(key)
+        if provider_message is None:
+            self.skip_cache = False
+            provider_message = self.translate_message(msg)
+            if not self.skip_cache:
+                message_cache.set(key, provider_message)
+        return provider_message
+
+    def translate_message(self, msg):
+        """Convert a chat message to the provider's message format.
+
+        Set ``skip_cache`` for a message that must be converted again on the next turn, e.g. one with a placeholder
+        for a file that couldn't be read.
+        """
+        raise NotImplementedError
+
+    async def stream_text(self, provider_messages):
+        """Yield response text chunks from the provider."""
+        raise NotImplementedError
+        yield
+
+    async def complete(self, provider_messages):
+        """Get the full response text from the provider without streaming."""
+        raise NotImplementedError
+
+    async def stream(self, provider_messages):
+        """Yield response text chunks and replace provider errors with a generic message."""
+        started_at = time.monotonic()
+        try:
+            async for text in self.stream_text(provider_messages):
+                if text and self.ttft_ms is None:
+                    self.ttft_ms = int((time.monotonic() - started_at) * 1000)
+                yield text
+        except GeneratorExit:
+            logger.info(f"Client disconnected, stopping {self.display_name} stream.")
+            raise
+        except Exception as e:
+            self.error = e
+            model_router.record(self.provider_name, self.model, self.ttft_ms, error=True)
+            logger.error(
+                f"{self.display_name} streaming error: {e}",
+                extra={'model': self.model, 'user_id': self.user_id, 'messages': truncate_messages(provider_messages)},
+            )
+            yield self.error_message
+        else:
+            model_router.record(self.provider_name, self.model, self.ttft_ms)
@@ -0,0 +1,47 @@
+"""DeepSeek chat completion provider."""
+
+from django.conf import settings
+from openai import AsyncOpenAI
+
+from chat_completion.providers.openai import OpenAI
+
+
+class DeepSeek(OpenAI):
+    """Chat completions with DeepSeek through its OpenAI compatible API."""
+
+    provider_name = 'deepseek'
+    display_name = 'DeepSeek'
+
+    def record_openai_usage(self, usage):
+        """Record usage including prompt tokens served from DeepSeek's context cache."""
+        self.record_usage(
+            usage.prompt_tokens, usage.completion_tokens,
+            cache_read_tokens=getattr(usage, 'prompt_cache_hit_tokens', 0),
+        )
+
+    def get_client(self):
+        """Create DeepSeek client."""
+        return AsyncOpenAI(api_key=settings.DEEPSEEK_API_KEY, base_url='https://api.deepseek.com')
+
+    def get_attachment_transform(self, file):
+        """Images are sent as URLs, other files base64 encoded."""
+        return None if 'image' in file.content_type else 'base64'
+
+    def translate_message(self, msg):
+        """Flatten message content to a simple string for DeepSeek."""
+        content_parts = [msg.text]
+        if (file := msg.file):
+            if 'image' in file.content_type:
+                content_parts.append(f"[User uploaded an image: {file.file.url}]")
+            else:
+                try:
+                    file_content = self.read_attachment(file)
+                    content_parts.append(f"[File content: {file_content}, mime_type: {file.content_type}]")
+                except Exception as e:
+                    content_parts.append(f"[Could not read file: {str(e)}]")
+                    self.skip_cache = True
+
+        return {
+            "role": 'user' if msg.isUser else 'assistant',
+            "content": "\n".join(content_parts)  # Combine text + file info
+        }
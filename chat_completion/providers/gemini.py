@@ -0,0 +1,73 @@
+"""Google Gemini chat completion provider."""
+
+from django.conf import settings
+from google import genai
+
+from chat_completion.providers.base_provider import BaseProvider
+
+
+class Gemini(BaseProvider):
+    """Chat completions with Gemini models."""
+
+    provider_name = 'gemini'
+    display_name = 'Gemini'
+
+    def get_config(self):
+        """Generation config for requests."""
+        if self.max_tokens:
+            return {'max_output_tokens': self.max_tokens, **self.params}
+        return self.params or None
+
+    def record_gemini_usage(self, usage):
+        """Record usage including tokens served from cached content."""
+        self.record_usage(
+            usage.prompt_token_count, usage.candidates_token_count,
+            cache_read_tokens=usage.cached_content_token_count,
+        )
+
+    def get_client(self):
+        """Create Gemini client."""
+        return genai.Client(api_key=settings.GEMINI_API_KEY).aio
+
+    def get_attachment_transform(self, file):
+        """Files are sent base64 encoded."""
+        return 'base64'
+
+    def translate_message(self, msg):
+        """Convert a message to Gemini format."""
+        return {
+            "role": 'user' if msg.isUser else 'assistant',
+            "parts": [
+                {"text": msg.text or ' '},
+                *([
+                    {"text": f'user uploaded a file named: {msg.file.original_name}'}]
+                    if msg.file
+                    else []),
+                *([
+                    {"inline_data": {
+                        "data": self.read_attachment(msg.file),
+                        "mime_type": msg.file.content_type,
+                    }}] if msg.file else [])
+            ]
+        }
+
+    async def stream_text(self, provider_messages):
+        """Stream response from Gemini."""
+        response = await self.client.models.generate_content_stream(
+            model=self.model, contents=provider_messages, config=self.get_config()
+        )
+        usage = None
+        async for chunk in response:
+            usage = chunk.usage_metadata or usage
+            yield chunk.text
+        if usage:
+            self.record_gemini_usage(usage)
+
+    async def complete(self, provider_messages):
+        """Get full response from Gemini."""
+        response = await self.client.models.generate_content(
+            model=self.model, contents=provider_messages, config=self.get_config()
+        )
+        if response.usage_metadata:
+            self.record_gemini_usage(response.usage_metadata)
+        return response.text or ''
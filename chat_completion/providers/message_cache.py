@@ -0,0 +1,80 @@
+"""Bounded cache of chat messages already converted to a provider's format."""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def get_message_key(msg):
+    """Content of a message that its provider format depends on.
+
+    The cache dict hashes the key, a hit compares the text itself, so different messages can't collide. The
+    text is the same string object the converted message holds, so keys take no extra memory. Files sent as
+    excerpts are keyed by the excerpts too, they depend on the question of their turn.
+    """
+    file = msg.file
+    if file is None:
+        return msg.isUser, None, msg.text
+    return msg.isUser, (file.uuid, file.__dict__.get('excerpts')), msg.text
+
+
+def get_size(value):
+    """Approximate size of a provider message in bytes, counting its strings."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(get_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(get_size(item) for item in value)
+    return 8
+
+
+class MessageCache:
+    """LRU of provider messages, limited to ``max_entries`` messages and about ``max_bytes`` of content.
+
+    Every turn of a chat sends the whole history, so the earlier messages, including their base64 encoded
+    attachments, are converted again and again. Cached messages are shared between requests and must not be
+    modified, copy them to change them.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        """Initialize limits."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Get a cached message or ``None``."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, provider_message):
+        """Cache a message, evicting the least recently used ones over the limits."""
+        size = get_size(provider_message)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (provider_message, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        """Drop all cached messages."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+message_cache = MessageCache(**settings.CHAT_MESSAGE_CACHE)
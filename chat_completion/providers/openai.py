@@ -0,0 +1,79 @@
+"""OpenAI chat completion provider."""
+
+from django.conf import settings
+from openai import AsyncOpenAI
+
+from chat_completion.providers.base_provider import BaseProvider
+
+
+class OpenAI(BaseProvider):
+    """Chat completions with OpenAI models."""
+
+    provider_name = 'openai'
+    display_name = 'OpenAI'
+
+    def get_request_params(self):
+        """Extra parameters for completion requests."""
+        if self.max_tokens:
+            return {'max_completion_tokens': self.max_tokens, **self.params}
+        return self.params
+
+    def record_openai_usage(self, usage):
+        """Record usage including prompt tokens served from OpenAI's automatic prefix cache."""
+        details = usage.prompt_tokens_details
+        self.record_usage(
+            usage.prompt_tokens, usage.completion_tokens, cache_read_tokens=details.cached_tokens if details else 0
+        )
+
+    def get_client(self):
+        """Create OpenAI client."""
+        return AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def get_attachment_transform(self, file):
+        """Images are sent as URLs, other files as their bytes."""
+        return None if 'image' in file.content_type else 'bytes_repr'
+
+    def translate_message(self, msg):
+        """Convert a message to OpenAI format.
+
+        OpenAI caches prompt prefixes automatically, so earlier messages must convert to exactly the same bytes
+        on every turn. Nothing that changes between requests, like signed URLs or timestamps, may go in here.
+        """
+        return {
+            "role": 'user' if msg.isUser else 'assistant',
+            "content": [
+                {"type": "text", "text": msg.text},
+                *([{"type": "image_url", "image_url": {'url': f'{settings.BASE_URL}{file.file.url}'}}]
+                    if ((file := msg.file) and 'image' in file.content_type) else []),
+                *([{
+                    'type': 'text', 'text': f'user uploaded a file file content in bytes: {self.read_attachment(file)}'
+                }] if (file := msg.file) and 'image' not in file.content_type else [])
+            ]
+        }
+
+    async def stream_text(self, provider_messages):
+        """Stream response from OpenAI."""
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=provider_messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self.get_request_params(),
+        )
+        try:
+            async for chunk in response:
+                if chunk.usage:
+                    self.record_openai_usage(chunk.usage)
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+        finally:
+            await response.close()
+
+    async def complete(self, provider_messages):
+        """Get full response from OpenAI."""
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=provider_messages, **self.get_request_params()
+        )
+        if response.usage:
+            self.record_openai_usage(response.usage)
+        return response.choices[0].message.content or ""
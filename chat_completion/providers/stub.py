@@ -0,0 +1,48 @@
+"""Offline provider for local development and tests."""
+
+import asyncio
+
+from django.conf import settings
+
+from chat_completion.providers.base_provider import BaseProvider
+
+
+class Stub(BaseProvider):
+    """Provider that echoes the last message back without calling any external service."""
+
+    provider_name = 'stub'
+    display_name = 'Stub'
+
+    def get_client(self):
+        """Stub provider has no client."""
+        return None
+
+    def translate_message(self, msg):
+        """Keep only role and text of a message."""
+        return {"role": 'user' if msg.isUser else 'assistant', "content": msg.text}
+
+    def get_response_text(self, provider_messages):
+        """Build a deterministic response for messages."""
+        last_message = provider_messages[-1]['content'] if provider_messages else ''
+        return f'Stub response ({self.model}) to: {last_message}'
+
+    def record_stub_usage(self, provider_messages, text):
+        """Record word counts as token usage."""
+        input_tokens = sum(len(message['content'].split()) for message in provider_messages)
+        self.record_usage(input_tokens, len(text.split()))
+
+    async def stream_text(self, provider_messages):
+        """Stream the response word by word."""
+        delay = getattr(settings, 'CHAT_STUB_PROVIDER_DELAY', 0)
+        text = self.get_response_text(provider_messages)
+        for word in text.split(' '):
+            if delay:
+                await asyncio.sleep(delay)
+            yield f'{word} '
+        self.record_stub_usage(provider_messages, text)
+
+    async def complete(self, provider_messages):
+        """Get the full response."""
+        text = self.get_response_text(provider_messages)
+        self.record_stub_usage(provider_messages, text)
+        return text
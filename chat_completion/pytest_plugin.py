@@ -0,0 +1,48 @@
+"""Pytest plugin failing tests that block the event loop of the chat API.
+
+Enable it with ``-p chat_completion.pytest_plugin`` and use the ``no_loop_blocking`` fixture in tests that call
+the FastAPI app. The limit is ``--loop-block-ms`` or the ``loop_block_ms`` marker of a test.
+
+    @pytest.mark.loop_block_ms(50)
+    def test_chat(no_loop_blocking):
+        with TestClient(app) as client:
+            client.post('/api/fastapi/chat-completion/', ...)
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    """Add option for the blocking limit."""
+    parser.addoption(
+        '--loop-block-ms', type=float, default=None,
+        help="Fail tests using no_loop_blocking that block the event loop longer, default CHAT_LOOP_MONITOR's.",
+    )
+
+
+def pytest_configure(config):
+    """Register marker."""
+    config.addinivalue_line('markers', 'loop_block_ms(ms): event loop blocking limit for no_loop_blocking')
+
+
+@pytest.fixture
+def no_loop_blocking(request):
+    """Monitor the event loop during the test and fail it when the loop was blocked."""
+    from chat_completion.loop_monitor import loop_monitor
+
+    marker = request.node.get_closest_marker('loop_block_ms')
+    limit_ms = marker.args[0] if marker else request.config.getoption('--loop-block-ms')
+    enabled, threshold = loop_monitor.enabled, loop_monitor.threshold
+    if limit_ms is not None:
+        loop_monitor.threshold = limit_ms / 1000
+    loop_monitor.enabled = True
+    loop_monitor.clear()
+    try:
+        yield loop_monitor
+        events = list(loop_monitor.events)
+    finally:
+        loop_monitor.enabled, loop_monitor.threshold = enabled, threshold
+
+    if events:
+        details = '\n\n'.join(f'Blocked for {event.lag_ms} ms at:\n{event.stack}' for event in events)
+        pytest.fail(f'Event loop was blocked {len(events)} times.\n\n{details}', pytrace=False)
@@ -0,0 +1,121 @@
+"""Token bucket rate limiting for chat endpoints."""
+
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseRateLimiter(ABC):
+    """Base class for token bucket rate limiters.
+
+    Every key has a bucket of ``capacity`` tokens refilled at ``refill_rate`` tokens per second. A request takes
+    ``cost`` tokens and is rejected when the bucket doesn't have enough of them.
+    """
+
+    def __init__(self, **kwargs):
+        """Initialize rate limiter."""
+
+    @abstractmethod
+    async def acquire(self, key, capacity, refill_rate, cost=1):
+        """Take tokens from the bucket. Return ``(allowed, seconds until enough tokens are available)``."""
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+    """Rate limiter with buckets in the worker process. Limits apply per worker."""
+
+    purge_every = 1000
+
+    def __init__(self, **kwargs):
+        """Initialize buckets."""
+        super().__init__(**kwargs)
+        self.buckets = {}
+        self.calls = 0
+
+    def _purge_full_buckets(self, now):
+        """Drop buckets that have refilled completely, they behave the same as missing buckets."""
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+    async def acquire(self, key, capacity, refill_rate, cost=1):
+        """Take tokens from the bucket."""
+        now = time.monotonic()
+        self.calls += 1
+        if self.calls % self.purge_every == 0:
+            self._purge_full_buckets(now)
+
+        tokens, updated_at, _, _ = self.buckets.get(key, (capacity, now, refill_rate, capacity))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now, refill_rate, capacity)
+        return allowed, 0 if allowed else (cost - tokens) / refill_rate
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """Rate limiter with buckets in Redis, updated atomically by a script. Limits apply across workers."""
+
+    key_prefix = 'rate-limit'
+
+    # KEYS: bucket. ARGV: capacity, refill rate, cost.
+    acquire_script = """
+        local capacity = tonumber(ARGV[1])
+        local refill_rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_rate)
+        local allowed = 0
+        local retry_after = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        else
+            retry_after = (cost - tokens) / refill_rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate) + 1)
+        return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url='redis://localhost:6379', **kwargs):
+        """Initialize Redis connection and script."""
+        from redis import asyncio as aioredis
+
+        super().__init__(**kwargs)
+        self.redis = aioredis.from_url(url)
+        self._acquire = self.redis.register_script(self.acquire_script)
+
+    async def acquire(self, key, capacity, refill_rate, cost=1):
+        """Take tokens from the bucket."""
+        allowed, retry_after = await self._acquire(
+            keys=[f'{self.key_prefix}:{key}'], args=[capacity, refill_rate, cost]
+        )
+        return bool(allowed), float(retry_after)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """Get the rate limiter configured in ``CHAT_RATE_LIMITS``."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        config = dict(settings.CHAT_RATE_LIMITS)
+        config.pop('plans')
+        backend = import_string(config.pop('backend'))
+        _rate_limiter = backend(**config)
+    return _rate_limiter
+
+
+def get_plan_limits(plan, scope):
+    """Get bucket settings of a scope for a plan. ``None`` is the plan of users without a subscription."""
+    plans = settings.CHAT_RATE_LIMITS['plans']
+    return plans.get(plan or 'free', plans['default'])[scope]
@@ -0,0 +1,231 @@
+"""Retrieval of the parts of large text uploads that are relevant to a question.
+
+Text uploads over ``min_bytes`` are split into overlapping chunks and indexed with BM25 when they are uploaded.
+Chats then send the ``top_k`` chunks most relevant to the question of the file's turn instead of the whole file.
+Smaller files and files whose index isn't built yet are sent whole.
+"""
+
+import copy
+import io
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Content types indexed besides ``text/*``.
+TEXT_CONTENT_TYPES = {
+    'application/json', 'application/xml', 'application/x-yaml', 'application/yaml', 'application/javascript',
+    'application/x-sh', 'application/sql', 'application/csv',
+}
+
+
+def is_indexable(content_type, size):
+    """Whether an upload is text large enough to be sent as excerpts."""
+    config = settings.CHAT_RETRIEVAL
+    is_text = content_type.startswith('text/') or content_type in TEXT_CONTENT_TYPES
+    return config['enabled'] and is_text and size > config['min_bytes']
+
+
+def hash_tokens(text):
+    """Lowercase words of a text hashed to term ids."""
+    return np.fromiter(
+        (zlib.crc32(word.encode('utf-8')) for word in TOKEN_PATTERN.findall(text.lower())), dtype=np.uint32
+    )
+
+
+def split_chunks(text, chunk_chars, overlap_chars):
+    """Split text into chunks of about ``chunk_chars`` overlapping by ``overlap_chars``, at whitespace."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            space = text.rfind(' ', start + chunk_chars // 2, end)
+            end = space if space != -1 else end
+        chunks.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+class ChunkIndex:
+    """Inverted index of term frequencies of the chunks of a document.
+
+    ``terms`` are the sorted term ids of the document. The chunks containing ``terms[i]`` are
+    ``chunk_ids[indptr[i]:indptr[i + 1]]`` and the term's frequencies in them ``frequencies[indptr[i]:indptr[i + 1]]``.
+    """
+
+    def __init__(self, terms, indptr, chunk_ids, frequencies, lengths):
+        """Initialize index arrays."""
+        self.terms = terms
+        self.indptr = indptr
+        self.chunk_ids = chunk_ids
+        self.frequencies = frequencies
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, chunks):
+        """Index chunks of text."""
+        chunk_ids, terms, frequencies, lengths = [], [], [], []
+        for chunk_id, chunk in enumerate(chunks):
+            hashes = hash_tokens(chunk)
+            chunk_terms, counts = np.unique(hashes, return_counts=True)
+            chunk_ids.append(np.full(len(chunk_terms), chunk_id, dtype=np.int32))
+            terms.append(chunk_terms)
+            frequencies.append(counts.astype(np.float32))
+            lengths.append(len(hashes))
+
+        chunk_ids, terms, frequencies = np.concatenate(chunk_ids), np.concatenate(terms), np.concatenate(frequencies)
+        order = np.lexsort((chunk_ids, terms))
+        terms, starts = np.unique(terms[order], return_index=True)
+        indptr = np.append(starts, len(order)).astype(np.int32)
+        return cls(terms, indptr, chunk_ids[order], frequencies[order], np.array(lengths, dtype=np.float32))
+
+    def to_bytes(self):
+        """Serialize the index."""
+        output = io.BytesIO()
+        np.savez_compressed(
+            output, terms=self.terms, indptr=self.indptr, chunk_ids=self.chunk_ids, frequencies=self.frequencies,
+            lengths=self.lengths,
+        )
+        return output.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a serialized index."""
+        arrays = np.load(io.BytesIO(bytes(data)))
+        return cls(arrays['terms'], arrays['indptr'], arrays['chunk_ids'], arrays['frequencies'], arrays['lengths'])
+
+    def search(self, query, top_k, k1=1.5, b=0.75):
+        """Ids of the ``top_k`` chunks with the highest BM25 score for a query, best first."""
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        query_terms = np.unique(hash_tokens(query))
+        positions = np.searchsorted(self.terms, query_terms)
+        found = positions < len(self.terms)
+        positions = positions[found][self.terms[positions[found]] == query_terms[found]]
+        length_norm = k1 * (1 - b + b * self.lengths / max(self.lengths.mean(), 1))
+        for position in positions:
+            start, end = self.indptr[position], self.indptr[position + 1]
+            chunk_ids = self.chunk_ids[start:end]
+            frequencies = self.frequencies[start:end]
+            idf = np.log(1 + (len(self.lengths) - (end - start) + 0.5) / (end - start + 0.5))
+            scores[chunk_ids] += idf * frequencies * (k1 + 1) / (frequencies + length_norm[chunk_ids])
+        best = np.argsort(-scores, kind='stable')[:top_k]
+        return [int(chunk_id) for chunk_id in best if scores[chunk_id] > 0]
+
+
+def build_index(upload):
+    """Split a text upload into chunks and save their index."""
+    from chat_completion.models import FileChunkIndex
+
+    config = settings.CHAT_RETRIEVAL
+    upload.file.seek(0)
+    text = upload.file.read().decode('utf-8', errors='replace')
+    chunks = split_chunks(text, config['chunk_chars'], config['overlap_chars'])
+    FileChunkIndex.objects.update_or_create(
+        upload=upload, defaults={'chunks': chunks, 'index': ChunkIndex.build(chunks).to_bytes()}
+    )
+    return len(chunks)
+
+
+class IndexCache:
+    """LRU of the loaded indexes and chunks of the ``max_entries`` most recently used uploads."""
+
+    def __init__(self, max_entries=100):
+        """Initialize cache."""
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, upload_id):
+        """Get ``(index, chunks)`` of an upload or ``None``."""
+        with self.lock:
+            entry = self.entries.get(upload_id)
+            if entry is not None:
+                self.entries.move_to_end(upload_id)
+            return entry
+
+    def set(self, upload_id, entry):
+        """Cache ``(index, chunks)`` of an upload."""
+        with self.lock:
+            self.entries[upload_id] = entry
+            self.entries.move_to_end(upload_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+index_cache = IndexCache(settings.CHAT_RETRIEVAL['cache_size'])
+
+
+async def get_indexes(uploads):
+    """Get ``(index, chunks)`` of the uploads that are indexed, by upload id."""
+    from chat_completion.models import FileChunkIndex
+
+    indexes = {}
+    missing = set()
+    for upload in uploads:
+        entry = index_cache.get(upload.id)
+        if entry is None:
+            missing.add(upload.id)
+        else:
+            indexes[upload.id] = entry
+    if missing:
+        async for chunk_index in FileChunkIndex.objects.filter(upload_id__in=missing):
+            entry = (ChunkIndex.from_bytes(chunk_index.index), chunk_index.chunks)
+            index_cache.set(chunk_index.upload_id, entry)
+            indexes[chunk_index.upload_id] = entry
+    return indexes
+
+
+def format_excerpts(upload, chunks, chunk_ids):
+    """Text sent instead of a file, its chunks in document order."""
+    excerpts = '\n\n[...]\n\n'.join(chunks[chunk_id] for chunk_id in sorted(chunk_ids))
+    return (
+        f'Excerpts of {upload.original_name} relevant to the question, {len(chunk_ids)} of '
+        f'{len(chunks)} parts:\n\n{excerpts}'
+    )
+
+
+def get_turn_question(messages, position):
+    """Text of the user messages in the turn of the message at ``position``."""
+    texts = []
+    for msg in messages[position:]:
+        if not msg.isUser:
+            break
+        texts.append(msg.text)
+    return '\n'.join(texts)
+
+
+async def add_excerpts(messages):
+    """Set the excerpts of indexed files, they are sent instead of the files.
+
+    Excerpts of a file are relevant to the question of its turn, so earlier turns send the same text on every
+    request and stay in the prompt and message caches. Only the newest file is searched with the latest question.
+    Files with fewer than ``top_k`` chunks are sent whole.
+    """
+    config = settings.CHAT_RETRIEVAL
+    positions = [position for position, msg in enumerate(messages) if msg.file is not None]
+    if not config['enabled'] or not positions:
+        return
+    uploads = {messages[position].file.id: messages[position].file for position in positions}
+    indexes = await get_indexes(uploads.values())
+    latest_question = next((msg.text for msg in reversed(messages) if msg.isUser), '')
+    for position in positions:
+        msg = messages[position]
+        if msg.file.id not in indexes:
+            continue
+        index, chunks = indexes[msg.file.id]
+        if len(chunks) <= config['top_k']:
+            continue
+        query = latest_question if position == positions[-1] else get_turn_question(messages, position)
+        chunk_ids = index.search(query, config['top_k'], config['k1'], config['b']) or list(range(config['top_k']))
+        # Messages referencing the same upload share its instance, each keeps the excerpts of its own turn.
+        msg.file = copy.copy(msg.file)
+        msg.file.excerpts = format_excerpts(msg.file, chunks, chunk_ids)
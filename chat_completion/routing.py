@@ -0,0 +1,115 @@
+"""Routing of the ``auto`` model to the configured model that is expected to answer fastest."""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from chat_completion.model_registry import model_registry
+
+
+logger = logging.getLogger(__name__)
+
+AUTO_MODEL = 'auto'
+
+# Rough number of characters per token, good enough to pick a model.
+CHARS_PER_TOKEN = 4
+
+
+class ModelStats:
+    """Exponentially weighted moving averages of a model's time to first token and error rate."""
+
+    __slots__ = ('latency_ms', 'error_rate', 'updated_at', 'samples')
+
+    def __init__(self):
+        self.latency_ms = None
+        self.error_rate = 0.0
+        self.updated_at = time.monotonic()
+        self.samples = 0
+
+
+class ModelRouter:
+    """Choose a model for ``auto`` requests from the rules of the user's plan.
+
+    A plan's rules are candidate models in order of preference. A rule may limit the prompt size it takes with
+    ``max_prompt_tokens`` and make the model less preferred with a ``cost`` factor. Models whose context window
+    is too small or whose recent error rate is over ``max_error_rate`` are skipped. Of the rest, the model with
+    the lowest ``cost * latency * (1 + error_penalty * error_rate)`` is chosen. Models that weren't used yet are
+    tried first, models that only failed so far count as taking ``error_latency_ms``. Errors are forgotten with a
+    half life of ``error_half_life`` seconds, so skipped models get tried again.
+
+    Stats are kept per worker and updated from every chat stream, not only routed ones.
+    """
+
+    def __init__(
+        self, alpha=0.2, max_error_rate=0.5, error_penalty=4, error_half_life=60, error_latency_ms=10000, plans=None
+    ):
+        """Initialize router."""
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.error_penalty = error_penalty
+        self.error_half_life = error_half_life
+        self.error_latency_ms = error_latency_ms
+        self.plans = plans or {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def record(self, provider_name, model, ttft_ms=None, error=False):
+        """Update the stats of a provider model after a request."""
+        with self.lock:
+            stats = self.stats.setdefault((provider_name, model), ModelStats())
+            stats.error_rate = self.get_error_rate(stats)
+            stats.error_rate += self.alpha * (float(error) - stats.error_rate)
+            if ttft_ms is not None:
+                stats.latency_ms = ttft_ms if stats.latency_ms is None else (
+                    stats.latency_ms + self.alpha * (ttft_ms - stats.latency_ms)
+                )
+            stats.updated_at = time.monotonic()
+            stats.samples += 1
+
+    def get_error_rate(self, stats):
+        """Error rate decayed for the time since the last request."""
+        return stats.error_rate * 0.5 ** ((time.monotonic() - stats.updated_at) / self.error_half_life)
+
+    def get_candidates(self, plan, prompt_tokens):
+        """Scored models allowed for the plan and prompt size, best first."""
+        rules = self.plans.get(plan or 'free', self.plans.get('default', []))
+        candidates = []
+        for position, rule in enumerate(rules):
+            config = model_registry.get(rule['model'])
+            if config is None:
+                continue
+            if prompt_tokens > rule.get('max_prompt_tokens', float('inf')):
+                continue
+            if config.context_window and prompt_tokens > config.context_window:
+                continue
+            stats = self.stats.get((config.provider, config.upstream_model))
+            if stats is None:
+                latency_ms, error_rate = 0, 0
+            else:
+                latency_ms = self.error_latency_ms if stats.latency_ms is None else stats.latency_ms
+                error_rate = self.get_error_rate(stats)
+            candidates.append({
+                'model': rule['model'],
+                'latency_ms': round(latency_ms, 1),
+                'error_rate': round(error_rate, 3),
+                'score': rule.get('cost', 1) * latency_ms * (1 + self.error_penalty * error_rate),
+                'position': position,
+            })
+        healthy = [candidate for candidate in candidates if candidate['error_rate'] <= self.max_error_rate]
+        return sorted(healthy or candidates, key=lambda candidate: (candidate['score'], candidate['position']))
+
+    def choose(self, plan, messages):
+        """Get the model for a request or ``None`` when no model is allowed."""
+        prompt_tokens = sum(len(msg.text) for msg in messages) // CHARS_PER_TOKEN
+        candidates = self.get_candidates(plan, prompt_tokens)
+        model = candidates[0]['model'] if candidates else None
+        logger.info(
+            f"Routed auto request to {model}.",
+            extra={'plan': plan, 'prompt_tokens': prompt_tokens, 'chosen_model': model, 'candidates': candidates},
+        )
+        return model
+
+
+model_router = ModelRouter(**settings.CHAT_AUTO_ROUTING)
@@ -0,0 +1,155 @@
+"""Cache of answers to single message chats that also matches paraphrased prompts."""
+
+import asyncio
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Words flipping the meaning of a prompt that its embedding barely changes for, ``t`` is what ``n't`` becomes.
+NEGATIONS = {
+    'no', 'not', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor', 'without', 'cannot', 't', 'dont', 'cant',
+    'wont', 'isnt', 'arent', 'doesnt', 'didnt', 'shouldnt',
+}
+
+
+def get_exact_tokens(text):
+    """Numbers and negations of a prompt, a cached answer is only used for a prompt with the same ones."""
+    return tuple(sorted(
+        word for word in TOKEN_PATTERN.findall(text.lower())
+        if word in NEGATIONS or any(char.isdigit() for char in word)
+    ))
+
+
+class HashingEmbedder:
+    """Embed text as an L2 normalized vector of hashed word unigrams and bigrams.
+
+    Works offline and without a fitted vocabulary. Every feature is hashed into one of ``dim`` buckets with a
+    hashed sign, so collisions cancel out on average. Bigrams count ``bigram_weight`` as much as words, so word
+    order matters less than wording.
+    """
+
+    def __init__(self, dim=256, bigram_weight=0.5):
+        """Initialize embedder."""
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+
+    def embed(self, text):
+        """Embed text."""
+        words = TOKEN_PATTERN.findall(text.lower())
+        features = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint32)
+        if hashes.size:
+            weights = np.ones(hashes.size, dtype=np.float32)
+            weights[len(words):] = self.bigram_weight
+            weights[(hashes & 0x80000000) != 0] *= -1
+            np.add.at(vector, hashes % self.dim, weights)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """Answers indexed by prompt embedding, looked up by cosine similarity.
+
+    Entries are scoped to a user and model, prompts of one user never get another user's answers. Embeddings are
+    rows of one matrix, so a lookup is a single matrix vector product over all entries. The best match with a
+    similarity of at least ``threshold`` and the same numbers and negations as the prompt is used. When all
+    ``capacity`` rows are taken the least recently used entry is replaced.
+    """
+
+    def __init__(self, dim=256, capacity=10000, threshold=0.95, embedder=None):
+        """Allocate the index."""
+        self.embedder = embedder or HashingEmbedder(dim)
+        self.capacity = capacity
+        self.threshold = threshold
+        self.vectors = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        self.scope_ids = np.full(capacity, -1, dtype=np.int32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.exact_tokens = [None] * capacity
+        self.responses = [None] * capacity
+        self.scopes = {}
+        self.size = 0
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def _tick(self):
+        """Advance the clock used for recency."""
+        self.clock += 1
+        return self.clock
+
+    def get(self, user_id, model, prompt):
+        """Get the cached answer of the user to a similar prompt or ``None``."""
+        vector = self.embedder.embed(prompt)
+        exact_tokens = get_exact_tokens(prompt)
+        with self.lock:
+            scope_id = self.scopes.get((user_id, model))
+            if scope_id is None or not self.size:
+                return None
+            scores = self.vectors[:self.size] @ vector
+            scores[self.scope_ids[:self.size] != scope_id] = -1
+            matches = np.flatnonzero(scores >= self.threshold)
+            for row in matches[np.argsort(-scores[matches])]:
+                if self.exact_tokens[row] == exact_tokens:
+                    self.last_used[row] = self._tick()
+                    return self.responses[row]
+            return None
+
+    def set(self, user_id, model, prompt, response):
+        """Cache the user's answer to a prompt."""
+        vector = self.embedder.embed(prompt)
+        exact_tokens = get_exact_tokens(prompt)
+        with self.lock:
+            scope_id = self.scopes.setdefault((user_id, model), len(self.scopes))
+            if self.size < self.capacity:
+                row = self.size
+                self.size += 1
+            else:
+                row = int(np.argmin(self.last_used))
+            self.vectors[row] = vector
+            self.scope_ids[row] = scope_id
+            self.last_used[row] = self._tick()
+            self.exact_tokens[row] = exact_tokens
+            self.responses[row] = response
+
+
+def is_cacheable(messages):
+    """Only chats with a single text message are cached, later turns depend on the whole conversation."""
+    return len(messages) == 1 and messages[0].isUser and not messages[0].fileId
+
+
+async def cache_stream(semantic_cache, provider, user_id, model, prompt, chunks):
+    """Pass a provider stream through and cache the whole answer when it succeeded."""
+    parts = []
+    async for text in chunks:
+        if text:
+            parts.append(text)
+        yield text
+    if provider.error is None and parts:
+        await asyncio.to_thread(semantic_cache.set, user_id, model, prompt, ''.join(parts))
+
+
+async def replay(response):
+    """Stream a cached answer."""
+    yield response
+
+
+_semantic_cache = None
+
+
+def get_semantic_cache():
+    """Get the cache configured in ``CHAT_SEMANTIC_CACHE`` or ``None`` when it is disabled."""
+    global _semantic_cache
+    config = dict(settings.CHAT_SEMANTIC_CACHE)
+    if not config.pop('enabled'):
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(**config)
+    return _semantic_cache
@@ -0,0 +1,343 @@
+"""Buffers that keep generated chat output around so interrupted streams can be resumed."""
+
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamNotFound(Exception):
+    """Raised when a stream id is unknown or has already expired."""
+
+
+class StreamExpired(Exception):
+    """Raised when the requested offset has already been dropped from the ring buffer."""
+
+
+class BaseStreamBuffer(ABC):
+    """Base class for stream buffers.
+
+    Every stream keeps at most ``max_bytes`` of its most recent output. Offsets are byte offsets into the full
+    output of the stream, so a reader can resume from the number of bytes it has already received. A resuming
+    reader that falls more than ``max_bytes`` behind gets ``StreamExpired``, the connection that started the
+    stream gets its chunks from the pump and never does. Streams expire ``ttl`` seconds after they finished or,
+    while they are running, after their last ``touch``.
+    """
+
+    def __init__(self, max_bytes=256 * 1024, ttl=300):
+        """Initialize buffer limits."""
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @staticmethod
+    def new_stream_id():
+        """Generate a new stream id."""
+        return uuid.uuid4().hex
+
+    @abstractmethod
+    async def create(self, owner):
+        """Create an empty stream owned by ``owner`` and return its id."""
+
+    @abstractmethod
+    async def append(self, stream_id, data):
+        """Append bytes to a stream."""
+
+    async def touch(self, stream_id):
+        """Keep a running stream that gets no new data from expiring."""
+
+    @abstractmethod
+    async def finish(self, stream_id):
+        """Mark a stream as complete and start its expiry timer."""
+
+    @abstractmethod
+    async def get_state(self, stream_id):
+        """Return ``(owner, start_offset)`` for a stream or raise ``StreamNotFound``."""
+
+    @abstractmethod
+    async def read(self, stream_id, offset=0):
+        """Yield bytes from ``offset`` onwards, waiting for new data until the stream is finished."""
+
+
+class _BufferedStream:
+    """State of a single in-process stream."""
+
+    __slots__ = ('owner', 'data', 'start', 'done', 'expires_at', 'event')
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.data = bytearray()
+        self.start = 0
+        self.done = False
+        self.expires_at = None
+        self.event = asyncio.Event()
+
+    def notify(self):
+        """Wake up all readers waiting for new data."""
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class InMemoryStreamBuffer(BaseStreamBuffer):
+    """Stream buffer kept in the worker process. Resumes only work on the worker that served the stream.
+
+    Finished streams are dropped when their ttl passes, also when the worker gets no new streams.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize stream storage."""
+        super().__init__(*args, **kwargs)
+        self.streams = {}
+
+    def _purge_expired(self):
+        """Drop finished streams whose ttl has passed."""
+        now = time.monotonic()
+        expired = [key for key, stream in self.streams.items() if stream.expires_at and stream.expires_at < now]
+        for key in expired:
+            del self.streams[key]
+
+    def _get(self, stream_id):
+        """Get a live stream or raise ``StreamNotFound``."""
+        stream = self.streams.get(stream_id)
+        if stream is None or (stream.expires_at and stream.expires_at < time.monotonic()):
+            raise StreamNotFound(stream_id)
+        return stream
+
+    async def create(self, owner):
+        """Create an empty stream."""
+        self._purge_expired()
+        stream_id = self.new_stream_id()
+        self.streams[stream_id] = _BufferedStream(owner)
+        return stream_id
+
+    async def append(self, stream_id, data):
+        """Append bytes, dropping the oldest bytes once the stream is over ``max_bytes``."""
+        stream = self._get(stream_id)
+        stream.data.extend(data)
+        overflow = len(stream.data) - self.max_bytes
+        if overflow > 0:
+            del stream.data[:overflow]
+            stream.start += overflow
+        stream.notify()
+
+    async def finish(self, stream_id):
+        """Mark stream as finished and schedule dropping it."""
+        stream = self._get(stream_id)
+        stream.done = True
+        stream.expires_at = time.monotonic() + self.ttl
+        stream.notify()
+        asyncio.get_running_loop().call_later(self.ttl, self.streams.pop, stream_id, None)
+
+    async def get_state(self, stream_id):
+        """Get owner and first available offset of a stream."""
+        stream = self._get(stream_id)
+        return stream.owner, stream.start
+
+    async def read(self, stream_id, offset=0):
+        """Yield stream data from ``offset``."""
+        stream = self._get(stream_id)
+        while True:
+            if offset < stream.start:
+                raise StreamExpired(stream_id)
+            chunk = bytes(stream.data[offset - stream.start:])
+            if chunk:
+                offset += len(chunk)
+                yield chunk
+            elif stream.done:
+                return
+            else:
+                await stream.event.wait()
+
+
+class RedisStreamBuffer(BaseStreamBuffer):
+    """Stream buffer stored in Redis so a stream can be resumed from any node."""
+
+    key_prefix = 'chat-stream'
+
+    # KEYS: meta hash, data string. ARGV: chunk, max bytes, ttl.
+    append_script = """
+        local length = redis.call('APPEND', KEYS[2], ARGV[1])
+        local overflow = length - tonumber(ARGV[2])
+        if overflow > 0 then
+            redis.call('SET', KEYS[2], redis.call('GETRANGE', KEYS[2], overflow, -1))
+            redis.call('HINCRBY', KEYS[1], 'start', overflow)
+        end
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        return length
+    """
+
+    # KEYS: meta hash, data string. ARGV: offset.
+    read_script = """
+        local state = redis.call('HMGET', KEYS[1], 'start', 'done')
+        if not state[1] then
+            return nil
+        end
+        local start = tonumber(state[1])
+        local position = tonumber(ARGV[1]) - start
+        if position < 0 then
+            return {start, state[2], false}
+        end
+        return {start, state[2], redis.call('GETRANGE', KEYS[2], position, -1)}
+    """
+
+    def __init__(self, url='redis://localhost:6379', poll_interval=0.05, *args, **kwargs):
+        """Initialize Redis connection and scripts."""
+        from redis import asyncio as aioredis
+
+        super().__init__(*args, **kwargs)
+        self.poll_interval = poll_interval
+        self.redis = aioredis.from_url(url)
+        self._append = self.redis.register_script(self.append_script)
+        self._read = self.redis.register_script(self.read_script)
+
+    def _keys(self, stream_id):
+        """Redis keys for a stream."""
+        return [f'{self.key_prefix}:{stream_id}', f'{self.key_prefix}:{stream_id}:data']
+
+    async def create(self, owner):
+        """Create an empty stream."""
+        stream_id = self.new_stream_id()
+        meta_key, _ = self._keys(stream_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(meta_key, mapping={'owner': str(owner), 'start': 0, 'done': 0})
+            pipe.expire(meta_key, self.ttl)
+            await pipe.execute()
+        return stream_id
+
+    async def append(self, stream_id, data):
+        """Append bytes and trim the stream to ``max_bytes`` atomically."""
+        await self._append(keys=self._keys(stream_id), args=[data, self.max_bytes, self.ttl])
+
+    async def touch(self, stream_id):
+        """Refresh the expiry of a running stream."""
+        meta_key, data_key = self._keys(stream_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.expire(meta_key, self.ttl)
+            pipe.expire(data_key, self.ttl)
+            await pipe.execute()
+
+    async def finish(self, stream_id):
+        """Mark stream as finished."""
+        meta_key, data_key = self._keys(stream_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(meta_key, 'done', 1)
+            pipe.expire(meta_key, self.ttl)
+            pipe.expire(data_key, self.ttl)
+            await pipe.execute()
+
+    async def get_state(self, stream_id):
+        """Get owner and first available offset of a stream."""
+        meta_key, _ = self._keys(stream_id)
+        owner, start = await self.redis.hmget(meta_key, 'owner', 'start')
+        if owner is None:
+            raise StreamNotFound(stream_id)
+        return owner.decode(), int(start)
+
+    async def read(self, stream_id, offset=0):
+        """Yield stream data from ``offset``, polling Redis for new data."""
+        while True:
+            state = await self._read(keys=self._keys(stream_id), args=[offset])
+            if state is None:
+                raise StreamNotFound(stream_id)
+            _, done, chunk = state
+            if chunk is None:
+                raise StreamExpired(stream_id)
+            if chunk:
+                offset += len(chunk)
+                yield chunk
+            elif done == b'1':
+                return
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+
+_stream_buffer = None
+_pump_tasks = set()
+
+
+def get_stream_buffer():
+    """Get the stream buffer configured in ``CHAT_STREAM_BUFFER``."""
+    global _stream_buffer
+    if _stream_buffer is None:
+        config = dict(settings.CHAT_STREAM_BUFFER)
+        backend = import_string(config.pop('backend'))
+        try:
+            _stream_buffer = backend(**config)
+        except TypeError as e:
+            raise ImproperlyConfigured(f"Invalid CHAT_STREAM_BUFFER options: {e}") from e
+    return _stream_buffer
+
+
+class LiveReader:
+    """Chunks of a stream for the connection that started it, passed on by the pump as they are buffered.
+
+    Unlike reading the buffer, the reader gets the whole stream however far it falls behind. Chunks are queued
+    until it reads them or leaves.
+    """
+
+    def __init__(self):
+        """Initialize queue."""
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def put(self, data):
+        """Queue bytes, ``None`` ends the stream."""
+        if not self.closed:
+            self.queue.put_nowait(data)
+
+    async def read(self):
+        """Yield queued bytes until the stream ends."""
+        try:
+            while (data := await self.queue.get()) is not None:
+                yield data
+        finally:
+            self.closed = True
+
+
+async def _keep_alive(buffer, stream_id):
+    """Touch a running stream so it doesn't expire while the model generates no output."""
+    while True:
+        await asyncio.sleep(buffer.ttl / 2)
+        try:
+            await buffer.touch(stream_id)
+        except Exception as e:
+            logger.error(f"Error while refreshing stream {stream_id}: {e}")
+
+
+async def _pump(buffer, stream_id, chunks, live_reader):
+    """Copy text chunks from a provider stream into the buffer and to the live reader."""
+    keep_alive = asyncio.create_task(_keep_alive(buffer, stream_id))
+    try:
+        async for chunk in chunks:
+            if chunk:
+                data = chunk.encode('utf-8')
+                live_reader.put(data)
+                await buffer.append(stream_id, data)
+    except Exception as e:
+        logger.error(f"Error while buffering stream {stream_id}: {e}")
+    finally:
+        keep_alive.cancel()
+        live_reader.put(None)
+        await buffer.finish(stream_id)
+
+
+async def start_buffered_stream(chunks, owner):
+    """Start consuming ``chunks`` into the stream buffer in the background. Return stream id, task and live reader.
+
+    The provider stream keeps running when the client disconnects so the client can resume it later.
+    """
+    buffer = get_stream_buffer()
+    stream_id = await buffer.create(owner)
+    live_reader = LiveReader()
+    task = asyncio.create_task(_pump(buffer, stream_id, chunks, live_reader))
+    _pump_tasks.add(task)
+    task.add_done_callback(_pump_tasks.discard)
+    return stream_id, task, live_reader
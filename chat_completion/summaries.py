@@ -0,0 +1,195 @@
+"""Rolling summaries of the older turns of long conversations.
+
+Conversations are not stored on the server, clients send the whole history with every message. A summary
+covers the first ``watermark`` messages of a conversation and is found again by a hash chained over those
+messages, so any later request continuing the same conversation can send the summary instead of them.
+"""
+
+import asyncio
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from chat_completion.api.fastapi.schemas import Message
+from chat_completion.model_registry import model_registry
+from chat_completion.models import ConversationSummary
+
+
+logger = logging.getLogger(__name__)
+
+# Rough number of characters per token, good enough to decide when to summarize.
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an assistant so it can continue without the original "
+    "messages. Keep facts, names, numbers, decisions, code and open questions. Write only the summary."
+)
+
+
+def prefix_hashes(messages):
+    """Hash every prefix of ``messages``. Item ``i`` is the hash of the first ``i + 1`` messages."""
+    hashes = []
+    digest = ''
+    for msg in messages:
+        role = 'user' if msg.isUser else 'assistant'
+        digest = hashlib.sha256(f'{digest}\x1f{role}\x1f{msg.fileId or ""}\x1f{msg.text}'.encode('utf-8')).hexdigest()
+        hashes.append(digest)
+    return hashes
+
+
+def estimate_tokens(messages):
+    """Estimate prompt tokens of messages."""
+    return sum(len(msg.text) for msg in messages) // CHARS_PER_TOKEN
+
+
+def is_boundary(messages, index):
+    """A summary can end before an assistant message, so the summary and the recent turns keep alternating roles."""
+    return 0 < index < len(messages) and not messages[index].isUser
+
+
+def get_watermark(messages):
+    """Number of messages to summarize, leaving ``keep_recent`` messages as they are."""
+    watermark = len(messages) - settings.CHAT_SUMMARIZATION['keep_recent']
+    while watermark > 0 and not is_boundary(messages, watermark):
+        watermark -= 1
+    return max(watermark, 0)
+
+
+def get_trigger_tokens(model):
+    """Unsummarized history size at which a model's conversation gets summarized."""
+    trigger_tokens = settings.CHAT_SUMMARIZATION['trigger_tokens']
+    config = model_registry.get(model)
+    if config and config.context_window:
+        trigger_tokens = min(trigger_tokens, config.context_window // 2)
+    return trigger_tokens
+
+
+def needs_summary(messages, watermark, model):
+    """Whether the messages after ``watermark`` are long enough to summarize some of them."""
+    return (
+        estimate_tokens(messages[watermark:]) > get_trigger_tokens(model)
+        and get_watermark(messages) > watermark
+    )
+
+
+def build_summary_message(summary, model):
+    """Message that replaces the summarized turns."""
+    return Message(text=f"Summary of the earlier conversation:\n{summary.summary}", isUser=True, model=model)
+
+
+def get_pending_key(user_id, prefix_hash):
+    """Cache key marking that summarizing a conversation from the prefix ending at ``prefix_hash`` is queued."""
+    return f'chat-summary-pending:{user_id}:{prefix_hash}'
+
+
+async def apply_summary(user_id, model, messages):
+    """Replace the summarized part of a conversation with its summary.
+
+    Schedules summarizing more of the conversation when the part that isn't summarized got too long, unless
+    that's already queued. Queued summaries are keyed by the first message they summarize, which stays the same
+    for the next turns until the summary is saved. The turn continues when the summary can't be queued.
+    """
+    from chat_completion.tasks import summarize_conversation
+
+    config = settings.CHAT_SUMMARIZATION
+    if not config['enabled'] or len(messages) <= config['keep_recent']:
+        return messages
+
+    hashes = prefix_hashes(messages)
+    candidates = [hashes[index - 1] for index in range(len(messages)) if is_boundary(messages, index)]
+    summary = await ConversationSummary.objects.filter(
+        user_id=user_id, prefix_hash__in=candidates
+    ).order_by('-watermark').afirst()
+    watermark = summary.watermark if summary else 0
+
+    if needs_summary(messages, watermark, model):
+        pending_key = get_pending_key(user_id, hashes[watermark])
+        if await cache.aadd(pending_key, True, config['pending_ttl']):
+            conversation = [msg.model_dump(exclude={'file'}) for msg in messages]
+            try:
+                await asyncio.to_thread(summarize_conversation.delay, user_id, model, conversation, pending_key)
+            except Exception as e:
+                # The conversation is sent unsummarized, the next turn tries again.
+                logger.error(f"Couldn't queue summarizing a conversation: {e}")
+                await cache.adelete(pending_key)
+            except BaseException:
+                await cache.adelete(pending_key)
+                raise
+
+    if summary is None:
+        return messages
+    return [build_summary_message(summary, model), *messages[watermark:]]
+
+
+def get_next_watermark(messages, start, watermark):
+    """End of the next chunk to summarize after ``start``, at most ``chunk_tokens`` long when possible."""
+    chunk_tokens = settings.CHAT_SUMMARIZATION['chunk_tokens']
+    end, tokens = start, 0
+    while end < watermark and tokens < chunk_tokens:
+        tokens += len(messages[end].text) // CHARS_PER_TOKEN
+        end += 1
+    while end < watermark and not is_boundary(messages, end):
+        end += 1
+    return end
+
+
+def format_transcript(messages):
+    """Render messages as plain text for the summarization prompt."""
+    lines = []
+    for msg in messages:
+        text = msg.text
+        if msg.fileId:
+            text = f"{text}\n[Attached file {msg.fileId}]"
+        lines.append(f"{'User' if msg.isUser else 'Assistant'}: {text}")
+    return '\n\n'.join(lines)
+
+
+async def summarize(provider, previous, messages):
+    """Extend the previous summary with messages."""
+    parts = [SUMMARY_PROMPT]
+    if previous:
+        parts.append(f"Summary of the conversation so far:\n{previous}")
+    parts.append(f"Conversation:\n{format_transcript(messages)}")
+    prompt = Message(text='\n\n'.join(parts), isUser=True, model=provider.model)
+    return (await provider.complete(provider.build_messages([prompt]))).strip()
+
+
+def update_summary(user_id, model, messages):
+    """Summarize a conversation up to its watermark, continuing from the latest summary of it.
+
+    Long unsummarized parts are summarized in chunks and every chunk's summary is saved, so an interrupted run
+    continues where it stopped.
+    """
+    from chat_completion.providers import get_provider
+
+    config = settings.CHAT_SUMMARIZATION
+    watermark = get_watermark(messages)
+    if not watermark:
+        return None
+
+    hashes = prefix_hashes(messages[:watermark])
+    summary = ConversationSummary.objects.filter(user_id=user_id, prefix_hash__in=hashes).order_by('-watermark').first()
+    start = summary.watermark if summary else 0
+    if start >= watermark:
+        return summary
+
+    while start < watermark:
+        end = get_next_watermark(messages, start, watermark)
+        # A new provider per chunk, async clients can't be reused across event loops.
+        provider = get_provider(config['model'], user_id=user_id)
+        text = asyncio.run(summarize(provider, summary.summary if summary else '', messages[start:end]))
+        if not text:
+            logger.error(f"Empty summary for user {user_id} messages {start}-{end}.")
+            return summary
+        summary, _ = ConversationSummary.objects.get_or_create(
+            user_id=user_id, prefix_hash=hashes[end - 1],
+            defaults={'watermark': end, 'summary': text, 'model': config['model']},
+        )
+        logger.info(
+            f"Summarized messages {start}-{end} of a {model} conversation of user {user_id}: "
+            f"{estimate_tokens(messages[start:end])} -> {len(text) // CHARS_PER_TOKEN} estimated tokens."
+        )
+        start = end
+    return summary
@@ -0,0 +1,78 @@
+"""Celery tasks for chat completion."""
+
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from chat_completion.models import BatchJob, FileUpload
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task()
+def process_batch_job(job_id):
+    """Start processing a batch job."""
+    from chat_completion.batch import get_batch_backend, set_job_status
+
+    job = BatchJob.objects.get(id=job_id)
+    try:
+        backend = get_batch_backend(job)
+        backend.set_status(BatchJob.RUNNING)
+        backend.run()
+    except Exception as error:
+        logger.error(f"Batch job {job.uuid} failed: {error}")
+        set_job_status(job, BatchJob.FAILED, str(error))
+        return
+
+    if job.status == BatchJob.SUBMITTED:
+        poll_batch_job.apply_async((job_id,), countdown=settings.CHAT_BATCH['poll_interval'])
+
+
+@shared_task()
+def poll_batch_job(job_id):
+    """Check a batch job submitted to a provider batch API."""
+    from chat_completion.batch import get_batch_backend, set_job_status
+
+    job = BatchJob.objects.get(id=job_id)
+    try:
+        backend = get_batch_backend(job)
+        finished = backend.poll()
+    except Exception as error:
+        logger.error(f"Polling batch job {job.uuid} failed: {error}")
+        set_job_status(job, BatchJob.FAILED, str(error))
+        return
+
+    if not finished:
+        poll_batch_job.apply_async((job_id,), countdown=settings.CHAT_BATCH['poll_interval'])
+
+
+@shared_task()
+def summarize_conversation(user_id, model, conversation, pending_key=None):
+    """Update the rolling summary of a long conversation and clear the marker that it is queued."""
+    from chat_completion.api.fastapi.schemas import Message
+    from chat_completion.summaries import update_summary
+
+    try:
+        update_summary(user_id, model, [Message(**message) for message in conversation])
+    except Exception as error:
+        logger.error(f"Summarizing conversation of user {user_id} failed: {error}")
+    finally:
+        if pending_key:
+            cache.delete(pending_key)
+
+
+@shared_task()
+def index_file_upload(upload_id):
+    """Build the chunk index of a large text upload."""
+    from chat_completion.retrieval import build_index
+
+    upload = FileUpload.objects.get(id=upload_id)
+    try:
+        chunks = build_index(upload)
+    except Exception as error:
+        logger.error(f"Indexing upload {upload.uuid} failed: {error}")
+        return
+    logger.info(f"Indexed upload {upload.uuid} in {chunks} chunks.")
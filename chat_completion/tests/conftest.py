@@ -0,0 +1,21 @@
+import itertools
+
+import jwt
+import pytest
+from django.conf import settings
+
+from users.models import User, UserProfile
+
+
+user_numbers = itertools.count()
+
+
+@pytest.fixture
+def make_user():
+    """Create a user with free requests, return it and the headers authenticating its requests."""
+    def make_user(free_requests=3):
+        user = User.objects.create_user(email=f'user{next(user_numbers)}@example.com', password='password')
+        UserProfile.objects.filter(user=user).update(free_requests=free_requests)
+        token = jwt.encode({'user_id': user.id}, settings.SECRET_KEY, algorithm='HS256')
+        return user, {'Authorization': f'Bearer {token}'}
+    return make_user
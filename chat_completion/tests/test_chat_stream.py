@@ -0,0 +1,15 @@
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from core.asgi import app
+
+
+def test_chat_completion_streams_stub_model(no_loop_blocking, make_user):
+    _, headers = make_user(free_requests=1)
+    data = {'model': 'stub', 'messages': [{'text': 'Hello', 'isUser': True, 'model': 'stub'}]}
+
+    with override_settings(CHAT_STUB_MODEL_ENABLED=True), TestClient(app) as client:
+        response = client.post('/api/fastapi/chat-completion/', json=data, headers=headers)
+
+    assert response.status_code == 200
+    assert 'Stub response' in response.text
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from chat_completion.api.fastapi.decoding import ChatRequestData, get_chat_request
+from chat_completion.api.fastapi.schemas import ChatRequest
+
+
+app = FastAPI()
+
+
+def as_tuples(messages):
+    return [(msg.text, msg.isUser, msg.model, msg.fileId) for msg in messages]
+
+
+@app.post('/pydantic/')
+async def pydantic_body(data: ChatRequest):
+    return {'model': data.model, 'messages': as_tuples(data.messages)}
+
+
+@app.post('/decoded/')
+async def decoded_body(data: ChatRequestData = Depends(get_chat_request)):
+    return {'model': data.model, 'messages': as_tuples(data.messages)}
+
+
+def message(**fields):
+    return {'text': 'Hello', 'isUser': True, 'model': 'gpt-4o', **fields}
+
+
+VALID_BODIES = [
+    {'model': 'gpt-4o', 'messages': [message()]},
+    {'model': 'gpt-4o', 'messages': [message(fileId='3f2c'), message(isUser=False, text='Hi')]},
+    {'model': 'gpt-4o', 'messages': [message(fileId=None)], 'extra': 1},
+    {'model': 'gpt-4o', 'messages': []},
+    # Coerced by pydantic, so these take the validation path.
+    {'model': 'gpt-4o', 'messages': [message(isUser='true')]},
+    {'model': 'gpt-4o', 'messages': [message(isUser=1)]},
+]
+
+INVALID_BODIES = [
+    {'model': 'gpt-4o'},
+    {'model': 'gpt-4o', 'messages': [message(text=5)]},
+    {'model': 'gpt-4o', 'messages': [message(isUser='maybe')]},
+    {'model': 'gpt-4o', 'messages': [message(fileId=3)]},
+    {'model': 5, 'messages': [message()]},
+    {'model': 'gpt-4o', 'messages': {'text': 'Hello'}},
+    {'model': 'gpt-4o', 'messages': ['Hello']},
+    ['gpt-4o'],
+]
+
+
+MALFORMED_BODIES = [b'', b'{"model": ', b'{"model": "gpt-4o", "messages": [],}', b'{"model": "gpt-4o", "messages": [}']
+
+
+@pytest.mark.parametrize(
+    'content', [json.dumps(body).encode() for body in VALID_BODIES + INVALID_BODIES] + MALFORMED_BODIES
+)
+def test_bodies_are_decoded_like_a_pydantic_body(content):
+    headers = {'Content-Type': 'application/json'}
+
+    with TestClient(app) as client:
+        expected = client.post('/pydantic/', content=content, headers=headers)
+        response = client.post('/decoded/', content=content, headers=headers)
+
+    assert (response.status_code, response.json()) == (expected.status_code, expected.json())
@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import json
+
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from chat_completion.idempotency import get_idempotency_store
+from core.asgi import app
+from users.models import UserProfile
+
+
+def get_body(text='Hello'):
+    return json.dumps({'model': 'stub', 'messages': [{'text': text, 'isUser': True, 'model': 'stub'}]}).encode()
+
+
+def chat(client, headers, text='Hello', key='key-1'):
+    return client.post(
+        '/api/fastapi/chat-completion/', content=get_body(text),
+        headers={**headers, 'Idempotency-Key': key, 'Content-Type': 'application/json'},
+    )
+
+
+@override_settings(CHAT_STUB_MODEL_ENABLED=True)
+def test_retry_replays_the_original_response(make_user):
+    user, headers = make_user(free_requests=2)
+
+    with TestClient(app) as client:
+        first = chat(client, headers)
+        retry = chat(client, headers)
+
+    assert retry.status_code == 200
+    assert retry.headers['X-Stream-Id'] == first.headers['X-Stream-Id']
+    assert retry.text == first.text
+    assert UserProfile.objects.get(user=user).free_requests == 1
+
+
+@override_settings(CHAT_STUB_MODEL_ENABLED=True)
+def test_key_reused_for_a_different_request_is_rejected(make_user):
+    _, headers = make_user()
+
+    with TestClient(app) as client:
+        chat(client, headers, text='Hello')
+        response = chat(client, headers, text='Something else')
+
+    assert response.status_code == 422
+
+
+@override_settings(CHAT_STUB_MODEL_ENABLED=True)
+def test_key_of_a_request_in_progress_is_rejected(make_user):
+    user, headers = make_user()
+
+    with TestClient(app) as client:
+        fingerprint = hashlib.sha256(get_body()).hexdigest()
+        client.portal.call(get_idempotency_store().claim, f'chat:{user.id}:key-1', {'fingerprint': fingerprint})
+        response = chat(client, headers)
+
+    assert response.status_code == 409
+    asyncio.run(get_idempotency_store().release(f'chat:{user.id}:key-1'))
+
+
+@override_settings(CHAT_STUB_MODEL_ENABLED=True)
+def test_failed_request_frees_its_key(make_user):
+    user, headers = make_user(free_requests=0)
+
+    with TestClient(app) as client:
+        failed = chat(client, headers)
+        UserProfile.objects.filter(user=user).update(free_requests=1)
+        retry = chat(client, headers)
+
+    assert failed.status_code == 403
+    assert retry.status_code == 200
@@ -0,0 +1,30 @@
+import json
+import logging
+import os
+
+from chat_completion.log import JsonFormatter, QueueLogHandler
+
+
+def test_forked_process_writes_records(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    handler = QueueLogHandler(queue_size=100)
+    handler.setFormatter(JsonFormatter())
+    handler.target.setStream(open(path, 'a'))
+    logger = logging.getLogger('chat_completion.tests.fork')
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        logger.warning('parent')
+        pid = os.fork()
+        if not pid:
+            logger.warning('child')
+            handler.close()
+            os._exit(0)
+        assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+        handler.close()
+    finally:
+        logger.removeHandler(handler)
+        handler.target.stream.close()
+
+    messages = [json.loads(line)['message'] for line in path.read_text().splitlines()]
+    assert sorted(messages) == ['child', 'parent']
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from django.test import override_settings
+from fastapi import HTTPException
+
+from chat_completion import attachments
+from chat_completion.api.fastapi.views import reserve_memory
+from chat_completion.attachments import MemoryBudget, MemoryReservation
+
+
+async def wait_for_queue(budget, length):
+    while len(budget.waiters) < length:
+        await asyncio.sleep(0)
+
+
+def test_waiting_requests_are_admitted_in_order():
+    async def run():
+        budget = MemoryBudget(budget_bytes=100, queue_timeout=5)
+        admitted = []
+
+        async def request(name, size):
+            await budget.acquire(size)
+            admitted.append(name)
+
+        await budget.acquire(80)
+        large = asyncio.create_task(request('large', 60))
+        await wait_for_queue(budget, 1)
+        small = asyncio.create_task(request('small', 10))
+        await wait_for_queue(budget, 2)
+        await asyncio.sleep(0.01)
+        # The small request fits, but waits behind the large one.
+        assert admitted == []
+        budget.release(80)
+        await asyncio.gather(large, small)
+        return admitted, budget.used_bytes
+
+    assert asyncio.run(run()) == (['large', 'small'], 70)
+
+
+def test_request_larger_than_budget_is_rejected_at_once():
+    async def run():
+        budget = MemoryBudget(budget_bytes=100, queue_timeout=5)
+        return await budget.acquire(101), budget.get_stats()['rejected']
+
+    assert asyncio.run(run()) == (False, 1)
+
+
+def test_request_waiting_too_long_times_out():
+    async def run():
+        budget = MemoryBudget(budget_bytes=100, queue_timeout=0.01)
+        await budget.acquire(100)
+        return await budget.acquire(1), budget.used_bytes, len(budget.waiters)
+
+    assert asyncio.run(run()) == (False, 100, 0)
+
+
+def test_cancelled_request_leaves_the_queue():
+    async def run():
+        budget = MemoryBudget(budget_bytes=100, queue_timeout=5)
+        await budget.acquire(80)
+        cancelled = asyncio.create_task(budget.acquire(60))
+        await wait_for_queue(budget, 1)
+        waiting = asyncio.create_task(budget.acquire(20))
+        await wait_for_queue(budget, 2)
+        cancelled.cancel()
+        # The request behind the cancelled one fits now.
+        admitted = await asyncio.wait_for(waiting, 1)
+        return admitted, budget.used_bytes, len(budget.waiters)
+
+    assert asyncio.run(run()) == (True, 100, 0)
+
+
+def test_reservation_is_released_once():
+    budget = MemoryBudget(budget_bytes=100)
+    asyncio.run(budget.acquire(30))
+    reservation = MemoryReservation(budget, 30)
+
+    reservation.release()
+    reservation.release()
+
+    assert budget.used_bytes == 0
+
+
+@pytest.mark.parametrize('sizes, status_code', [([60, 50], 413), ([40, 30], 503)])
+@override_settings(CHAT_MEMORY_BUDGET={'budget_bytes': 100, 'queue_timeout': 0.01})
+def test_reserve_memory_rejects_too_large_attachments_and_busy_workers(sizes, status_code):
+    providers = [SimpleNamespace(estimate_attachment_bytes=lambda messages, size=size: size) for size in sizes]
+
+    async def run():
+        await attachments.get_memory_budget().acquire(50)
+        with pytest.raises(HTTPException) as error:
+            await reserve_memory(providers, [])
+        return error.value
+
+    attachments._memory_budget = None
+    try:
+        error = asyncio.run(run())
+    finally:
+        attachments._memory_budget = None
+    assert error.status_code == status_code
+    assert (error.headers or {}).get('Retry-After') == ('1' if status_code == 503 else None)
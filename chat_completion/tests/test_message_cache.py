@@ -0,0 +1,38 @@
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from chat_completion.api.fastapi.decoding import ChatMessage
+from chat_completion.providers.deepseek import DeepSeek
+from chat_completion.providers.message_cache import message_cache
+
+
+def make_message():
+    file = SimpleNamespace(id=1, uuid=uuid.uuid4(), content_type='text/plain')
+    return ChatMessage('Read this', True, 'deepseek-chat', str(file.uuid), file)
+
+
+def test_converted_messages_are_reused():
+    provider = DeepSeek('deepseek-chat')
+    msg = make_message()
+
+    with mock.patch.object(DeepSeek, 'read_attachment', return_value='Y29udGVudA==') as read_attachment:
+        first = provider.build_messages([msg])
+        second = provider.build_messages([msg])
+
+    assert first == second
+    assert read_attachment.call_count == 1
+    message_cache.clear()
+
+
+def test_unreadable_file_is_read_again_next_turn():
+    provider = DeepSeek('deepseek-chat')
+    msg = make_message()
+
+    with mock.patch.object(DeepSeek, 'read_attachment', side_effect=[OSError('File is missing'), 'Y29udGVudA==']):
+        [failed] = provider.build_messages([msg])
+        [converted] = provider.build_messages([msg])
+
+    assert 'Could not read file' in failed['content']
+    assert 'Y29udGVudA==' in converted['content']
+    message_cache.clear()
@@ -0,0 +1,61 @@
+import asyncio
+from unittest import mock
+
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from chat_completion.rate_limits import get_plan_limits, InMemoryRateLimiter
+from core.asgi import app
+
+
+RATE_LIMITS = {
+    'backend': 'chat_completion.rate_limits.InMemoryRateLimiter',
+    'plans': {
+        'free': {'chat': {'capacity': 1, 'refill_rate': 1 / 60}, 'upload': {'capacity': 1, 'refill_rate': 1 / 60}},
+        'default': {'chat': {'capacity': 5, 'refill_rate': 1}, 'upload': {'capacity': 2, 'refill_rate': 1}},
+    },
+}
+
+
+def acquire_at(limiter, now, cost=1):
+    with mock.patch('chat_completion.rate_limits.time.monotonic', return_value=now):
+        return asyncio.run(limiter.acquire('chat:1', capacity=2, refill_rate=0.5, cost=cost))
+
+
+def test_bucket_rejects_when_empty_and_refills():
+    limiter = InMemoryRateLimiter()
+
+    assert acquire_at(limiter, 100) == (True, 0)
+    assert acquire_at(limiter, 100) == (True, 0)
+    assert acquire_at(limiter, 100) == (False, 2)
+    assert acquire_at(limiter, 101) == (False, 1)
+    assert acquire_at(limiter, 102) == (True, 0)
+
+
+def test_bucket_never_exceeds_capacity():
+    limiter = InMemoryRateLimiter()
+
+    acquire_at(limiter, 100, cost=2)
+    assert acquire_at(limiter, 1000, cost=3) == (False, 2)
+    assert acquire_at(limiter, 1000, cost=2) == (True, 0)
+
+
+@override_settings(CHAT_RATE_LIMITS=RATE_LIMITS)
+def test_plan_limits():
+    assert get_plan_limits(None, 'chat') == {'capacity': 1, 'refill_rate': 1 / 60}
+    assert get_plan_limits('free', 'upload') == {'capacity': 1, 'refill_rate': 1 / 60}
+    assert get_plan_limits('pro', 'upload') == {'capacity': 2, 'refill_rate': 1}
+
+
+@override_settings(CHAT_RATE_LIMITS=RATE_LIMITS, CHAT_STUB_MODEL_ENABLED=True)
+def test_chat_completion_over_limit_gets_429(make_user):
+    _, headers = make_user()
+    data = {'model': 'stub', 'messages': [{'text': 'Hello', 'isUser': True, 'model': 'stub'}]}
+
+    with TestClient(app) as client:
+        allowed = client.post('/api/fastapi/chat-completion/', json=data, headers=headers)
+        rejected = client.post('/api/fastapi/chat-completion/', json=data, headers=headers)
+
+    assert allowed.status_code == 200
+    assert rejected.status_code == 429
+    assert 0 < int(rejected.headers['Retry-After']) <= 60
@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+from django.test import override_settings
+
+from chat_completion.api.fastapi.decoding import ChatMessage
+from chat_completion.retrieval import add_excerpts, ChunkIndex, index_cache, split_chunks
+
+
+TOPICS = ['apples orchard harvest', 'volcano observatory launch code', 'river delta sediment', 'jazz piano chords']
+CHUNKS = [f'Section {index} about {TOPICS[index % len(TOPICS)]} and some shared filler words' for index in range(12)]
+RETRIEVAL = {
+    'enabled': True, 'min_bytes': 0, 'chunk_chars': 2000, 'overlap_chars': 200, 'top_k': 3, 'k1': 1.5, 'b': 0.75,
+    'cache_size': 100,
+}
+
+
+def test_chunks_overlap_and_end_at_whitespace():
+    words = [f'word{index}' for index in range(100)]
+
+    chunks = split_chunks(' '.join(words), 100, 20)
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.split()[-1] in words for chunk in chunks)
+    assert all(previous.split()[-1] in chunk for previous, chunk in zip(chunks, chunks[1:]))
+    assert chunks[-1].endswith('word99')
+
+
+def test_search_ranks_chunks_with_rare_query_terms_first():
+    index = ChunkIndex.build(CHUNKS)
+
+    assert index.search('Where is the volcano observatory?', 3) == [1, 5, 9]
+    assert index.search('jazz', 2) == [3, 7]
+    assert index.search('unrelated question', 3) == []
+
+
+def test_index_survives_serialization():
+    index = ChunkIndex.from_bytes(ChunkIndex.build(CHUNKS).to_bytes())
+
+    assert index.search('river delta', 3) == [2, 6, 10]
+
+
+def make_upload(upload_id):
+    upload = SimpleNamespace(id=upload_id, uuid=upload_id, original_name=f'{upload_id}.txt')
+    index_cache.set(upload_id, (ChunkIndex.build(CHUNKS), CHUNKS))
+    return upload
+
+
+@override_settings(CHAT_RETRIEVAL=RETRIEVAL)
+def test_excerpts_of_earlier_turns_stay_fixed():
+    first, second = make_upload(-1), make_upload(-2)
+
+    def run(question):
+        messages = [
+            ChatMessage('What is the launch code of the volcano?', True, 'stub', 'first', first),
+            ChatMessage('Answer', False, 'stub'),
+            ChatMessage('Tell me about apples', True, 'stub', 'second', second),
+            ChatMessage('Answer', False, 'stub'),
+            ChatMessage(question, True, 'stub'),
+        ]
+        asyncio.run(add_excerpts(messages))
+        return messages[0].file.excerpts, messages[2].file.excerpts
+
+    first_excerpts, newest_excerpts = run('And the jazz chords?')
+    next_first_excerpts, next_newest_excerpts = run('What about river sediment?')
+
+    assert first_excerpts == next_first_excerpts
+    assert 'volcano' in first_excerpts and 'jazz' not in first_excerpts
+    assert 'jazz' in newest_excerpts and 'river' in next_newest_excerpts
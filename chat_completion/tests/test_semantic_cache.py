@@ -0,0 +1,43 @@
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from chat_completion import semantic_cache
+from chat_completion.semantic_cache import SemanticCache
+from core.asgi import app
+
+
+def test_answers_are_scoped_to_the_user():
+    cache = SemanticCache(capacity=10)
+    cache.set(1, 'stub', 'What is my account number?', 'It is 12345.')
+
+    assert cache.get(1, 'stub', 'what is my account number') == 'It is 12345.'
+    assert cache.get(2, 'stub', 'What is my account number?') is None
+    assert cache.get(1, 'other', 'What is my account number?') is None
+
+
+def test_negations_and_numbers_must_match():
+    cache = SemanticCache(capacity=10)
+    cache.set(1, 'stub', 'Is it safe to take ibuprofen with alcohol?', 'No.')
+    cache.set(1, 'stub', 'How much is 20 percent of 150?', '30')
+
+    assert cache.get(1, 'stub', 'Is it safe to take ibuprofen with alcohol') == 'No.'
+    assert cache.get(1, 'stub', 'Is it not safe to take ibuprofen with alcohol?') is None
+    assert cache.get(1, 'stub', "Isn't it safe to take ibuprofen with alcohol?") is None
+    assert cache.get(1, 'stub', 'How much is 20 percent of 160?') is None
+
+
+def test_chat_completion_doesnt_serve_other_users_answers(make_user):
+    _, headers = make_user()
+    _, other_headers = make_user()
+    data = {'model': 'stub', 'messages': [{'text': 'What is my address?', 'isUser': True, 'model': 'stub'}]}
+    semantic_cache._semantic_cache = None
+    config = {'enabled': True, 'dim': 256, 'capacity': 10, 'threshold': 0.95}
+
+    with override_settings(CHAT_STUB_MODEL_ENABLED=True, CHAT_SEMANTIC_CACHE=config), TestClient(app) as client:
+        client.post('/api/fastapi/chat-completion/', json=data, headers=headers)
+        own = client.post('/api/fastapi/chat-completion/', json=data, headers=headers)
+        other = client.post('/api/fastapi/chat-completion/', json=data, headers=other_headers)
+    semantic_cache._semantic_cache = None
+
+    assert own.headers.get('X-Cache') == 'hit'
+    assert other.headers.get('X-Cache') is None
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from django.test import override_settings
+
+from chat_completion import stream_buffers
+from chat_completion.stream_buffers import (
+    InMemoryStreamBuffer, start_buffered_stream, StreamExpired, StreamNotFound,
+)
+
+
+async def read_all(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+def test_stream_resumes_from_offset():
+    async def run():
+        buffer = InMemoryStreamBuffer()
+        stream_id = await buffer.create('owner')
+        await buffer.append(stream_id, b'Hello ')
+        await buffer.append(stream_id, b'world')
+        await buffer.finish(stream_id)
+        return await buffer.get_state(stream_id), await read_all(buffer.read(stream_id, 6))
+
+    assert asyncio.run(run()) == (('owner', 0), b'world')
+
+
+def test_reading_dropped_data_raises_stream_expired():
+    async def run():
+        buffer = InMemoryStreamBuffer(max_bytes=4)
+        stream_id = await buffer.create('owner')
+        await buffer.append(stream_id, b'abcdefgh')
+        await buffer.finish(stream_id)
+        _, start = await buffer.get_state(stream_id)
+        with pytest.raises(StreamExpired):
+            await read_all(buffer.read(stream_id))
+        return start, await read_all(buffer.read(stream_id, start))
+
+    assert asyncio.run(run()) == (4, b'efgh')
+
+
+def test_finished_stream_expires_after_ttl():
+    async def run():
+        buffer = InMemoryStreamBuffer(ttl=0.01)
+        stream_id = await buffer.create('owner')
+        await buffer.finish(stream_id)
+        await asyncio.sleep(0.05)
+        with pytest.raises(StreamNotFound):
+            await buffer.get_state(stream_id)
+        return buffer.streams
+
+    assert asyncio.run(run()) == {}
+
+
+@override_settings(CHAT_STREAM_BUFFER={
+    'backend': 'chat_completion.stream_buffers.InMemoryStreamBuffer', 'max_bytes': 4, 'ttl': 60,
+})
+def test_live_reader_gets_whole_stream_when_behind():
+    async def chunks():
+        for word in ['one ', 'two ', 'three']:
+            yield word
+
+    async def run():
+        stream_id, task, live_reader = await start_buffered_stream(chunks(), 'owner')
+        await task
+        return await read_all(live_reader.read()), await stream_buffers.get_stream_buffer().get_state(stream_id)
+
+    stream_buffers._stream_buffer = None
+    try:
+        assert asyncio.run(run()) == (b'one two three', ('owner', 9))
+    finally:
+        stream_buffers._stream_buffer = None
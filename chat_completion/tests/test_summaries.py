@@ -0,0 +1,48 @@
+import asyncio
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from chat_completion.api.fastapi.schemas import Message
+from chat_completion.summaries import apply_summary, get_pending_key, prefix_hashes
+from chat_completion.tasks import summarize_conversation
+
+
+SUMMARIZATION = {
+    'enabled': True, 'model': 'stub', 'trigger_tokens': 200, 'chunk_tokens': 150, 'keep_recent': 4,
+    'pending_ttl': 60,
+}
+
+
+def make_conversation(turns):
+    messages = []
+    for turn in range(turns):
+        messages.append(Message(text=f'Question {turn} ' + 'lorem ipsum ' * 20, isUser=True, model='stub'))
+        messages.append(Message(text='Answer ' * 20, isUser=False, model='stub'))
+    messages.append(Message(text='Last question', isUser=True, model='stub'))
+    return messages
+
+
+@override_settings(CHAT_SUMMARIZATION=SUMMARIZATION)
+def test_summary_is_queued_once_while_pending(make_user):
+    user, _ = make_user()
+    messages = make_conversation(4)
+
+    with mock.patch.object(summarize_conversation, 'delay') as delay:
+        asyncio.run(apply_summary(user.id, 'stub', messages))
+        asyncio.run(apply_summary(user.id, 'stub', [*messages, *make_conversation(1)]))
+
+    assert delay.call_count == 1
+    cache.delete(delay.call_args.args[3])
+
+
+@override_settings(CHAT_SUMMARIZATION=SUMMARIZATION)
+def test_turn_continues_when_summary_cant_be_queued(make_user):
+    user, _ = make_user()
+    messages = make_conversation(4)
+
+    with mock.patch.object(summarize_conversation, 'delay', side_effect=ConnectionError('Broker is down')):
+        assert asyncio.run(apply_summary(user.id, 'stub', messages)) == messages
+
+    assert cache.get(get_pending_key(user.id, prefix_hashes(messages)[0])) is None
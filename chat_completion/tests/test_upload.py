@@ -0,0 +1,28 @@
+from unittest import mock
+
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from chat_completion.models import FileUpload
+from chat_completion.tasks import index_file_upload
+from core.asgi import app
+
+
+def upload(client, headers, content):
+    return client.post(
+        '/api/fastapi/upload-file/', files={'file': ('notes.txt', content, 'text/plain')}, headers=headers
+    )
+
+
+def test_upload_succeeds_when_indexing_cant_be_queued(make_user, tmp_path):
+    _, headers = make_user()
+    content = ' '.join(f'word{index}' for index in range(20000)).encode()
+
+    with (
+        override_settings(MEDIA_ROOT=str(tmp_path)), TestClient(app) as client,
+        mock.patch.object(index_file_upload, 'delay', side_effect=ConnectionError('Broker is down')),
+    ):
+        response = upload(client, headers, content)
+
+    assert response.status_code == 200
+    assert FileUpload.objects.filter(uuid=response.json()['uuid']).exists()
@@ -0,0 +1,40 @@
+from django.test import override_settings
+from fastapi.testclient import TestClient
+
+from core.asgi import app
+
+
+def connect(client, headers):
+    token = headers['Authorization'].removeprefix('Bearer ')
+    return client.websocket_connect(f'/api/fastapi/chat-ws/?token={token}')
+
+
+def test_binary_frame_gets_an_error_and_keeps_the_session(make_user):
+    _, headers = make_user()
+
+    with TestClient(app) as client, connect(client, headers) as websocket:
+        websocket.send_bytes(b'\x00\x01')
+        error = websocket.receive_json()
+        websocket.send_json({'type': 'ping'})
+        pong = websocket.receive_json()
+
+    assert error == {'type': 'error', 'id': None, 'status': 400, 'detail': 'Frames must be text'}
+    assert pong == {'type': 'pong'}
+
+
+def test_chat_turn_streams_chunks(make_user):
+    _, headers = make_user()
+    frame = {'type': 'chat', 'id': 1, 'model': 'stub', 'messages': [{'text': 'Hello', 'isUser': True, 'model': 'stub'}]}
+
+    with (
+        override_settings(CHAT_STUB_MODEL_ENABLED=True), TestClient(app) as client,
+        connect(client, headers) as websocket,
+    ):
+        websocket.send_json(frame)
+        frames = [websocket.receive_json()]
+        while frames[-1]['type'] in ('start', 'chunk'):
+            frames.append(websocket.receive_json())
+
+    assert frames[0] == {'type': 'start', 'id': 1, 'model': 'stub'}
+    assert frames[-1] == {'type': 'done', 'id': 1}
+    assert ''.join(frame['text'] for frame in frames[1:-1]).startswith('Stub response')
@@ -0,0 +1,56 @@
+"""Breakdown of the time to first byte of chat requests into stages."""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+request_trace = ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    """Start and duration of the stages of a request, in ms since it was received.
+
+    Stages that ran concurrently overlap, so their durations don't add up to the total.
+    """
+
+    def __init__(self):
+        """Start the clock."""
+        self.started_at = time.monotonic()
+        self.stages = {}
+
+    def get_elapsed_ms(self, at=None):
+        """Milliseconds from the start of the request until ``at`` or now."""
+        return round(((at or time.monotonic()) - self.started_at) * 1000, 1)
+
+    def add(self, stage, started_at):
+        """Record a stage that started at ``started_at`` and ended now."""
+        start_ms = self.get_elapsed_ms(started_at)
+        self.stages[stage] = {'start_ms': start_ms, 'ms': round(self.get_elapsed_ms() - start_ms, 1)}
+
+    def mark(self, stage):
+        """Record the moment a request reached a stage."""
+        self.stages.setdefault(stage, {'start_ms': self.get_elapsed_ms(), 'ms': 0})
+
+
+@contextmanager
+def trace_stage(stage):
+    """Time a stage of the current request, when it is traced."""
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        if (trace := request_trace.get()) is not None:
+            trace.add(stage, started_at)
+
+
+async def traced(stage, awaitable):
+    """Await an awaitable as a stage of the current request."""
+    with trace_stage(stage):
+        return await awaitable
+
+
+def mark_stage(stage):
+    """Record that the current request reached a stage, when it is traced."""
+    if (trace := request_trace.get()) is not None:
+        trace.mark(stage)
@@ -0,0 +1,131 @@
+"""Capture of anonymized chat requests, to replay the shape of real traffic against a test instance.
+
+Message texts are replaced with filler of the same length and attachments with their content type and size,
+so captures keep the sizes that matter for performance but no user content.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+FILLER = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+
+
+def get_filler(length):
+    """Text of ``length`` characters."""
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+def get_attachments(messages):
+    """Content type and size of the uploads messages reference, by ``fileId``."""
+    from chat_completion.models import FileUpload
+
+    file_ids = {msg['fileId'] for msg in messages if msg.get('fileId')}
+    attachments = {}
+    for upload in FileUpload.objects.filter(uuid__in=file_ids):
+        try:
+            size = upload.file.size
+        except OSError:
+            size = None
+        attachments[str(upload.uuid)] = {'content_type': upload.content_type, 'size': size}
+    return attachments
+
+
+def anonymize_request(data):
+    """Replace the content of a chat request body with filler."""
+    messages = [msg for msg in data.get('messages') or [] if isinstance(msg, dict)]
+    attachments = get_attachments(messages)
+    anonymized = []
+    for msg in messages:
+        text = msg.get('text')
+        message = {
+            'text': get_filler(len(text)) if isinstance(text, str) else text,
+            'isUser': msg.get('isUser'),
+            'model': msg.get('model'),
+        }
+        if msg.get('fileId'):
+            message['attachment'] = attachments.get(str(msg['fileId']), {'content_type': None, 'size': None})
+        anonymized.append(message)
+    return {
+        **{key: data[key] for key in ('model', 'models') if key in data},
+        'messages': anonymized,
+    }
+
+
+class TrafficRecorder:
+    """Write captured requests as JSON lines to ``path`` from a background thread.
+
+    Requests are anonymized by the thread, recording only puts them on a queue of ``queue_size``. When the
+    queue is full captures are dropped and counted in ``dropped``.
+    """
+
+    def __init__(self, path, queue_size=1000):
+        """Initialize queue, the thread is started on first use."""
+        self.path = path
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the writing thread."""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='traffic-recorder', daemon=True)
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Write queued captures and stop the thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join(timeout)
+
+    def record(self, capture, body):
+        """Queue a capture with the raw request body."""
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait((capture, body))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        """Anonymize and write captures until stopped."""
+        with open(self.path, 'a') as output:
+            while (item := self.queue.get()) is not None:
+                capture, body = item
+                try:
+                    data = json.loads(body)
+                    if not isinstance(data, dict):
+                        continue
+                    capture['request'] = anonymize_request(data)
+                    capture['message_count'] = len(capture['request']['messages'])
+                    output.write(json.dumps(capture) + '\n')
+                    output.flush()
+                except Exception as e:
+                    logger.error(f"Couldn't capture request: {e}")
+                finally:
+                    close_old_connections()
+
+
+_traffic_recorder = None
+
+
+def get_traffic_recorder():
+    """Get the recorder writing to ``CHAT_TRAFFIC_CAPTURE['path']``."""
+    global _traffic_recorder
+    if _traffic_recorder is None:
+        config = settings.CHAT_TRAFFIC_CAPTURE
+        _traffic_recorder = TrafficRecorder(config['path'], config['queue_size'])
+    return _traffic_recorder
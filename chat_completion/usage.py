@@ -0,0 +1,134 @@
+"""Write-behind recording of provider token usage."""
+
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    """Queue usage records in memory and write them in bulk from a background thread.
+
+    Records are flushed when ``max_records`` are queued or every ``flush_interval`` seconds, so recording usage
+    never waits on the database. When a bulk insert fails the rows are saved one at a time, rows the database
+    rejects are dropped and the rest are put back in the queue when it is unavailable, up to ``max_pending``.
+    """
+
+    fields = (
+        'requests', 'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens', 'ttft_ms_total',
+        'ttft_count',
+    )
+
+    def __init__(self, max_records=500, flush_interval=10, max_pending=50000):
+        """Initialize queue and flush thresholds."""
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.records = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the flush thread."""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name='usage-recorder', daemon=True)
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Stop the flush thread and write everything that is still queued."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.stopped.set()
+            self.wakeup.set()
+            thread.join(timeout)
+        self.flush()
+
+    def record(self, user_id, model, **usage):
+        """Queue token usage of a single completion."""
+        if self.thread is None:
+            self.start()
+        with self.lock:
+            self.records.append((user_id, model, timezone.now().date(), {'requests': 1, **usage}))
+            queued = len(self.records)
+        if queued >= self.max_records:
+            self.wakeup.set()
+
+    def _run(self):
+        """Flush records until stopped."""
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def aggregate(self, records):
+        """Sum records per user, model and day."""
+        totals = defaultdict(lambda: dict.fromkeys(self.fields, 0))
+        for user_id, model, day, usage in records:
+            bucket = totals[(user_id, model, day)]
+            for field, value in usage.items():
+                if field in bucket:
+                    bucket[field] += value or 0
+        return totals
+
+    def flush(self):
+        """Write queued records to the database."""
+        from chat_completion.models import TokenUsage
+
+        with self.flush_lock:
+            with self.lock:
+                records, self.records = self.records, []
+            if not records:
+                return
+
+            rows = [(*key, totals) for key, totals in self.aggregate(records).items()]
+            try:
+                TokenUsage.objects.bulk_create([
+                    TokenUsage(user_id=user_id, model=model, day=day, **totals) for user_id, model, day, totals in rows
+                ])
+            except Exception as e:
+                logger.warning(f"Could not save {len(rows)} usage rows at once, saving them one at a time: {e}")
+                unsaved = self.save_rows(rows)
+                if unsaved:
+                    with self.lock:
+                        self.records = (unsaved + self.records)[-self.max_pending:]
+            finally:
+                close_old_connections()
+
+    def save_rows(self, rows):
+        """Save aggregated rows one at a time. Return the rows to retry when the database is unavailable."""
+        from chat_completion.models import TokenUsage
+
+        for index, (user_id, model, day, totals) in enumerate(rows):
+            try:
+                TokenUsage.objects.create(user_id=user_id, model=model, day=day, **totals)
+            except (IntegrityError, DataError) as e:
+                logger.error(f"Dropped usage of user {user_id} with {model} on {day}: {e}")
+            except Exception as e:
+                logger.error(f"Could not save {len(rows) - index} usage rows: {e}")
+                return rows[index:]
+        return []
+
+
+usage_recorder = UsageRecorder(**settings.CHAT_USAGE_METERING)
+
+
+@worker_process_shutdown.connect
+def flush_usage_on_worker_shutdown(**kwargs):
+    """Celery worker processes can exit without running atexit handlers."""
+    usage_recorder.stop()
@@ -0,0 +1,23 @@
+"""Test setup, Django with a test database for the whole session."""
+
+import os
+
+import django
+import pytest
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings.test')
+django.setup()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_database():
+    """Create the test database and drop it after the session."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    database_name = connection.creation.create_test_db(verbosity=0)
+    yield
+    connection.creation.destroy_test_db(database_name, verbosity=0)
+    teardown_test_environment()
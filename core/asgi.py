@@ -1,13 +1,16 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 from django.conf import settings
 from django.core.asgi import get_asgi_application
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 
-fastapp = FastAPI()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_django_project.settings')
+fastapp = FastAPI()
 
 django_app = get_asgi_application()
 
@@ -17,18 +20,42 @@ fastapp.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id", "X-Request-Id", "X-Model", "X-Cache"],
 )
 
 # Do not move this import to the top of the file
 # to avoid circular import issues
 
+from chat_completion.api.fastapi.middleware import (  # noqa isort:skip E402
+    LoopLagMiddleware, RequestIdMiddleware, TraceMiddleware, TrafficCaptureMiddleware
+)
 from chat_completion.api.fastapi.views import chat_router  # noqa isort:skip E402
+from chat_completion.providers import preload_providers  # noqa isort:skip E402
 
+fastapp.add_middleware(TraceMiddleware)
+fastapp.add_middleware(TrafficCaptureMiddleware)
+fastapp.add_middleware(LoopLagMiddleware)
+fastapp.add_middleware(RequestIdMiddleware)
 fastapp.include_router(chat_router)
+preload_providers()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Load chat models before serving requests and write queued token usage before the worker exits.
+
+    Lifespans of mounted apps don't run, so it is the lifespan of the outer app.
+    """
+    from chat_completion.model_registry import model_registry
+    from chat_completion.usage import usage_recorder
+
+    await model_registry.refresh()
+    yield
+    await asyncio.to_thread(usage_recorder.stop)
 
 
 # Mount FastAPI app under a specific path (e.g., /api/fastapi)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.mount("/api/fastapi", fastapp)
 app.mount("/", django_app)
 
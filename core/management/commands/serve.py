@@ -0,0 +1,257 @@
+"""Serve the ASGI app with preloaded uvicorn worker processes."""
+
+import asyncio
+import gc
+import logging
+import os
+import random
+import signal
+import time
+
+import uvicorn
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """Uvicorn server that drains chat streams before shutting down.
+
+    On the first SIGTERM or SIGINT the worker reports not ready and rejects new chat streams while it keeps
+    serving other requests. It shuts down once running streams finish or ``drain_timeout`` passes. Only a second
+    SIGINT shuts it down right away, a SIGTERM while draining is ignored as the supervisor sends one to workers
+    that already got the signal of a Ctrl-C or of their process group. After ``max_requests`` requests it stops
+    accepting connections and drains the same way.
+
+    Uvicorn doesn't raise the captured signals again after serving, the worker process exits by itself after its
+    shutdown hooks ran.
+    """
+
+    def __init__(self, config, drain_timeout, max_requests=None):
+        """Initialize drain settings."""
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+        self.max_requests = max_requests
+        self.drain_task = None
+        self.loop = None
+
+    async def serve(self, sockets=None):
+        """Keep a reference to the event loop for signal handlers."""
+        self.loop = asyncio.get_running_loop()
+        await super().serve(sockets=sockets)
+
+    def handle_exit(self, sig, frame):
+        """Start draining on the first signal, shut down right away on a SIGINT while draining."""
+        if self.drain_task is None and self.loop is not None and self.drain_timeout:
+            self.loop.call_soon_threadsafe(self.start_drain)
+        elif self.drain_task is None or sig == signal.SIGINT:
+            super().handle_exit(sig, frame)
+        self._captured_signals.clear()
+
+    async def on_tick(self, counter):
+        """Start draining once the worker served ``max_requests``."""
+        if (
+            self.max_requests is not None and self.drain_task is None
+            and self.server_state.total_requests >= self.max_requests
+        ):
+            logger.info(f"Served {self.server_state.total_requests} requests, draining before restart.")
+            for server in self.servers:
+                server.close()
+            self.start_drain()
+        return await super().on_tick(counter)
+
+    def start_drain(self):
+        """Start draining in the background."""
+        if self.drain_task is None:
+            self.drain_task = asyncio.create_task(self.drain())
+
+    async def drain(self):
+        """Wait for running streams and exit."""
+        from chat_completion.api.fastapi.lifecycle import stream_registry
+
+        remaining = await stream_registry.drain(self.drain_timeout)
+        if remaining:
+            logger.warning(f"Shutting down with {remaining} streams still running.")
+        self.should_exit = True
+
+
+class Command(BaseCommand):
+    """Run uvicorn workers forked from a parent that has already imported the app.
+
+    Workers share the parent's memory pages copy-on-write, so the app and its imports are only loaded once.
+    A worker exits after serving ``--max-requests`` requests and the parent starts a new one in its place.
+    Workers that fail within ``crash_uptime`` seconds of starting are restarted after a backoff doubling up to
+    ``max_backoff`` seconds.
+    """
+
+    crash_uptime = 10
+    max_backoff = 30
+
+    help = 'Serve the ASGI app with preloaded uvicorn worker processes.'
+
+    def add_arguments(self, parser):
+        """Add serve options, defaults come from the SERVE setting."""
+        config = settings.SERVE
+        parser.add_argument('--host', default=config['host'])
+        parser.add_argument('--port', type=int, default=config['port'])
+        parser.add_argument('--workers', type=int, default=config['workers'])
+        parser.add_argument('--backlog', type=int, default=config['backlog'], help='Max pending connections.')
+        parser.add_argument('--keep-alive', type=int, default=config['keep_alive'], help='Keep-alive timeout.')
+        parser.add_argument('--loop', default=config['loop'], choices=['auto', 'asyncio', 'uvloop'])
+        parser.add_argument('--http', default=config['http'], choices=['auto', 'h11', 'httptools'])
+        parser.add_argument(
+            '--max-requests', type=int, default=config['max_requests'],
+            help='Restart a worker after this many requests, 0 to never restart.',
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=config['max_requests_jitter'],
+            help='Random extra requests per worker so workers do not restart at the same time.',
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=int, default=config['graceful_timeout'],
+            help='Seconds workers get to finish requests on shutdown.',
+        )
+        parser.add_argument(
+            '--drain-timeout', type=int, default=config['drain_timeout'],
+            help='Seconds workers wait for running chat streams before shutting down, 0 to not wait.',
+        )
+
+    def handle(self, *args, **options):
+        """Load the app, bind the socket and supervise workers."""
+        from core.asgi import app
+
+        self.options = options
+        self.config = uvicorn.Config(
+            app,
+            host=options['host'],
+            port=options['port'],
+            loop=options['loop'],
+            http=options['http'],
+            backlog=options['backlog'],
+            timeout_keep_alive=options['keep_alive'],
+            timeout_graceful_shutdown=options['graceful_timeout'],
+            lifespan='on',
+        )
+        self.socket = self.config.bind_socket()
+        self.workers = {}
+        self.started_at = {}
+        self.crashes = {}
+        self.stopping = False
+
+        # Connections can't be shared between processes, workers open their own.
+        connections.close_all()
+        # Keep preloaded objects out of garbage collection so workers don't copy their pages.
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill_workers)
+
+        for index in range(options['workers']):
+            self.spawn_worker(index)
+        self.supervise()
+
+    def get_max_requests(self):
+        """Request limit of a new worker."""
+        if not self.options['max_requests']:
+            return None
+        return self.options['max_requests'] + random.randint(0, self.options['max_requests_jitter'])
+
+    def spawn_worker(self, index):
+        """Fork a worker process."""
+        max_requests = self.get_max_requests()
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = index
+            self.started_at[index] = time.monotonic()
+            return
+
+        exit_code = 0
+        try:
+            if not self.run_worker(max_requests):
+                logger.error('Worker failed to start.')
+                exit_code = 1
+        except Exception:
+            logger.exception('Worker crashed.')
+            exit_code = 1
+        finally:
+            # Signals after serving must not kill the worker before its shutdown hooks ran.
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signal_number, signal.SIG_IGN)
+            self.shutdown_worker()
+            os._exit(exit_code)
+
+    def run_worker(self, max_requests):
+        """Serve requests in a worker process. Return whether the server started."""
+        for signal_number in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+            signal.signal(signal_number, signal.SIG_DFL)
+        random.seed()
+
+        server = DrainingServer(self.config, self.options['drain_timeout'], max_requests)
+        server.run(sockets=[self.socket])
+        return server.started
+
+    @staticmethod
+    def shutdown_worker():
+        """Run what the atexit handlers ``os._exit`` skips would: write queued usage, captures and log records."""
+        from chat_completion.traffic import get_traffic_recorder
+        from chat_completion.usage import usage_recorder
+
+        for stop in (usage_recorder.stop, get_traffic_recorder().stop):
+            try:
+                stop()
+            except Exception:
+                logger.exception('Worker shutdown hook failed.')
+        logging.shutdown()
+
+    def supervise(self):
+        """Replace workers that exit until the server is stopped."""
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = self.workers.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            crashed = exit_code != 0 and time.monotonic() - self.started_at[index] < self.crash_uptime
+            self.crashes[index] = self.crashes.get(index, 0) + 1 if crashed else 0
+            backoff = min(self.max_backoff, 2 ** (self.crashes[index] - 1)) if crashed else 0
+            logger.info(f'Worker {pid} exited with status {exit_code}, starting a new one in {backoff} s.')
+            self.wait(backoff)
+            if not self.stopping:
+                self.spawn_worker(index)
+        self.socket.close()
+
+    def wait(self, seconds):
+        """Sleep unless the server is stopped meanwhile."""
+        deadline = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(max(0, min(0.1, deadline - time.monotonic())))
+
+    def stop(self, signal_number, frame):
+        """Ask workers to finish their requests and exit."""
+        if self.stopping:
+            return
+        self.stopping = True
+        self.stdout.write(f'Stopping {len(self.workers)} workers.')
+        for pid in self.workers:
+            self.signal_worker(pid, signal.SIGTERM)
+        signal.alarm(self.options['drain_timeout'] + self.options['graceful_timeout'] + 5)
+
+    def kill_workers(self, signal_number, frame):
+        """Kill workers that didn't exit in time."""
+        for pid in self.workers:
+            self.signal_worker(pid, signal.SIGKILL)
+
+    @staticmethod
+    def signal_worker(pid, signal_number):
+        """Send a signal to a worker that may already have exited."""
+        try:
+            os.kill(pid, signal_number)
+        except ProcessLookupError:
+            pass
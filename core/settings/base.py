@@ -210,3 +210,243 @@ FRONTEND_PAYMENT_FAILURE_URL = ''
 GEMINI_API_KEY = ''
 OPENAI_API_KEY = ''
 ANTHROPIC_API_KEY = ''
+DEEPSEEK_API_KEY = ''
+
+# Generated chat output is kept for resuming interrupted streams. Use
+# chat_completion.stream_buffers.RedisStreamBuffer with a 'url' option when running multiple nodes.
+CHAT_STREAM_BUFFER = {
+    'backend': 'chat_completion.stream_buffers.InMemoryStreamBuffer',
+    'max_bytes': 256 * 1024,
+    'ttl': 300,
+}
+
+CHAT_BATCH = {
+    'chunk_size': 20,
+    'max_conversations': 1000,
+    'poll_interval': 60,
+    # Max concurrent provider requests of the jobs run by ConcurrentBatchBackend, per provider.
+    'concurrency': {
+        'default': 4,
+        'anthropic': 2,
+    },
+    # Counts the requests of all Celery workers in Redis. InMemoryConcurrencyLimiter counts per worker process.
+    'concurrency_limiter': {
+        'backend': 'chat_completion.batch.RedisConcurrencyLimiter',
+        'url': CELERY_BROKER_URL,
+        'lease_timeout': 600,
+    },
+    # Providers with a cheaper asynchronous batch API.
+    'backends': {
+        'openai': 'chat_completion.batch.OpenAIBatchBackend',
+        'anthropic': 'chat_completion.batch.AnthropicBatchBackend',
+        'stub': 'chat_completion.batch.StubBatchBackend',
+    },
+    'default_backend': 'chat_completion.batch.ConcurrentBatchBackend',
+}
+
+# Expose the offline 'stub' model which answers without calling any provider.
+CHAT_STUB_MODEL_ENABLED = DEBUG
+CHAT_STUB_PROVIDER_DELAY = 0
+
+# Token usage is queued in memory and written in bulk when either threshold is reached.
+CHAT_USAGE_METERING = {
+    'max_records': 500,
+    'flush_interval': 10,
+}
+
+# Token buckets per user for chat and upload requests. Plans are package names, users without a
+# subscription use 'free' and packages without their own entry use 'default'. Use
+# chat_completion.rate_limits.RedisRateLimiter with a 'url' option to share limits between workers.
+CHAT_RATE_LIMITS = {
+    'backend': 'chat_completion.rate_limits.InMemoryRateLimiter',
+    'plans': {
+        'free': {
+            'chat': {'capacity': 5, 'refill_rate': 1 / 30},
+            'upload': {'capacity': 5, 'refill_rate': 1 / 30},
+        },
+        'default': {
+            'chat': {'capacity': 20, 'refill_rate': 1 / 3},
+            'upload': {'capacity': 10, 'refill_rate': 1 / 6},
+        },
+    },
+}
+
+# Seconds between checks of the AIModel table for changes.
+CHAT_MODEL_REGISTRY_REFRESH_INTERVAL = 30
+
+CHAT_PROVIDERS = {
+    'openai': 'chat_completion.providers.openai.OpenAI',
+    'deepseek': 'chat_completion.providers.deepseek.DeepSeek',
+    'anthropic': 'chat_completion.providers.anthropic.Anthropic',
+    'gemini': 'chat_completion.providers.gemini.Gemini',
+    'stub': 'chat_completion.providers.stub.Stub',
+}
+# Providers imported when the ASGI app loads instead of on their first request.
+CHAT_PROVIDER_PRELOAD = []
+
+# Defaults of the serve management command.
+SERVE = {
+    'host': '0.0.0.0',
+    'port': 8000,
+    'workers': 4,
+    'backlog': 2048,
+    'keep_alive': 5,
+    'loop': 'auto',
+    'http': 'auto',
+    'max_requests': 10000,
+    'max_requests_jitter': 1000,
+    'graceful_timeout': 30,
+    'drain_timeout': 120,
+}
+
+# Rolling summaries of long conversations. Once the unsummarized history is over ``trigger_tokens`` (or half
+# the model's context window) older turns are summarized in the background with ``model`` in chunks of
+# ``chunk_tokens`` and later requests send the summary with the last ``keep_recent`` messages. A conversation
+# isn't queued again for ``pending_ttl`` seconds while its summary is queued, use a cache shared by the workers.
+CHAT_SUMMARIZATION = {
+    'enabled': True,
+    'model': 'gpt-4o-mini',
+    'trigger_tokens': 12000,
+    'chunk_tokens': 8000,
+    'keep_recent': 10,
+    'pending_ttl': 600,
+}
+
+# WebSocket chat sessions. Frames waiting to be sent are capped at ``send_queue_size``.
+CHAT_WEBSOCKET = {
+    'send_queue_size': 64,
+    'heartbeat_interval': 20,
+    'idle_timeout': 60,
+}
+
+# Comparing the answers of several models to one conversation.
+CHAT_COMPARE = {
+    'max_models': 4,
+    'queue_size': 64,
+}
+
+# Chat messages already converted to a provider's format, reused on later turns of the same conversation.
+CHAT_MESSAGE_CACHE = {
+    'max_entries': 10000,
+    'max_bytes': 64 * 1024 * 1024,
+}
+
+# Attachments over ``inline_max_bytes`` are base64 encoded or converted to text in a ``'process'`` or
+# ``'thread'`` pool, with at most ``max_in_flight`` at once per worker.
+CHAT_ATTACHMENT_OFFLOAD = {
+    'executor': 'process',
+    'max_workers': 2,
+    'inline_max_bytes': 256 * 1024,
+    'max_in_flight': 8,
+}
+
+# Requests reserve the estimated memory of converting their attachments from a per-worker budget of
+# ``budget_bytes`` first. They wait up to ``queue_timeout`` seconds for it, then get a 503.
+CHAT_MEMORY_BUDGET = {
+    'budget_bytes': 512 * 1024 * 1024,
+    'queue_timeout': 10,
+}
+
+# Conversations attached to chat log records keep at most ``max_payload_chars`` of JSON, strings are cut
+# at ``max_field_chars``.
+CHAT_LOG = {
+    'max_payload_chars': 4000,
+    'max_field_chars': 200,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'chat_completion.log.RequestIdFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'chat_completion.log.JsonFormatter'},
+    },
+    'handlers': {
+        'chat': {
+            '()': 'chat_completion.log.QueueLogHandler',
+            'queue_size': 10000,
+            'filters': ['request_id'],
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'chat_completion': {'handlers': ['chat'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Reports event loop blocks longer than ``threshold_ms`` with the blocking stack and logs requests during
+# which the loop lagged. The heartbeat runs every ``interval_ms``.
+CHAT_LOOP_MONITOR = {
+    'enabled': DEBUG,
+    'threshold_ms': 100,
+    'interval_ms': 20,
+}
+
+# Rules of the ``auto`` model per plan, candidate models in order of preference. ``max_prompt_tokens`` limits
+# the prompts a model takes and ``cost`` multiplies its expected latency to make it less preferred.
+CHAT_AUTO_ROUTING = {
+    'alpha': 0.2,
+    'max_error_rate': 0.5,
+    'error_penalty': 4,
+    'error_half_life': 60,
+    'error_latency_ms': 10000,
+    'plans': {
+        'free': [
+            {'model': 'gpt-4o-mini'},
+            {'model': 'gemini'},
+            {'model': 'deepseek'},
+        ],
+        'default': [
+            {'model': 'gpt-4o-mini', 'max_prompt_tokens': 2000},
+            {'model': 'gpt-4o'},
+            {'model': 'claude', 'cost': 1.5},
+            {'model': 'gemini'},
+        ],
+    },
+}
+
+# Answers to single message chats of a user reused for their prompts with a cosine similarity of at least
+# ``threshold`` and the same numbers and negations. The index takes ``capacity * dim * 4`` bytes per worker.
+CHAT_SEMANTIC_CACHE = {
+    'enabled': False,
+    'dim': 256,
+    'capacity': 10000,
+    'threshold': 0.95,
+}
+
+# Idempotency-Key handling of chat completions and uploads, keys are kept for ``ttl`` seconds.
+CHAT_IDEMPOTENCY = {
+    'backend': 'chat_completion.idempotency.InMemoryIdempotencyStore',
+    'ttl': 300,
+}
+
+# Text uploads over ``min_bytes`` are split into chunks of about ``chunk_chars`` and indexed with BM25, chats
+# send the ``top_k`` chunks most relevant to the latest user message instead of the whole file.
+CHAT_RETRIEVAL = {
+    'enabled': True,
+    'min_bytes': 32 * 1024,
+    'chunk_chars': 2000,
+    'overlap_chars': 200,
+    'top_k': 6,
+    'k1': 1.5,
+    'b': 0.75,
+    'cache_size': 100,
+}
+
+# Log of the stages of chat requests until their first response byte.
+CHAT_TTFB_TRACE = {
+    'enabled': DEBUG,
+}
+
+# Capture of a ``sample_rate`` of requests to ``paths``, anonymized, as JSON lines for
+# ``benchmarks/replay_traffic.py``. Bodies over ``max_body_bytes`` aren't captured.
+CHAT_TRAFFIC_CAPTURE = {
+    'enabled': False,
+    'sample_rate': 0.01,
+    'paths': ['/chat-completion/', '/chat-completion/compare/'],
+    'path': BASE_DIR.parent / 'traffic.jsonl',
+    'max_body_bytes': 10 * 1024 * 1024,
+    'queue_size': 1000,
+}
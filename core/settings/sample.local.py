@@ -70,3 +70,4 @@ FRONTEND_PAYMENT_FAILURE_URL = ''
 GEMINI_API_KEY = ''
 OPENAI_API_KEY = ''
 ANTHROPIC_API_KEY = ''
+DEEPSEEK_API_KEY = ''
@@ -0,0 +1,6 @@
+"""Settings of the test suite, the local settings with the database the test database is created in."""
+
+from core.settings import *  # noqa
+
+
+CORS_ALLOWED_ORIGINS = []
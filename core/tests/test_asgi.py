@@ -0,0 +1,10 @@
+from fastapi.testclient import TestClient
+
+from chat_completion.model_registry import model_registry
+from core.asgi import app
+
+
+def test_models_are_loaded_on_startup():
+    model_registry.version = None
+    with TestClient(app):
+        assert model_registry.version is not None
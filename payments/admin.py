@@ -3,6 +3,7 @@
 from django.contrib import admin
 
 from payments.models import (
+    AIModel,
     Invoice,
     LineItem,
     Module,
@@ -50,3 +51,11 @@ admin.site.register(UserSubscription)
 admin.site.register(PaymentProcessorResponse)
 admin.site.register(Refund)
 admin.site.register(Module)
+
+
+@admin.register(AIModel)
+class AIModelAdmin(admin.ModelAdmin):
+    """Configuration for AI models on Django admin."""
+
+    list_display = ['name', 'provider', 'upstream_model', 'max_tokens', 'context_window', 'is_active', 'updated_at']
+    list_filter = ['provider', 'is_active']
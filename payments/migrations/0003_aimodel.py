@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-19 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_remove_package_modules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Model name sent by clients.', max_length=50, unique=True)),
+                ('provider', models.CharField(choices=[('openai', 'OpenAI'), ('deepseek', 'DeepSeek'), ('anthropic', 'Anthropic'), ('gemini', 'Google Gemini')], max_length=25)),
+                ('upstream_model', models.CharField(help_text='Model id used with the provider API.', max_length=100)),
+                ('max_tokens', models.PositiveIntegerField(blank=True, help_text='Max output tokens. Leave empty for the provider default.', null=True)),
+                ('context_window', models.PositiveIntegerField(blank=True, help_text='Max input tokens.', null=True)),
+                ('stream_params', models.JSONField(blank=True, default=dict, help_text='Extra parameters sent with completion requests, e.g. temperature.')),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'AI model',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+MODELS = [
+    ('gpt-4', 'openai', 'gpt-4', None),
+    ('gpt-4o', 'openai', 'gpt-4o', None),
+    ('gpt-4o-mini', 'openai', 'gpt-4o-mini', None),
+    ('gpt-o3-mini', 'openai', 'o3-mini', None),
+    ('gpt-o3-mini-high', 'openai', 'o3-mini-high', None),
+    ('deepseek', 'deepseek', 'deepseek-chat', None),
+    ('gemini', 'gemini', 'gemini-2.0-flash', None),
+    ('claude', 'anthropic', 'claude-3-7-sonnet-latest', 1024),
+]
+
+
+def create_models(apps, schema_editor):
+    AIModel = apps.get_model('payments', 'AIModel')
+    for name, provider, upstream_model, max_tokens in MODELS:
+        AIModel.objects.get_or_create(
+            name=name, defaults={'provider': provider, 'upstream_model': upstream_model, 'max_tokens': max_tokens}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_aimodel'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_models, migrations.RunPython.noop),
+    ]
@@ -20,6 +20,44 @@ class Module(models.Model):
         return self.name
 
 
+class AIModel(models.Model):
+    """Chat models offered to users and the provider model serving them."""
+
+    OPENAI = 'openai'
+    DEEPSEEK = 'deepseek'
+    ANTHROPIC = 'anthropic'
+    GEMINI = 'gemini'
+
+    PROVIDERS = [
+        (OPENAI, _('OpenAI')),
+        (DEEPSEEK, _('DeepSeek')),
+        (ANTHROPIC, _('Anthropic')),
+        (GEMINI, _('Google Gemini')),
+    ]
+
+    name = models.CharField(max_length=50, unique=True, help_text=_('Model name sent by clients.'))
+    provider = models.CharField(max_length=25, choices=PROVIDERS)
+    upstream_model = models.CharField(max_length=100, help_text=_('Model id used with the provider API.'))
+    max_tokens = models.PositiveIntegerField(
+        null=True, blank=True, help_text=_('Max output tokens. Leave empty for the provider default.')
+    )
+    context_window = models.PositiveIntegerField(null=True, blank=True, help_text=_('Max input tokens.'))
+    stream_params = models.JSONField(
+        default=dict, blank=True, help_text=_('Extra parameters sent with completion requests, e.g. temperature.')
+    )
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Meta class for AIModel."""
+
+        verbose_name = 'AI model'
+
+    def __str__(self):
+        """String representation for AI model."""
+        return f'{self.name} - {self.get_provider_display()} - {self.upstream_model}'
+
+
 class BaseProduct(models.Model):
     """Base model for product and packages."""
 